@@ -0,0 +1,12 @@
+# ------------------------------------------------------------------------------
+# Shared analysis code for the experiment notebooks.
+#
+#   import sys; sys.path.insert(0, '<repo root>')
+#   from analysis import overheads
+
+from analysis.ranges import collapse_ranges, get_Toverlap, concurrency
+from analysis.profiles import load_events
+from analysis.index import EntityIndex
+from analysis.overheads import (OVERHEADS, load_trials, trial_overheads, trial_table,
+                                overhead_table, overhead_tables)
+from analysis.stats import summarize, outliers, trials_needed
@@ -0,0 +1,341 @@
+import io
+import os
+import sys
+import json
+import zipfile
+import argparse
+import collections
+import numpy as np
+import pandas as pd
+from analysis.profiles import EVENT_FIELDS, load_events
+from analysis.ingest import map_trials
+from analysis.overheads import OVERHEADS, trial_overheads, labelled, tabulate
+
+# ------------------------------------------------------------------------------
+# Compact archive of the raw data of one experiment.
+#
+# Instead of the ~10GB tarball that has to be unpacked as a whole, every
+# experiment's raw_data is packed into one zip file (<exp>/raw_data.entkz) that
+# holds, per trial, the profile records as separately compressed columns:
+#
+#   <trial>/time.npy         : timestamps in microsecs, the first absolute and
+#                              every other one as the delta to the previous
+#                              record (int64)
+#   <trial>/<field>.npy      : name, uid, state, event as codes into the
+#                              distinct values of the trial (smallest uint)
+#   <trial>/values.json      : {field: [distinct values]}
+#   <trial>/files/<relpath>  : staging.csv and the session *.json, verbatim
+#
+# plus an index.json with the labels, trials and profiles that went in. Zip
+# members are compressed and read independently, so loading one trial reads
+# only that trial's members. The msg column of the profiles is not kept,
+# nothing in the analysis uses it.
+#
+#   python -m analysis.archive pack exp-5-B-1/raw_data
+#   python -m analysis.archive list exp-5-B-1/raw_data.entkz
+
+ARCHIVE_VERSION = 1
+SUFFIX = '.entkz'
+
+# Files of a trial directory kept as they are
+EXTRAS = ('.csv', '.json')
+
+# Timestamp resolution: profiles are written with 4 decimals
+TICKS = 10**6
+
+
+def _npy(arr):
+
+    buf = io.BytesIO()
+    np.save(buf, arr)
+
+    return buf.getvalue()
+
+
+def _codes_dtype(n):
+
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n <= np.iinfo(dtype).max + 1:
+            return dtype
+
+    return np.int64
+
+
+def encode_times(times):
+
+    ticks = np.round(np.asarray(times, dtype=float)*TICKS).astype(np.int64)
+
+    if not len(ticks):
+        return ticks
+
+    return np.concatenate([ticks[:1], np.diff(ticks)])
+
+
+def decode_times(deltas):
+
+    return np.cumsum(deltas)/float(TICKS)
+
+
+def encode_events(events):
+
+    # {member name: bytes} of one trial's events
+    members = {'time.npy': _npy(encode_times(events['time'].values))}
+    values = dict()
+
+    for col in EVENT_FIELDS[1:]:
+        codes, uniques = pd.factorize(events[col])
+        values[col] = [str(v) for v in uniques]
+        members['%s.npy'%col] = _npy(codes.astype(_codes_dtype(len(uniques))))
+
+    members['values.json'] = json.dumps(values).encode('utf-8')
+
+    return members
+
+
+def pack(raw_data, path=None, progress=True):
+
+    # Archive every <label>-trial-N directory below 'raw_data' to 'path'
+    # (default: raw_data + '.entkz'), returns the path
+    from analysis.report import find_trials
+
+    path = path or os.path.normpath(raw_data) + SUFFIX
+    groups = find_trials(raw_data)
+
+    index = {'version': ARCHIVE_VERSION, 'labels': collections.OrderedDict(), 'trials': dict()}
+    total = sum([len(dirs) for dirs in groups.values()])
+
+    tmp = '%s.%s.tmp'%(path, os.getpid())
+    zf = zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    try:
+        done = 0
+        for label, dirs in groups.items():
+
+            index['labels'][label] = list()
+
+            for src in dirs:
+
+                key = os.path.relpath(src, raw_data).replace(os.sep, '/')
+                events = load_events(src)
+
+                for name, data in encode_events(events).items():
+                    zf.writestr('%s/%s'%(key, name), data)
+
+                extras = list()
+                for root, _, files in os.walk(src):
+                    for f in sorted(files):
+                        if f.endswith(EXTRAS):
+                            rel = os.path.relpath(os.path.join(root, f), src).replace(os.sep, '/')
+                            zf.write(os.path.join(root, f), '%s/files/%s'%(key, rel))
+                            extras.append(rel)
+
+                index['labels'][label].append(key)
+                index['trials'][key] = {'label': label, 'records': len(events), 'files': extras}
+
+                done += 1
+                if progress:
+                    sys.stderr.write('[%s/%s] %s %s events\n'%(done, total, key, len(events)))
+
+        zf.writestr('index.json', json.dumps(index).encode('utf-8'))
+
+    finally:
+        zf.close()
+
+    os.rename(tmp, path)
+
+    return path
+
+
+class TrialArchive(object):
+
+    # Random access to the trials of an archive
+
+    def __init__(self, path):
+
+        self.path = path
+        self.zf = zipfile.ZipFile(path, 'r')
+        self.index = json.loads(self.zf.read('index.json').decode('utf-8'),
+                                object_pairs_hook=collections.OrderedDict)
+
+        if self.index.get('version') != ARCHIVE_VERSION:
+            raise ValueError('%s: archive version %s, expected %s'
+                             %(path, self.index.get('version'), ARCHIVE_VERSION))
+
+    def close(self):
+
+        self.zf.close()
+
+    def groups(self):
+
+        # {label: [trial keys]}, like report.find_trials()
+        return collections.OrderedDict((label, list(keys))
+                                       for label, keys in self.index['labels'].items())
+
+    def trials(self):
+
+        return [key for keys in self.index['labels'].values() for key in keys]
+
+    def _load(self, key, name):
+
+        return np.load(io.BytesIO(self.zf.read('%s/%s'%(key, name))))
+
+    def events(self, key):
+
+        # load_events() of one trial
+        if key not in self.index['trials']:
+            raise KeyError('%s: no trial %s'%(self.path, key))
+
+        values = json.loads(self.zf.read('%s/values.json'%key).decode('utf-8'))
+        cols = {'time': decode_times(self._load(key, 'time.npy'))}
+
+        for col in EVENT_FIELDS[1:]:
+            uniques = np.array(values[col], dtype=object)
+            cols[col] = uniques[self._load(key, '%s.npy'%col).astype(np.intp)] \
+                        if len(uniques) else np.array([], dtype=object)
+
+        return pd.DataFrame(cols, columns=EVENT_FIELDS)
+
+    def read(self, key, relpath):
+
+        # Contents of a file kept verbatim, None if the trial has none
+        if relpath not in self.index['trials'][key]['files']:
+            return None
+
+        return self.zf.read('%s/files/%s'%(key, relpath))
+
+    def staging(self, key):
+
+        # staging.csv ranges of one trial, like overheads.staging_ranges()
+        data = self.read(key, 'staging.csv')
+
+        if data is None:
+            return pd.DataFrame(columns=['trial', 'start', 'stop'])
+
+        frame = pd.read_csv(io.BytesIO(data), header=None, usecols=[2, 3], names=['start', 'stop'])
+        frame['trial'] = key
+
+        return frame
+
+
+def load_archive(path, trials=None):
+
+    # Events of the given trials of an archive (default: all) in one table with
+    # a 'trial' column, like overheads.load_trials()
+    archive = TrialArchive(path)
+
+    try:
+        frames = list()
+        for key in (trials or archive.trials()):
+            events = archive.events(key)
+            events['trial'] = key
+            frames.append(events)
+    finally:
+        archive.close()
+
+    if not frames:
+        return pd.DataFrame(columns=EVENT_FIELDS + ['trial'])
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def _archived_overheads(key, path, num_tasks):
+
+    archive = TrialArchive(path)
+
+    try:
+        events = archive.events(key)
+        if not len(events):
+            raise ValueError('no profile records for %s'%key)
+        events['trial'] = key
+        staging = archive.staging(key)
+    finally:
+        archive.close()
+
+    return trial_overheads(events, staging, num_tasks).loc[key]
+
+
+def _archived_members(path, num_tasks, workers, progress):
+
+    # (per trial OVERHEADS, {label: [trial keys]}). Every worker opens the
+    # archive and reads only its own trial.
+    archive = TrialArchive(path)
+    groups = archive.groups()
+    archive.close()
+
+    trials = dict((key, key) for keys in groups.values() for key in keys)
+    results, failures = map_trials(_archived_overheads, trials, (path, num_tasks), workers, progress)
+
+    return pd.DataFrame(results).T.reindex(columns=OVERHEADS), groups
+
+
+def archive_overhead_table(path, num_tasks=None, workers=None, progress=True):
+
+    # overhead_table() of an archived experiment, (mean, standard error) per
+    # label
+    per_trial, groups = _archived_members(path, num_tasks, workers, progress)
+    members = dict(((None, label), keys) for label, keys in groups.items())
+
+    return tabulate(per_trial, {None: groups}, members)[None]
+
+
+def archive_trial_table(path, num_tasks=None, workers=None, progress=True):
+
+    # trial_table() of an archived experiment
+    per_trial, groups = _archived_members(path, num_tasks, workers, progress)
+    members = dict(((None, label), keys) for label, keys in groups.items())
+
+    return labelled(per_trial, {None: groups}, members)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python -m analysis.archive')
+    sub = parser.add_subparsers(dest='command')
+
+    cmd = sub.add_parser('pack', help='archive the trials below a raw_data directory')
+    cmd.add_argument('raw_data')
+    cmd.add_argument('-o', '--output', default=None, help='archive path (default: <raw_data>%s)'%SUFFIX)
+
+    cmd = sub.add_parser('list', help='labels and trials of an archive')
+    cmd.add_argument('archive')
+
+    cmd = sub.add_parser('extract', help='write the verbatim files of the trials of an archive')
+    cmd.add_argument('archive')
+    cmd.add_argument('dest')
+    cmd.add_argument('trials', nargs='*', help='trial keys (default: all)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        path = pack(args.raw_data, args.output)
+        print('%s: %.1f MB'%(path, os.path.getsize(path)/1e6))
+
+    elif args.command == 'list':
+        archive = TrialArchive(args.archive)
+        for label, keys in archive.groups().items():
+            for key in keys:
+                print('%-12s %-40s %10s'%(label, key, archive.index['trials'][key]['records']))
+        archive.close()
+
+    elif args.command == 'extract':
+        archive = TrialArchive(args.archive)
+        for key in (args.trials or archive.trials()):
+            for rel in archive.index['trials'][key]['files']:
+                out = os.path.join(args.dest, key, rel)
+                if not os.path.isdir(os.path.dirname(out)):
+                    os.makedirs(os.path.dirname(out))
+                f = open(out, 'wb')
+                f.write(archive.read(key, rel))
+                f.close()
+        archive.close()
+
+    else:
+        parser.print_help()
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
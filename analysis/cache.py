@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from analysis.profiles import EVENT_FIELDS, prof_files, load_events
+
+# ------------------------------------------------------------------------------
+# On-disk cache of the parsed events of a trial directory.
+#
+# The events are stored column by column in one .npz per directory: 'time' as
+# float64, the string columns as integer codes plus their distinct values. The
+# file also holds the path, mtime and size of every profile it was built from
+# and is rebuilt as soon as any of them changes, appears or disappears.
+#
+# The cache lives in $ENTK_ANALYSIS_CACHE (default ~/.cache/entk-analysis)
+# rather than next to the raw data, which may be read-only.
+
+CACHE_DIR = os.environ.get('ENTK_ANALYSIS_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'entk-analysis'))
+
+# Bump when the layout of the cached frames changes
+CACHE_VERSION = 1
+
+
+def manifest(src):
+
+    # What the cached events of 'src' depend on
+    entries = list()
+
+    for path in prof_files(src):
+        st = os.stat(path)
+        entries.append([os.path.relpath(path, src), st.st_mtime, st.st_size])
+
+    return {'version': CACHE_VERSION, 'files': entries}
+
+
+def cache_path(src, cache_dir=None):
+
+    key = hashlib.sha1(os.path.abspath(src).encode('utf-8')).hexdigest()
+
+    return os.path.join(cache_dir or CACHE_DIR, '%s.npz'%key)
+
+
+def save_events(path, events, deps):
+
+    cols = {'time': events['time'].values.astype(float),
+            'manifest': np.array(json.dumps(deps))}
+
+    for col in EVENT_FIELDS[1:]:
+        codes, values = pd.factorize(events[col])
+        cols['%s_codes'%col] = codes.astype(np.int32)
+        cols['%s_values'%col] = np.array([str(v) for v in values])
+
+    cache_dir = os.path.dirname(path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    # Write aside and rename, so a reader never sees half a file
+    tmp = '%s.%s.tmp.npz'%(path[:-len('.npz')], os.getpid())
+    np.savez(tmp, **cols)
+    os.rename(tmp, path)
+
+
+def read_events(path):
+
+    # (events, manifest) of a cache file
+    data = np.load(path)
+
+    try:
+        cols = {'time': data['time']}
+
+        for col in EVENT_FIELDS[1:]:
+            values = data['%s_values'%col].astype(str)
+            cols[col] = pd.Categorical.from_codes(data['%s_codes'%col], values).astype(str)
+
+        deps = json.loads(str(data['manifest']))
+
+    finally:
+        data.close()
+
+    return pd.DataFrame(cols, columns=EVENT_FIELDS), deps
+
+
+def cached_events(src, cache_dir=None):
+
+    # load_events(src), from the cache while the profiles are unchanged
+    path = cache_path(src, cache_dir)
+    deps = manifest(src)
+
+    if os.path.exists(path):
+        try:
+            events, cached = read_events(path)
+            if cached == deps:
+                return events
+        except Exception:
+            # Unreadable cache file, rebuild it
+            pass
+
+    events = load_events(src)
+    save_events(path, events, deps)
+
+    return events
+
+
+def clear(cache_dir=None):
+
+    cache_dir = cache_dir or CACHE_DIR
+
+    if not os.path.isdir(cache_dir):
+        return
+
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npz'):
+            os.remove(os.path.join(cache_dir, name))
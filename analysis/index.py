@@ -0,0 +1,163 @@
+import re
+import numpy as np
+import pandas as pd
+from analysis.profiles import load_events
+from analysis.cache import cached_events
+from analysis.ranges import get_Toverlap
+
+# ------------------------------------------------------------------------------
+# Per trial index of entity state and event times.
+#
+# Built once from the events of a trial: the first time every uid reached
+# every state (and saw every event), as uid x state matrices. Lookups of a
+# single time are dictionary lookups, durations and overlaps over a selection
+# of entities are column slices. Entities are selected by uid prefix, entity
+# type or the number at the end of their uid, never by synthesizing uid
+# strings, so 'radical.entk.task.%04d' past task 9999 or any other uid format
+# works the same.
+
+_NUMBER = re.compile(r'(\d+)$')
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+def uid_number(uid):
+
+    # 'radical.entk.task.0042' -> 42, None if the uid does not end in a number
+    match = _NUMBER.search(uid)
+
+    return int(match.group(1)) if match else None
+
+
+def uid_numbers(uids):
+
+    # uid_number of every uid as floats, NaN where there is none; every
+    # distinct uid is parsed once
+    uids = pd.Series(uids)
+    numbers = dict((uid, uid_number(uid)) for uid in uids.unique())
+
+    return uids.map(numbers).astype(float).values
+
+
+def uid_etype(uid):
+
+    # 'radical.entk.task.0042' -> 'task', 'unit.000042' -> 'unit'
+    parts = uid.split('.')
+
+    return parts[-2] if len(parts) > 1 else parts[0]
+
+
+class EntityIndex(object):
+
+    def __init__(self, events):
+
+        events = events[events['uid'] != '']
+
+        states = events[events['state'] != '']
+        self.states = states.groupby(['uid', 'state'])['time'].min().unstack('state')
+
+        evs = events[events['event'] != '']
+        self.events = evs.groupby(['uid', 'event'])['time'].min().unstack('event')
+
+        uids = self.states.index.union(self.events.index)
+        self.info = pd.DataFrame({'etype': [uid_etype(uid) for uid in uids],
+                                  'number': uid_numbers(uids)},
+                                 index=uids)
+
+        self._states = self.states.stack().to_dict()
+        self._events = self.events.stack().to_dict()
+
+    @classmethod
+    def from_dir(cls, src, cache=True):
+
+        return cls(cached_events(src) if cache else load_events(src))
+
+    def timestamp(self, uid, state=None, event=None):
+
+        # First time 'uid' reached 'state' (or saw 'event'), None if never
+        if state is not None:
+            return self._states.get((uid, state))
+
+        return self._events.get((uid, event))
+
+    def select(self, prefix=None, etype=None, first=None, uids=None):
+
+        # uids matching all given criteria; 'first' keeps the entities whose
+        # uid number is below it, like get_task_uids(first) did
+        sel = self.info
+
+        if prefix is not None:
+            sel = sel[sel.index.str.startswith(prefix)]
+
+        if etype is not None:
+            sel = sel[sel['etype'] == etype]
+
+        if first is not None:
+            sel = sel[sel['number'] < first]
+
+        if uids is not None:
+            sel = sel[sel.index.isin(list(uids))]
+
+        return sel.index
+
+    def _times(self, table, uids, start, stop):
+
+        cols = table.reindex(index=uids, columns=[start, stop])
+        cols.columns = ['start', 'stop']
+
+        return cols.dropna()
+
+    def ranges(self, uids, start=None, stop=None, events=None):
+
+        # [start, stop] per uid that reached both, as a frame indexed by uid
+        if events is not None:
+            return self._times(self.events, uids, events[0], events[1])
+
+        return self._times(self.states, uids, start, stop)
+
+    def duration(self, uids, states=None, events=None, mode='span'):
+
+        # span  : first start to last stop over all uids (entk Profiler)
+        # union : time covered by at least one uid (ra Session)
+        # sum   : sum of the per uid durations
+        if isinstance(uids, string_types):
+            uids = [uids]
+
+        if states is not None:
+            ranges = self.ranges(uids, states[0], states[1])
+        else:
+            ranges = self.ranges(uids, events=events)
+
+        if not len(ranges):
+            return np.nan
+
+        if mode == 'span':
+            return ranges['stop'].max() - ranges['start'].min()
+
+        if mode == 'union':
+            return get_Toverlap(ranges.values)
+
+        if mode == 'sum':
+            return (ranges['stop'] - ranges['start']).sum()
+
+        raise ValueError('unknown mode %s, choose from span, union, sum'%mode)
+
+    def reached(self, state, uids=None):
+
+        # Times at which the (selected) entities reached 'state', sorted
+        if state not in self.states.columns:
+            return pd.Series(dtype=float)
+
+        col = self.states[state]
+        if uids is not None:
+            col = col.reindex(uids)
+
+        return col.dropna().sort_values()
+
+    def count_at(self, state, time, uids=None):
+
+        # Number of (selected) entities that reached 'state' by 'time'
+        return int(np.searchsorted(self.reached(state, uids).values, time, side='right'))
@@ -0,0 +1,99 @@
+import sys
+import time
+import traceback
+import multiprocessing as mp
+import pandas as pd
+from analysis.profiles import EVENT_FIELDS, load_events
+from analysis.cache import cached_events
+
+# ------------------------------------------------------------------------------
+# Loading many trial directories at once.
+#
+# Every trial is an independent parse, so the directories are spread over a
+# process pool, one task per directory. A trial that fails to load (corrupt
+# session, no profiles) is reported and left out instead of failing the whole
+# ingestion.
+
+
+def _run(job):
+
+    func, trial, src, args = job
+    start = time.time()
+
+    try:
+        return trial, func(src, *args), None, time.time() - start
+
+    except Exception:
+        return trial, None, traceback.format_exc(), time.time() - start
+
+
+def map_trials(func, trials, args=(), workers=None, progress=True, describe=None):
+
+    # {trial: directory} -> ({trial: func(directory, *args)}, {trial: traceback}
+    # of the ones that raised). 'func' has to be a module level function so
+    # that it can be sent to the workers. workers=1 runs in this process, None
+    # uses one worker per cpu.
+    jobs = [(func, trial, src, tuple(args)) for trial, src in sorted(trials.items())]
+    workers = min(workers or mp.cpu_count(), len(jobs)) or 1
+
+    results = dict()
+    failures = dict()
+
+    if workers == 1:
+        done_jobs = map(_run, jobs)
+        pool = None
+    else:
+        pool = mp.Pool(workers)
+        done_jobs = pool.imap_unordered(_run, jobs)
+
+    try:
+        for done, (trial, result, error, secs) in enumerate(done_jobs, 1):
+
+            if error:
+                failures[trial] = error
+            else:
+                results[trial] = result
+
+            if progress:
+                what = 'FAILED' if error else (describe(result) if describe else 'ok')
+                sys.stderr.write('[%s/%s] %s %s (%.2fs)\n'%(done, len(jobs), trial, what, secs))
+
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    for trial in sorted(failures):
+        sys.stderr.write('Failed to load %s:\n%s\n'%(trial, failures[trial]))
+
+    return results, failures
+
+
+def _events(src, cache):
+
+    events = cached_events(src) if cache else load_events(src)
+
+    if not len(events):
+        raise ValueError('no profile records under %s'%src)
+
+    return events
+
+
+def ingest(trials, cache=True, workers=None, progress=True):
+
+    # {trial: directory} -> (events of all trials with a 'trial' column,
+    # {trial: traceback} of the ones that failed)
+    results, failures = map_trials(_events, trials, (cache,), workers, progress,
+                                   lambda events: '%s events'%len(events))
+
+    frames = list()
+
+    for trial in sorted(results):
+        events = results[trial]
+        events['trial'] = trial
+        frames.append(events)
+
+    if not frames:
+        return pd.DataFrame(columns=EVENT_FIELDS + ['trial']), failures
+
+    return pd.concat(frames, ignore_index=True), failures
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import collections
+from analysis.profiles import prof_files
+from analysis.stream import RunningOverheads
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+# ------------------------------------------------------------------------------
+# Live view of a running EnTK/RP session.
+#
+# Tails every *.prof file below a directory (the working directory of poe.py,
+# where EnTK and the RP client write their profiles) while the run is going.
+# Only complete lines are consumed, so a record being written is picked up on
+# the next poll. Every record updates
+#
+#   - the live RunningOverheads of stream.py (overhead breakdown so far, with
+#     the range unions kept up to date, so a status costs the same however
+#     long the run)
+#   - the latest state of every entity (how many tasks/units sit in each
+#     state right now, i.e. the depth of every stage of the pipeline)
+#   - the number of state transitions per state (throughput)
+#
+# and the result is printed as a table every --interval secs and served as
+# JSON on http://<host>:<port>/ .
+#
+#   python -m analysis.monitor . --port 8765
+
+TRACKED = ('radical.entk.task.', 'unit.')
+
+
+class ProfTail(object):
+
+    # New complete lines of the profiles below 'root' since the last poll
+
+    def __init__(self, root):
+
+        self.root = root
+        self.offsets = dict()
+        self.partial = dict()
+
+    def poll(self):
+
+        for path in prof_files(self.root):
+
+            offset = self.offsets.get(path, 0)
+
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+
+            if size < offset:
+                # Truncated or replaced, read again from the start
+                offset = 0
+                self.partial[path] = ''
+
+            if size == offset:
+                continue
+
+            f = open(path, 'r')
+            f.seek(offset)
+            data = self.partial.get(path, '') + f.read()
+            self.offsets[path] = f.tell()
+            f.close()
+
+            lines = data.split('\n')
+            self.partial[path] = lines.pop()
+
+            for line in lines:
+                yield line
+
+
+class LiveMonitor(object):
+
+    def __init__(self, root, num_tasks=None):
+
+        self.tail = ProfTail(root)
+        self.overheads = RunningOverheads(num_tasks, live=True)
+
+        self.latest = dict()
+        self.transitions = collections.Counter()
+        self.records = 0
+        self.first_time = None
+        self.last_time = None
+
+        # (wall clock, transitions per state) at the previous poll
+        self._prev = (time.time(), collections.Counter())
+        self.rates = dict()
+
+        self.lock = threading.Lock()
+
+    def add(self, line):
+
+        if line[:1] == '#':
+            return
+
+        fields = line.split(',', 5)
+        if len(fields) < 5:
+            return
+
+        try:
+            ts = float(fields[0])
+        except ValueError:
+            return
+
+        uid, state, event = fields[2].strip(), fields[3].strip(), fields[4].strip()
+
+        self.records += 1
+        self.first_time = ts if self.first_time is None else min(self.first_time, ts)
+        self.last_time = ts if self.last_time is None else max(self.last_time, ts)
+
+        self.overheads.add(ts, uid, state, event)
+
+        if state and uid.startswith(TRACKED):
+            self.transitions[(uid.rsplit('.', 1)[0], state)] += 1
+            prev = self.latest.get(uid)
+            if prev is None or prev[0] <= ts:
+                self.latest[uid] = (ts, state)
+
+    def poll(self):
+
+        with self.lock:
+
+            for line in self.tail.poll():
+                self.add(line)
+
+            now = time.time()
+            then, counts = self._prev
+            if now > then:
+                self.rates = dict((key, (self.transitions[key] - counts[key])/(now - then))
+                                  for key in self.transitions)
+            self._prev = (now, collections.Counter(self.transitions))
+
+    def status(self):
+
+        with self.lock:
+
+            depths = collections.Counter()
+            for uid, (ts, state) in self.latest.items():
+                depths[(uid.rsplit('.', 1)[0], state)] += 1
+
+            def nested(counter):
+                out = collections.defaultdict(dict)
+                for (kind, state), val in counter.items():
+                    out[kind][state] = val
+                return out
+
+            overheads = self.overheads.result()
+
+            return {'time': time.time(),
+                    'records': self.records,
+                    'profile_span': (self.last_time - self.first_time) if self.records else 0.0,
+                    'depths': nested(depths),
+                    'transitions': nested(self.transitions),
+                    'rates': nested(self.rates),
+                    'overheads': collections.OrderedDict((key, None if val != val else val)
+                                                         for key, val in overheads.items())}
+
+
+def render(status):
+
+    lines = ['records %s, profile span %.1fs'%(status['records'], status['profile_span']), '']
+    lines.append('%-22s %-32s %8s %10s %10s'%('entity', 'state', 'now', 'reached', 'per sec'))
+
+    for kind in sorted(status['transitions']):
+        for state in sorted(status['transitions'][kind]):
+            lines.append('%-22s %-32s %8s %10s %10.2f'%(kind, state,
+                                                      status['depths'].get(kind, {}).get(state, 0),
+                                                      status['transitions'][kind][state],
+                                                      status['rates'].get(kind, {}).get(state, 0.0)))
+
+    lines.append('')
+    for key, val in status['overheads'].items():
+        lines.append('%-28s %s'%(key, '-' if val is None else '%.3f'%val))
+
+    return '\n'.join(lines)
+
+
+def serve(monitor, host, port):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = json.dumps(monitor.status(), sort_keys=True).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+
+    thread = threading.Thread(target=server.serve_forever, name='monitor-http')
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python -m analysis.monitor')
+    parser.add_argument('root', nargs='?', default='.', help='directory the profiles are written to')
+    parser.add_argument('--interval', type=float, default=5.0, help='secs between polls')
+    parser.add_argument('--tasks', type=int, default=None,
+                        help='count only tasks numbered below N for the EnTK span')
+    parser.add_argument('--host', default='localhost', help='JSON endpoint address')
+    parser.add_argument('--port', type=int, default=8765, help='JSON endpoint port, 0 to disable')
+    parser.add_argument('--quiet', action='store_true', help='no terminal view')
+    args = parser.parse_args(argv)
+
+    monitor = LiveMonitor(args.root, args.tasks)
+
+    if args.port:
+        serve(monitor, args.host, args.port)
+        sys.stderr.write('Serving status on http://%s:%s/\n'%(args.host, args.port))
+
+    try:
+        while True:
+            monitor.poll()
+            if not args.quiet:
+                # Clear the terminal and redraw
+                sys.stdout.write('\033[2J\033[H%s\n'%render(monitor.status()))
+                sys.stdout.flush()
+            time.sleep(args.interval)
+
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
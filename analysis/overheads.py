@@ -0,0 +1,226 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+from analysis.ranges import range_union
+from analysis.ingest import ingest
+from analysis.index import uid_numbers
+
+# ------------------------------------------------------------------------------
+# EnTK/RP overhead decomposition over many trials at once.
+#
+# The notebooks build one ra.Session and one entk Profiler per trial directory
+# and call duration() per overhead, in nested loops. Here every *.prof file of
+# every trial is read into one table with a 'trial' column, the state and
+# event timestamps are pivoted out of it with group-bys, and every overhead of
+# every trial is a column operation on the pivots:
+#
+#   EnTK setup overhead      : amgr 'create amgr obj' -> 'init rreq submission'
+#                              + rmgr 'create rmgr obj' -> 'rmgr obj created'
+#   EnTK tear-down overhead  : amgr 'start termination' -> 'termination done'
+#                              - RTS tear-down overhead
+#   RTS tear-down overhead   : rmgr 'canceling resource allocation'
+#                              -> 'resource allocation cancelled'
+#   EnTK management overhead : EnTK task span (SCHEDULING -> DONE) - RTS span
+#   RTS overhead             : RTS span - execution time
+#   Execution time           : union of the units' AGENT_EXECUTING
+#                              -> AGENT_STAGING_OUTPUT_PENDING ranges
+#   Data staging time        : union of the ranges in staging.csv, if any
+#
+# The EnTK task span is first start to last stop over all tasks (entk
+# Profiler.duration), the RTS spans are the union of the per-unit ranges
+# (ra.Session.duration).
+
+OVERHEADS = ['EnTK setup overhead', 'EnTK tear-down overhead', 'RTS tear-down overhead',
+             'EnTK management overhead', 'RTS overhead', 'Execution time', 'Data staging time']
+
+TASK_PREFIX = 'radical.entk.task.'
+UNIT_PREFIX = 'unit.'
+AMGR = 'radical.entk.appmanager.0000'
+RMGR = 'radical.entk.resource_manager.0000'
+
+
+def load_trials(trials, cache=True, workers=None, progress=True):
+
+    # {trial: directory} or a list of directories (which are then their own
+    # keys), into one table with a 'trial' column. With 'cache' the parsed
+    # events of every directory are reused until its profiles change. Trials
+    # that fail to load are reported and left out.
+    if not isinstance(trials, dict):
+        trials = dict((src, src) for src in trials)
+
+    events, failures = ingest(trials, cache, workers, progress)
+
+    return events
+
+
+def state_ranges(events, prefix, start, stop, first=None):
+
+    # First time every entity reached 'start' and 'stop': one row per
+    # (trial, uid) with 'start' and 'stop' columns
+    sel = events[events['uid'].str.startswith(prefix) & events['state'].isin([start, stop])]
+
+    if first is not None:
+        # Entities numbered below 'first', whatever the width of the number
+        sel = sel[uid_numbers(sel['uid'].values) < first]
+
+    times = sel.groupby(['trial', 'uid', 'state'])['time'].min().unstack('state')
+    times = times.reindex(columns=[start, stop])
+    times.columns = ['start', 'stop']
+
+    return times.reset_index()
+
+
+def event_duration(events, uid, start, stop):
+
+    # Time from the first 'start' to the first 'stop' event of one entity,
+    # per trial
+    sel = events[(events['uid'] == uid) & events['event'].isin([start, stop])]
+
+    times = sel.groupby(['trial', 'event'])['time'].min().unstack('event')
+    times = times.reindex(columns=[start, stop])
+
+    return times[stop] - times[start]
+
+
+def staging_ranges(trials):
+
+    # Ranges from columns 2 and 3 of staging.csv in the trial directory
+    frames = list()
+
+    for trial, src in trials.items():
+
+        path = os.path.join(src, 'staging.csv')
+        if not os.path.exists(path):
+            continue
+
+        frame = pd.read_csv(path, header=None, usecols=[2, 3], names=['start', 'stop'])
+        frame['trial'] = trial
+        frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=['trial', 'start', 'stop'])
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def trial_overheads(events, staging=None, num_tasks=None):
+
+    # One row of OVERHEADS per trial of 'events'. With 'num_tasks' only the
+    # tasks numbered 0 .. num_tasks-1 count for the EnTK span, like
+    # get_task_uids() in the notebooks.
+    trials = pd.Index(events['trial'].unique(), name='trial')
+
+    tasks = state_ranges(events, TASK_PREFIX, 'SCHEDULING', 'DONE', num_tasks)
+    entk_span = tasks.groupby('trial')['stop'].max() - tasks.groupby('trial')['start'].min()
+
+    units = state_ranges(events, UNIT_PREFIX, 'UMGR_SCHEDULING_PENDING', 'DONE')
+    rp_span = range_union(units)
+
+    execs = state_ranges(events, UNIT_PREFIX, 'AGENT_EXECUTING', 'AGENT_STAGING_OUTPUT_PENDING')
+    exec_time = range_union(execs)
+
+    core_1 = event_duration(events, AMGR, 'create amgr obj', 'init rreq submission')
+    core_2 = event_duration(events, AMGR, 'start termination', 'termination done')
+    core_3 = event_duration(events, RMGR, 'create rmgr obj', 'rmgr obj created')
+    core_5 = event_duration(events, RMGR, 'canceling resource allocation', 'resource allocation cancelled')
+
+    staging_time = pd.Series(dtype=float)
+    if staging is not None:
+        staging_time = range_union(staging)
+
+    cols = [core_1.reindex(trials) + core_3.reindex(trials),
+            core_2.reindex(trials) - core_5.reindex(trials),
+            core_5.reindex(trials),
+            entk_span.reindex(trials) - rp_span.reindex(trials),
+            rp_span.reindex(trials) - exec_time.reindex(trials),
+            exec_time.reindex(trials),
+            staging_time.reindex(trials).fillna(0.0)]
+
+    return pd.concat(cols, axis=1, keys=OVERHEADS)
+
+
+def overhead_tables(experiments, num_tasks=None, cache=True, workers=None, progress=True):
+
+    # experiments: {name: {label: glob pattern or list of trial directories}}.
+    # The trials of all experiments are loaded by one process pool. Returns
+    # {name: (mean, standard error)}, the frames the notebooks plot with one
+    # row per label (df_a1/df_err_a1, ...).
+    members = experiment_members(experiments)
+    per_trial = member_overheads(members, num_tasks, cache, workers, progress)
+
+    return tabulate(per_trial, experiments, members)
+
+
+def trial_table(experiments, num_tasks=None, cache=True, workers=None, progress=True):
+
+    # The per trial rows overhead_tables() reduces: one row of OVERHEADS per
+    # trial directory, with 'experiment' and 'label' columns
+    members = experiment_members(experiments)
+    per_trial = member_overheads(members, num_tasks, cache, workers, progress)
+
+    return labelled(per_trial, experiments, members)
+
+
+def member_overheads(members, num_tasks=None, cache=True, workers=None, progress=True):
+
+    trials = dict((src, src) for dirs in members.values() for src in dirs)
+    events = load_trials(trials, cache, workers, progress)
+
+    return trial_overheads(events, staging_ranges(trials), num_tasks)
+
+
+def experiment_members(experiments):
+
+    # {(name, label): [trial directories]}
+    members = dict()
+
+    for name, groups in experiments.items():
+        for label, dirs in groups.items():
+            if isinstance(dirs, str):
+                dirs = sorted(glob.glob(dirs))
+            members[(name, label)] = list(dirs)
+
+    return members
+
+
+def labelled(per_trial, experiments, members):
+
+    # Rows of 'per_trial' in experiment and label order, with 'experiment'
+    # and 'label' columns. A trial that failed to load has no row.
+    frames = list()
+
+    for name, groups in experiments.items():
+        for label in groups:
+            frame = per_trial.reindex([src for src in members[(name, label)] if src in per_trial.index])
+            frame['experiment'] = name
+            frame['label'] = label
+            frames.append(frame)
+
+    return pd.concat(frames)
+
+
+def tabulate(per_trial, experiments, members):
+
+    # Per trial overheads -> {name: (mean, standard error)}
+    tables = dict()
+
+    for name, groups in experiments.items():
+
+        grouped = labelled(per_trial, {name: groups}, members).groupby('label')[OVERHEADS]
+        order = [label for label in groups if label in grouped.groups]
+
+        mean = grouped.mean().reindex(order)
+
+        # np.std (ddof=0) / sqrt(trials), as in the notebooks
+        err = grouped.std(ddof=0).div(np.sqrt(grouped.size()), axis=0).reindex(order)
+
+        tables[name] = (mean, err)
+
+    return tables
+
+
+def overhead_table(groups, num_tasks=None, cache=True, workers=None, progress=True):
+
+    # overhead_tables() of a single experiment
+    return overhead_tables({None: groups}, num_tasks, cache, workers, progress)[None]
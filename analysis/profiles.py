@@ -0,0 +1,63 @@
+import os
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Reading radical.utils profiles (*.prof) into pandas.
+#
+# Every line of a profile is 'time,name,uid,state,event,msg'. The msg column is
+# not used by the analysis and is dropped.
+
+PROF_FIELDS = ['time', 'name', 'uid', 'state', 'event', 'msg']
+EVENT_FIELDS = PROF_FIELDS[:5]
+
+
+def prof_files(src):
+
+    # EnTK writes its profiles next to the RP session directory, so walk the
+    # whole trial directory
+    paths = list()
+
+    for root, dirs, files in os.walk(src):
+        paths.extend([os.path.join(root, f) for f in files if f.endswith('.prof')])
+
+    return sorted(paths)
+
+
+def read_prof(path):
+
+    try:
+        frame = pd.read_csv(path, comment='#', header=None, names=PROF_FIELDS,
+                            usecols=range(5), skip_blank_lines=True)
+
+    except ValueError:
+        # A msg with commas in it, split those lines by hand. pandas raises a
+        # ParserError, or a ValueError about usecols when it is the first line.
+        rows = list()
+        f = open(path, 'r')
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.rstrip('\n').split(',', 5)
+            rows.append((fields + ['']*6)[:5])
+        f.close()
+        frame = pd.DataFrame(rows, columns=EVENT_FIELDS)
+
+    frame['time'] = pd.to_numeric(frame['time'], errors='coerce')
+
+    return frame.dropna(subset=['time'])
+
+
+def load_events(src):
+
+    # All profile records of one trial directory
+    frames = [read_prof(path) for path in prof_files(src)]
+
+    if not frames:
+        return pd.DataFrame(dict((col, []) for col in EVENT_FIELDS), columns=EVENT_FIELDS)
+
+    events = pd.concat(frames, ignore_index=True)
+
+    for col in EVENT_FIELDS[1:]:
+        events[col] = events[col].fillna('').astype(str).str.strip()
+
+    return events
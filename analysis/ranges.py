@@ -0,0 +1,153 @@
+import bisect
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Unions of time ranges.
+#
+# The notebooks' collapse_ranges sorts the ranges and merges them in a Python
+# loop, once per metric per trial. Here the ranges are sorted once and merged
+# with a cumulative max sweep over the stop times: a range starts a new block
+# when it starts after every range before it has ended. collapse_ranges and
+# get_Toverlap are drop-ins for the notebook helpers of the same name.
+# RangeUnion keeps the union of ranges that arrive one at a time, for the
+# live monitor.
+
+
+def _sorted(ranges):
+
+    ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+    order = np.argsort(ranges[:, 0], kind='mergesort')
+
+    return ranges[order, 0], ranges[order, 1]
+
+
+def blocks(starts, stops):
+
+    # Disjoint (starts, stops) arrays covering the same time as the sorted
+    # input ranges
+    if not len(starts):
+        return np.zeros(0), np.zeros(0)
+
+    reach = np.maximum.accumulate(stops)
+
+    new = np.empty(len(starts), dtype=bool)
+    new[0] = True
+    new[1:] = starts[1:] > reach[:-1]
+
+    first = np.flatnonzero(new)
+    last = np.append(first[1:] - 1, len(starts) - 1)
+
+    return starts[first], reach[last]
+
+
+def collapse_ranges(ranges):
+
+    # [[start, stop], ...] -> smallest list of ranges covering the same time
+    b_starts, b_stops = blocks(*_sorted(ranges))
+
+    return np.column_stack([b_starts, b_stops]).tolist()
+
+
+def get_Toverlap(ranges):
+
+    # Total time covered by at least one of the ranges
+    b_starts, b_stops = blocks(*_sorted(ranges))
+
+    return float(np.sum(b_stops - b_starts))
+
+
+class RangeUnion(object):
+
+    # Disjoint blocks of the ranges added so far, their total length and
+    # span kept up to date. A range may be replaced by a wider one; replacing
+    # it by one that does not cover it (or adding a reversed range) marks the
+    # union as stale, to be rebuilt from all ranges.
+
+    def __init__(self):
+
+        self.starts = list()
+        self.stops = list()
+        self.total = 0.0
+        self.stale = False
+
+    def add(self, start, stop):
+
+        if stop < start:
+            self.stale = True
+        if self.stale:
+            return
+
+        # Blocks that overlap or touch [start, stop]
+        first = bisect.bisect_left(self.stops, start)
+        last = bisect.bisect_right(self.starts, stop)
+
+        if first < last:
+            self.total -= sum([self.stops[ind] - self.starts[ind] for ind in range(first, last)])
+            start = min(start, self.starts[first])
+            stop = max(stop, self.stops[last - 1])
+
+        self.starts[first:last] = [start]
+        self.stops[first:last] = [stop]
+        self.total += stop - start
+
+    def replace(self, old, new):
+
+        # The range 'old' (None for a new range) is now 'new'
+        if old is not None and not (new[0] <= old[0] and old[1] <= new[1]):
+            self.stale = True
+        else:
+            self.add(new[0], new[1])
+
+    def rebuild(self, ranges):
+
+        b_starts, b_stops = blocks(*_sorted(ranges))
+
+        self.starts = b_starts.tolist()
+        self.stops = b_stops.tolist()
+        self.total = float(np.sum(b_stops - b_starts))
+        self.stale = False
+
+    def span(self):
+
+        return self.stops[-1] - self.starts[0] if self.starts else np.nan
+
+
+def concurrency(ranges):
+
+    # Number of ranges open over time as a step curve: counts[i] holds from
+    # times[i] up to times[i+1]
+    ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+
+    times = np.concatenate([ranges[:, 0], ranges[:, 1]])
+    steps = np.concatenate([np.ones(len(ranges)), -np.ones(len(ranges))])
+
+    # At equal times the stops go first, so back-to-back ranges do not count
+    # as concurrent
+    order = np.lexsort((steps, times))
+    times, counts = times[order], np.cumsum(steps[order])
+
+    # One point per distinct time
+    keep = np.append(times[1:] != times[:-1], True)
+
+    return times[keep], counts[keep].astype(int)
+
+
+def range_union(ranges, by='trial'):
+
+    # get_Toverlap for every group of a frame with 'start' and 'stop' columns
+    ranges = ranges.dropna(subset=['start', 'stop'])
+
+    if not len(ranges):
+        return pd.Series(dtype=float)
+
+    ranges = ranges.sort_values([by, 'start'])
+
+    reach = ranges.groupby(by)['stop'].cummax()
+    prev = reach.groupby(ranges[by]).shift()
+    block = (prev.isnull() | (ranges['start'] > prev)).cumsum()
+
+    grouped = ranges.groupby(block)
+    lengths = reach.groupby(block).max() - grouped['start'].min()
+
+    return lengths.groupby(grouped[by].first()).sum()
@@ -0,0 +1,298 @@
+import os
+import re
+import sys
+import glob
+import json
+import hashlib
+import argparse
+import collections
+from analysis.cache import manifest
+from analysis.overheads import OVERHEADS, overhead_tables
+from analysis.stream import stream_overhead_tables
+from analysis.archive import SUFFIX, TrialArchive, archive_overhead_table
+
+# ------------------------------------------------------------------------------
+# Regenerate the overhead tables and plots of all experiments from raw_data,
+# without Jupyter and without a MongoDB session.
+#
+#   python -m analysis.report [root] [--tasks 16] [--force]
+#
+# Experiments are found by layout: every '<exp>/raw_data' (or
+# '<exp>/<machine>/raw_data') below root, with one label per group of
+# '<label>-trial-N' directories anywhere beneath it. Per experiment the
+# report writes <exp>/plots/entk_overheads.{csv,png,pdf} (means, with the
+# standard errors in entk_overheads_err.csv) and, over all experiments with
+# tables on disk, <root>/plots/entk_report_unified.{png,pdf} (the paper's
+# entk_all_overheads_unified plots are left alone). An experiment is only
+# recomputed when the profiles of one of its trials changed since the last
+# report. Experiments that only come as '<exp>/raw_data.entkz' (see
+# archive.py) are read from the archive.
+
+TRIAL_DIR = re.compile(r'^(?P<label>.+)-trial-(?P<trial>\d+)$')
+
+# Bump when the output of the report changes for the same raw data
+REPORT_VERSION = 1
+
+NAME = 'entk_overheads'
+UNIFIED = 'entk_report_unified'
+
+# Tableau 20 pairs, light shades for the overheads like the notebooks
+COLORS = ['#aec7e8', '#ffbb78', '#98df8a', '#ff9896', '#c5b0d5', '#f7b6d2', '#c49c94']
+
+
+def natural_key(text):
+
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', text)]
+
+
+def find_trials(raw_data):
+
+    # {label: [trial directories]} below one raw_data directory
+    labels = collections.defaultdict(list)
+
+    for root, dirs, files in os.walk(raw_data):
+
+        for name in list(dirs):
+            match = TRIAL_DIR.match(name)
+            if match:
+                labels[match.group('label')].append(os.path.join(root, name))
+                # Everything below a trial belongs to it
+                dirs.remove(name)
+
+    return collections.OrderedDict((label, sorted(labels[label], key=natural_key))
+                                   for label in sorted(labels, key=natural_key))
+
+
+def find_experiments(root):
+
+    experiments = collections.OrderedDict()
+
+    for pattern in [('*', 'raw_data'), ('*', '*', 'raw_data')]:
+
+        for raw_data in sorted(glob.glob(os.path.join(root, *pattern))):
+
+            groups = find_trials(raw_data)
+            if groups:
+                experiments[os.path.relpath(os.path.dirname(raw_data), root)] = groups
+
+    return experiments
+
+
+def find_archives(root):
+
+    # {exp: archive} of the experiments packed by archive.py
+    archives = collections.OrderedDict()
+
+    for pattern in [('*', 'raw_data' + SUFFIX), ('*', '*', 'raw_data' + SUFFIX)]:
+
+        for path in sorted(glob.glob(os.path.join(root, *pattern))):
+            archives[os.path.relpath(os.path.dirname(path), root)] = path
+
+    return archives
+
+
+def digest(groups, num_tasks, archive=None):
+
+    # Changes whenever a profile or staging.csv of a trial (or the archive)
+    # changes
+    state = [REPORT_VERSION, num_tasks]
+
+    if archive:
+        state.append([os.path.getmtime(archive), os.path.getsize(archive)])
+        return hashlib.sha1(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+
+    for label, dirs in groups.items():
+        for src in dirs:
+            staging = os.path.join(src, 'staging.csv')
+            stat = None
+            if os.path.exists(staging):
+                stat = [os.path.getmtime(staging), os.path.getsize(staging)]
+            state.append([label, os.path.basename(src), manifest(src), stat])
+
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def plot_overheads(ax, mean, err, title=None):
+
+    # Overheads as log scale bars, execution time on a second axis
+    overheads = [col for col in OVERHEADS if col != 'Execution time']
+
+    mean[overheads].plot(kind='bar', ax=ax, yerr=err[overheads], logy=True, rot=0,
+                         width=0.8, legend=False, color=COLORS[:len(overheads)])
+    ax.set_ylabel('Overhead (seconds)')
+    ax.set_xlabel('')
+
+    ax2 = ax.twinx()
+    ax2.errorbar(range(len(mean)), mean['Execution time'].values, yerr=err['Execution time'].values,
+                 fmt='o', color='#7f7f7f', label='Execution time')
+    ax2.set_ylabel('Execution time (seconds)')
+    ax2.set_ylim(bottom=0)
+
+    if title:
+        ax.set_title(title)
+
+    return ax2
+
+
+def legend_entries(ax, ax2):
+
+    handles, labels = ax.get_legend_handles_labels()
+    handles2, labels2 = ax2.get_legend_handles_labels()
+
+    return handles + handles2, labels + labels2
+
+
+def save(fig, path, formats):
+
+    for fmt in formats:
+        fig.savefig('%s.%s'%(path, fmt), bbox_inches='tight')
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python -m analysis.report')
+    parser.add_argument('root', nargs='?', default='.', help='repository root (default: .)')
+    parser.add_argument('--experiments', default=None,
+                        help='comma separated experiment directories to report, default: all found')
+    parser.add_argument('--tasks', type=int, default=None,
+                        help='count only radical.entk.task.0000 .. N-1 (the notebooks use 16)')
+    parser.add_argument('--workers', type=int, default=None, help='processes for loading trials')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream the profiles instead of building (cached) event tables')
+    parser.add_argument('--formats', default='png,pdf', help='plot formats')
+    parser.add_argument('--force', action='store_true', help='recompute unchanged experiments too')
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    formats = args.formats.split(',')
+    experiments = find_experiments(args.root)
+
+    # Unpacked raw data wins over an archive of the same experiment
+    archives = find_archives(args.root)
+    for exp in list(archives):
+        if exp in experiments:
+            del archives[exp]
+        else:
+            archive = TrialArchive(archives[exp])
+            experiments[exp] = archive.groups()
+            archive.close()
+
+    # The unified plot covers every experiment, not only the ones reported
+    found = list(experiments)
+
+    if args.experiments:
+        wanted = [os.path.normpath(exp) for exp in args.experiments.split(',')]
+        experiments = collections.OrderedDict((exp, groups) for exp, groups in experiments.items()
+                                              if os.path.normpath(exp) in wanted)
+
+    if not experiments:
+        sys.stderr.write('No <exp>/raw_data/<label>-trial-N directories below %s\n'%args.root)
+        return 1
+
+    # Experiments whose raw data changed since the last report
+    digests = dict((exp, digest(groups, args.tasks, archives.get(exp)))
+                   for exp, groups in experiments.items())
+    stale = collections.OrderedDict()
+
+    for exp, groups in experiments.items():
+
+        plots = os.path.join(args.root, exp, 'plots')
+        state = os.path.join(plots, '.%s.sha1'%NAME)
+
+        current = None
+        if os.path.exists(state):
+            current = open(state).read().strip()
+
+        if args.force or current != digests[exp] or not os.path.exists(os.path.join(plots, NAME + '.csv')):
+            stale[exp] = groups
+        else:
+            print('%s: unchanged'%exp)
+
+    unpacked = collections.OrderedDict((exp, groups) for exp, groups in stale.items()
+                                       if exp not in archives)
+    tables = dict()
+
+    if unpacked:
+        if args.stream:
+            tables = stream_overhead_tables(unpacked, args.tasks, args.workers)
+        else:
+            tables = overhead_tables(unpacked, args.tasks, workers=args.workers)
+
+    for exp in stale:
+        if exp in archives:
+            tables[exp] = archive_overhead_table(archives[exp], args.tasks, args.workers)
+
+    for exp in stale:
+
+        mean, err = tables[exp]
+        plots = os.path.join(args.root, exp, 'plots')
+
+        if not os.path.isdir(plots):
+            os.makedirs(plots)
+
+        mean.to_csv(os.path.join(plots, NAME + '.csv'))
+        err.to_csv(os.path.join(plots, NAME + '_err.csv'))
+
+        if len(mean):
+            fig, ax = plt.subplots(figsize=(12, 5))
+            ax2 = plot_overheads(ax, mean, err, exp)
+            handles, labels = legend_entries(ax, ax2)
+            fig.legend(handles, labels, loc='upper center', ncol=3, bbox_to_anchor=(0.5, 1.12))
+            save(fig, os.path.join(plots, NAME), formats)
+            plt.close(fig)
+
+        f = open(os.path.join(plots, '.%s.sha1'%NAME), 'w')
+        f.write('%s\n'%digests[exp])
+        f.close()
+
+        print('%s: %s trials -> %s'%(exp, sum([len(dirs) for dirs in experiments[exp].values()]),
+                                     os.path.join(plots, NAME)))
+
+    unified = os.path.join(args.root, 'plots', UNIFIED)
+
+    if stale or not os.path.exists('%s.%s'%(unified, formats[0])):
+
+        # All experiments from the tables on disk, one panel each
+        frames = list()
+        for exp in found:
+            plots = os.path.join(args.root, exp, 'plots')
+            if not os.path.exists(os.path.join(plots, NAME + '.csv')):
+                continue
+            mean = pd.read_csv(os.path.join(plots, NAME + '.csv'), index_col=0)
+            err = pd.read_csv(os.path.join(plots, NAME + '_err.csv'), index_col=0)
+            if len(mean):
+                frames.append((exp, mean, err))
+
+        if frames:
+            if not os.path.isdir(os.path.dirname(unified)):
+                os.makedirs(os.path.dirname(unified))
+
+            cols = 2 if len(frames) > 1 else 1
+            rows = (len(frames) + cols - 1)//cols
+
+            fig, axes = plt.subplots(rows, cols, figsize=(12*cols, 5*rows), squeeze=False)
+
+            for ax, (exp, mean, err) in zip(axes.flat, frames):
+                ax2 = plot_overheads(ax, mean, err, exp)
+
+            for ax in list(axes.flat)[len(frames):]:
+                ax.axis('off')
+
+            handles, labels = legend_entries(ax, ax2)
+            fig.legend(handles, labels, loc='upper center', ncol=7)
+            fig.tight_layout(rect=(0, 0, 1, 0.95))
+            save(fig, unified, formats)
+            plt.close(fig)
+
+            print('unified: %s experiments -> %s'%(len(frames), unified))
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
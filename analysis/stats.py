@@ -0,0 +1,246 @@
+import sys
+import math
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Reducing per trial metrics to per configuration statistics.
+#
+# The input is one row per trial (trial_table() or archive_trial_table()), with
+# one column per metric and one or more columns naming the configuration
+# ('label', or 'experiment' and 'label'). All configurations and metrics are
+# reduced at once:
+#
+#   summarize()     : n, mean, std, sem and a bootstrap confidence interval
+#                     of the mean per configuration and metric
+#   outliers()      : trials far from the rest of their configuration, by the
+#                     modified z-score (median and MAD, Iglewicz and Hoaglin),
+#                     for configurations of 5 trials or more
+#   trials_needed() : extra trials until the confidence interval of the mean
+#                     is within a given fraction of the mean
+#
+# The 'err' of the notebooks (np.std / sqrt(trials)) is what overhead_tables()
+# returns; 'sem' here uses the sample standard deviation (ddof=1).
+#
+#   python -m analysis.stats exp-5-B-1/raw_data --rel-error 0.05
+
+STATS = ['n', 'mean', 'std', 'sem', 'ci_low', 'ci_high']
+
+# Resamples x configurations x trials x metrics held in memory at once
+BOOT_CHUNK = 2**22
+
+
+def normal_quantile(p):
+
+    # Inverse of the standard normal cdf, by bisection on erf
+    lo, hi = -40.0, 40.0
+
+    for _ in range(200):
+        mid = (lo + hi)/2
+        if 0.5*(1 + math.erf(mid/math.sqrt(2))) < p:
+            lo = mid
+        else:
+            hi = mid
+
+    return (lo + hi)/2
+
+
+def _metrics(per_trial, by, metrics):
+
+    if metrics is not None:
+        return list(metrics)
+
+    by = [by] if isinstance(by, str) else list(by)
+
+    return [col for col in per_trial.columns
+            if col not in by and np.issubdtype(per_trial[col].dtype, np.number)]
+
+
+def _padded(per_trial, by, metrics):
+
+    # (configurations, trials per configuration, configurations x max trials
+    # x metrics array padded with NaN)
+    grouped = per_trial.groupby(by, sort=False)
+
+    codes = grouped.ngroup().values
+    pos = grouped.cumcount().values
+    sizes = grouped.size()
+
+    vals = np.full((len(sizes), sizes.max(), len(metrics)), np.nan)
+    vals[codes, pos, :] = per_trial[metrics].values.astype(float)
+
+    return sizes.index, sizes.values, vals
+
+
+def bootstrap_means(vals, sizes, n_boot=2000, seed=None):
+
+    # n_boot x configurations x metrics means of resampled trials. Every
+    # configuration is resampled with replacement to its own number of trials.
+    rng = np.random.RandomState(seed)
+    groups, width, nmetrics = vals.shape
+
+    valid = np.arange(width)[None, :] < sizes[:, None]
+    rows = np.arange(groups)[None, :, None]
+    chunk = max(1, BOOT_CHUNK//max(1, groups*width*nmetrics))
+
+    means = list()
+
+    with warnings.catch_warnings():
+        # All-NaN metrics of a configuration stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        for start in range(0, n_boot, chunk):
+
+            count = min(chunk, n_boot - start)
+            idx = (rng.random_sample((count, groups, width))*sizes[None, :, None]).astype(np.intp)
+
+            sample = vals[rows, idx]
+            sample[~np.broadcast_to(valid, (count, groups, width))] = np.nan
+
+            means.append(np.nanmean(sample, axis=2))
+
+    return np.concatenate(means)
+
+
+def summarize(per_trial, by='label', metrics=None, n_boot=2000, confidence=0.95, seed=None):
+
+    # Configurations x (metric, stat) frame of STATS. The frames the notebooks
+    # plot are summary.xs('mean', axis=1, level=1) and the same for 'sem'.
+    metrics = _metrics(per_trial, by, metrics)
+    grouped = per_trial.groupby(by, sort=False)[metrics]
+
+    count = grouped.count()
+    std = grouped.std(ddof=1)
+
+    stats = {'n': count,
+             'mean': grouped.mean(),
+             'std': std,
+             'sem': std/np.sqrt(count)}
+
+    keys, sizes, vals = _padded(per_trial, by, metrics)
+    boot = bootstrap_means(vals, sizes, n_boot, seed)
+
+    alpha = 1 - confidence
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanpercentile(boot, [100*alpha/2, 100*(1 - alpha/2)], axis=0)
+
+    stats['ci_low'] = pd.DataFrame(low, index=keys, columns=metrics)
+    stats['ci_high'] = pd.DataFrame(high, index=keys, columns=metrics)
+
+    summary = pd.concat([stats[stat].reindex(keys) for stat in STATS], axis=1, keys=STATS)
+
+    return summary.swaplevel(axis=1).reindex(columns=pd.MultiIndex.from_product([metrics, STATS]))
+
+
+def outliers(per_trial, by='label', metrics=None, threshold=3.5, min_trials=5):
+
+    # Trials x metrics, True where a trial's value is more than 'threshold'
+    # modified z-scores away from the median of its configuration. At least
+    # half the trials are within one MAD of the median, so no majority is ever
+    # flagged. Where half the trials agree exactly (MAD 0), or the
+    # configuration has fewer than 'min_trials' trials (the MAD of 3 trials is
+    # the distance of one of them), nothing is judged.
+    metrics = _metrics(per_trial, by, metrics)
+    values = per_trial[metrics].astype(float)
+    keys = [per_trial[col] for col in ([by] if isinstance(by, str) else by)]
+
+    median = values.groupby(keys).transform('median')
+    dev = (values - median).abs()
+
+    scale = 1.4826*dev.groupby(keys).transform('median')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = dev/scale.where(scale > 0)
+
+    enough = values.groupby(keys).transform('count') >= min_trials
+
+    return (score > threshold) & enough
+
+
+def trials_needed(summary, rel_error=0.05, abs_error=0.0, confidence=0.95):
+
+    # Configurations x metrics: how many more trials until the normal
+    # confidence interval of the mean, +-z*std/sqrt(n), is within
+    # max(rel_error*|mean|, abs_error). NaN where that cannot be judged
+    # (fewer than 2 trials, or a zero target).
+    z = normal_quantile(1 - (1 - confidence)/2)
+
+    n = summary.xs('n', axis=1, level=1)
+    mean = summary.xs('mean', axis=1, level=1)
+    std = summary.xs('std', axis=1, level=1)
+
+    target = np.maximum(rel_error*mean.abs(), abs_error)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        needed = np.ceil((z*std/target)**2)
+
+    needed = needed.where(std > 0, n).where(target > 0).where(n >= 2)
+
+    return (needed - n).clip(lower=0)
+
+
+def main(argv=None):
+
+    from analysis.overheads import trial_table
+    from analysis.archive import SUFFIX, archive_trial_table
+    from analysis.report import find_trials
+
+    parser = argparse.ArgumentParser(prog='python -m analysis.stats')
+    parser.add_argument('raw_data', help='raw_data directory or %s archive of one experiment'%SUFFIX)
+    parser.add_argument('--tasks', type=int, default=None,
+                        help='count only radical.entk.task.0000 .. N-1 (the notebooks use 16)')
+    parser.add_argument('--workers', type=int, default=None, help='processes for loading trials')
+    parser.add_argument('--boot', type=int, default=2000, help='bootstrap resamples')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--rel-error', type=float, default=0.05,
+                        help='wanted confidence interval half width, relative to the mean')
+    parser.add_argument('--abs-error', type=float, default=0.0,
+                        help='... or in seconds, whichever is larger')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('-o', '--output', default=None, help='write the summary to this csv')
+    args = parser.parse_args(argv)
+
+    if args.raw_data.endswith(SUFFIX):
+        per_trial = archive_trial_table(args.raw_data, args.tasks, args.workers, progress=False)
+    else:
+        groups = find_trials(args.raw_data)
+        if not groups:
+            sys.stderr.write('No <label>-trial-N directories below %s\n'%args.raw_data)
+            return 1
+        per_trial = trial_table({None: groups}, args.tasks, workers=args.workers, progress=False)
+
+    per_trial = per_trial.drop('experiment', axis=1)
+
+    summary = summarize(per_trial, 'label', n_boot=args.boot, confidence=args.confidence, seed=args.seed)
+    extra = trials_needed(summary, args.rel_error, args.abs_error, args.confidence)
+    flags = outliers(per_trial, 'label')
+
+    if args.output:
+        summary.to_csv(args.output)
+
+    pd.set_option('display.width', 200)
+
+    for metric in summary.columns.get_level_values(0).unique():
+        print('%s\n%s\n'%(metric, summary[metric].round(3).to_string()))
+
+    print('Outliers:')
+    for trial, row in flags.iterrows():
+        if row.any():
+            print('  %s (%s): %s'%(trial, per_trial.loc[trial, 'label'], ', '.join(row.index[row.values])))
+
+    print('\nExtra trials for +-%g%% at %g%% confidence:'%(100*args.rel_error, 100*args.confidence))
+    for label, row in extra.iterrows():
+        if row.notnull().any():
+            print('  %s: %d (%s)'%(label, row.max(), row.idxmax()))
+        else:
+            print('  %s: unknown, fewer than 2 trials'%label)
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,281 @@
+import os
+import collections
+import numpy as np
+import pandas as pd
+from array import array
+from analysis.profiles import prof_files
+from analysis.ranges import RangeUnion
+from analysis.ingest import map_trials
+from analysis.index import uid_number
+from analysis.overheads import (OVERHEADS, TASK_PREFIX, UNIT_PREFIX, AMGR, RMGR,
+                                experiment_members, tabulate)
+
+# ------------------------------------------------------------------------------
+# Overheads without loading a session into memory.
+#
+# Profiles are read line by line and only the records an overhead needs are
+# kept: the first time every task/unit reached one of the states of interest
+# (two to four floats per entity) and the first time of the appmanager and
+# resource manager events. Memory grows with the number of entities, not with
+# the number of profile records, and the event table of overheads.py is never
+# built. The unions of the task, unit and staging ranges are kept up to date
+# as the records come in, so a result() costs the same however long the run.
+
+TASK_STATES = ('SCHEDULING', 'DONE')
+UNIT_STATES = ('UMGR_SCHEDULING_PENDING', 'DONE', 'AGENT_EXECUTING', 'AGENT_STAGING_OUTPUT_PENDING')
+
+CORE_EVENTS = {AMGR: ('create amgr obj', 'init rreq submission',
+                      'start termination', 'termination done'),
+               RMGR: ('create rmgr obj', 'rmgr obj created',
+                      'canceling resource allocation', 'resource allocation cancelled')}
+
+
+def iter_prof(path, prefixes=None, states=None, events=None):
+
+    # (time, uid, state, event) of the lines whose uid starts with one of
+    # 'prefixes' and whose state is in 'states' or event in 'events'
+    f = open(path, 'r')
+
+    for line in f:
+
+        if line[:1] == '#':
+            continue
+
+        fields = line.split(',', 5)
+        if len(fields) < 5:
+            continue
+
+        uid = fields[2].strip()
+        if prefixes and not uid.startswith(prefixes):
+            continue
+
+        state = fields[3].strip()
+        event = fields[4].strip()
+
+        if (states or events) and not ((states and state in states) or
+                                       (events and event in events)):
+            continue
+
+        try:
+            yield float(fields[0]), uid, state, event
+        except ValueError:
+            continue
+
+    f.close()
+
+
+class FirstTimes(object):
+
+    # Earliest time every entity reached each of 'states', one array('d')
+    # column per state
+
+    def __init__(self, states):
+
+        self.states = dict((state, col) for col, state in enumerate(states))
+        self.rows = dict()
+        self.cols = [array('d') for _ in states]
+
+    def add(self, uid, state, time):
+
+        row = self.rows.get(uid)
+
+        if row is None:
+            row = self.rows[uid] = len(self.rows)
+            for col in self.cols:
+                col.append(np.nan)
+
+        col = self.cols[self.states[state]]
+        if not col[row] <= time:
+            col[row] = time
+
+    def range(self, uid, start, stop):
+
+        # (start, stop) of one entity, None until it reached both
+        row = self.rows.get(uid)
+        if row is None:
+            return None
+
+        start = self.cols[self.states[start]][row]
+        stop = self.cols[self.states[stop]][row]
+
+        return None if start != start or stop != stop else (start, stop)
+
+    def ranges(self, start, stop):
+
+        # [[start, stop], ...] of the entities that reached both
+        ranges = np.column_stack([np.frombuffer(self.cols[self.states[start]]),
+                                  np.frombuffer(self.cols[self.states[stop]])])
+
+        return ranges[~np.isnan(ranges).any(axis=1)]
+
+
+class RunningOverheads(object):
+
+    # The OVERHEADS of one trial, fed one profile record at a time. With
+    # live=True the range unions are kept up to date record by record, for a
+    # result() after every few records, otherwise result() builds them.
+
+    def __init__(self, num_tasks=None, live=False):
+
+        self.num_tasks = num_tasks
+        self.live = live
+
+        self.tasks = FirstTimes(TASK_STATES)
+        self.units = FirstTimes(UNIT_STATES)
+        self.events = dict()
+        self.staging = list()
+        self._counted = dict()
+
+        # (first times, start state, stop state): union of those ranges
+        self.unions = collections.OrderedDict(
+            [((self.tasks, 'SCHEDULING', 'DONE'), RangeUnion()),
+             ((self.units, 'UMGR_SCHEDULING_PENDING', 'DONE'), RangeUnion()),
+             ((self.units, 'AGENT_EXECUTING', 'AGENT_STAGING_OUTPUT_PENDING'), RangeUnion())])
+        self.staging_union = RangeUnion()
+
+        # (first times, state): [(union, column of the other end, whether
+        # the state is the start), ...]
+        self._ends = collections.defaultdict(list)
+        for (times, start, stop), union in self.unions.items():
+            self._ends[(times, start)].append((union, times.cols[times.states[stop]], True))
+            self._ends[(times, stop)].append((union, times.cols[times.states[start]], False))
+
+    def counted(self, uid):
+
+        # Whether a task counts for the EnTK span, as in state_ranges()
+        if self.num_tasks is None:
+            return True
+
+        counted = self._counted.get(uid)
+        if counted is None:
+            number = uid_number(uid)
+            counted = self._counted[uid] = number is not None and number < self.num_tasks
+
+        return counted
+
+    def _add_first(self, times, uid, state, time):
+
+        # Record a first time and widen the ranges it is an end of
+        if not self.live:
+            times.add(uid, state, time)
+            return
+
+        row = times.rows.get(uid)
+        prev = np.nan if row is None else times.cols[times.states[state]][row]
+
+        if prev <= time:
+            return
+
+        times.add(uid, state, time)
+        row = times.rows[uid]
+
+        for union, others, is_start in self._ends[(times, state)]:
+
+            other = others[row]
+            if other != other:
+                continue
+
+            if is_start:
+                union.replace(None if prev != prev else (prev, other), (time, other))
+            else:
+                union.replace(None if prev != prev else (other, prev), (other, time))
+
+    def add(self, time, uid, state, event):
+
+        if uid.startswith(TASK_PREFIX):
+            if state in TASK_STATES and self.counted(uid):
+                self._add_first(self.tasks, uid, state, time)
+
+        elif uid.startswith(UNIT_PREFIX):
+            if state in UNIT_STATES:
+                self._add_first(self.units, uid, state, time)
+
+        elif event in CORE_EVENTS.get(uid, ()):
+            key = (uid, event)
+            if not self.events.get(key, np.inf) <= time:
+                self.events[key] = time
+
+    def add_staging(self, start, stop):
+
+        self.staging.append([start, stop])
+        if self.live:
+            self.staging_union.add(start, stop)
+
+    def duration(self, uid, start, stop):
+
+        return self.events.get((uid, stop), np.nan) - self.events.get((uid, start), np.nan)
+
+    def union(self, times, start, stop):
+
+        # RangeUnion of the (start, stop) ranges, live ones are rebuilt only
+        # when a range shrank since the last time
+        union = self.unions[(times, start, stop)]
+        if union.stale or not self.live:
+            union.rebuild(times.ranges(start, stop))
+
+        return union
+
+    def result(self):
+
+        entk_span = self.union(self.tasks, *TASK_STATES).span()
+
+        units = self.union(self.units, 'UMGR_SCHEDULING_PENDING', 'DONE')
+        rp_span = units.total if units.starts else np.nan
+
+        execs = self.union(self.units, 'AGENT_EXECUTING', 'AGENT_STAGING_OUTPUT_PENDING')
+        exec_time = execs.total if execs.starts else np.nan
+
+        core_1 = self.duration(AMGR, 'create amgr obj', 'init rreq submission')
+        core_2 = self.duration(AMGR, 'start termination', 'termination done')
+        core_3 = self.duration(RMGR, 'create rmgr obj', 'rmgr obj created')
+        core_5 = self.duration(RMGR, 'canceling resource allocation', 'resource allocation cancelled')
+
+        if self.staging_union.stale or not self.live:
+            self.staging_union.rebuild(self.staging)
+        staging = self.staging_union.total
+
+        return pd.Series([core_1 + core_3, core_2 - core_5, core_5,
+                          entk_span - rp_span, rp_span - exec_time, exec_time, staging],
+                         index=OVERHEADS)
+
+
+def stream_overheads(src, num_tasks=None):
+
+    # OVERHEADS of one trial directory, streamed from its profiles
+    running = RunningOverheads(num_tasks)
+
+    prefixes = (TASK_PREFIX, UNIT_PREFIX, AMGR, RMGR)
+    states = set(TASK_STATES + UNIT_STATES)
+    events = set(CORE_EVENTS[AMGR] + CORE_EVENTS[RMGR])
+
+    paths = prof_files(src)
+    if not paths:
+        raise ValueError('no profiles under %s'%src)
+
+    for path in paths:
+        for record in iter_prof(path, prefixes, states, events):
+            running.add(*record)
+
+    staging = os.path.join(src, 'staging.csv')
+
+    if os.path.exists(staging):
+        f = open(staging, 'r')
+        for line in f:
+            fields = line.split(',')
+            running.add_staging(float(fields[2]), float(fields[3]))
+        f.close()
+
+    return running.result()
+
+
+def stream_overhead_tables(experiments, num_tasks=None, workers=None, progress=True):
+
+    # overhead_tables() computed from streamed profiles
+    members = experiment_members(experiments)
+    trials = dict((src, src) for dirs in members.values() for src in dirs)
+
+    results, failures = map_trials(stream_overheads, trials, (num_tasks,), workers, progress)
+
+    per_trial = pd.DataFrame(results).T.reindex(columns=OVERHEADS)
+
+    return tabulate(per_trial, experiments, members)
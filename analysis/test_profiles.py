@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+from analysis.profiles import read_prof, load_events
+
+# ------------------------------------------------------------------------------
+# analysis.profiles on profiles with commas in the msg column.
+#
+#   python -m pytest analysis/test_profiles.py
+#   python -m analysis.test_profiles
+
+HEADER = '#time,name,uid,state,event,msg\n'
+
+RECORDS = [('1500000000.0000', 'radical.entk.appmanager', 'radical.entk.appmanager.0000', '', 'create', ''),
+           ('1500000001.5000', 'radical.entk.wfprocessor', 'radical.entk.task.0000', 'SCHEDULING', 'advance', ''),
+           ('1500000002.2500', 'radical.entk.task_manager', 'radical.entk.task.0000', 'DONE', 'advance', '')]
+
+
+def write_prof(directory, name, lines):
+
+    path = os.path.join(directory, name)
+    f = open(path, 'w')
+    f.write(HEADER)
+    f.writelines(lines)
+    f.close()
+
+    return path
+
+
+def line(record, msg=''):
+
+    return ','.join(record[:5] + (msg,)) + '\n'
+
+
+def check(frame):
+
+    assert list(frame['uid']) == [record[2] for record in RECORDS]
+    assert list(frame['event']) == [record[4] for record in RECORDS]
+    assert list(frame['time']) == [float(record[0]) for record in RECORDS]
+
+
+def run(msgs):
+
+    # read_prof and load_events of a profile with the given msg per record
+    directory = tempfile.mkdtemp()
+
+    try:
+        path = write_prof(directory, 'test.prof', [line(record, msg) for record, msg in zip(RECORDS, msgs)])
+        check(read_prof(path))
+        check(load_events(directory).sort_values('time'))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_plain():
+
+    run(['', '', ''])
+
+
+def test_comma_in_first_msg():
+
+    run(['cores: 1, gpus: 0', '', ''])
+
+
+def test_comma_in_later_msg():
+
+    run(['', 'state, from SCHEDULING', 'a,b,c'])
+
+
+if __name__ == '__main__':
+
+    for test in [test_plain, test_comma_in_first_msg, test_comma_in_later_msg]:
+        test()
+        print('%s ok'%test.__name__)
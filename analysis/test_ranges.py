@@ -0,0 +1,162 @@
+import random
+import numpy as np
+import pandas as pd
+from analysis.ranges import RangeUnion, collapse_ranges, get_Toverlap, range_union
+
+# ------------------------------------------------------------------------------
+# analysis.ranges against the notebooks' implementation, on random ranges.
+#
+#   python -m pytest analysis/test_ranges.py
+#   python -m analysis.test_ranges
+
+CASES = 3000
+
+
+def notebook_collapse_ranges(ranges):
+
+    # collapse_ranges of unified_overhead_plot.ipynb
+    final = []
+
+    _ranges = sorted(ranges, key=lambda x: x[0])
+
+    START = 0
+    END = 1
+
+    base = _ranges[0]
+
+    for _range in _ranges[1:]:
+
+        if _range[START] <= base[END]:
+            base[END] = max(base[END], _range[END])
+
+        else:
+            final.append(base)
+            base = _range
+
+    final.append(base)
+
+    return final
+
+
+def notebook_get_Toverlap(ranges):
+
+    overlap = 0
+
+    for crange in notebook_collapse_ranges(ranges):
+        overlap += crange[1] - crange[0]
+
+    return overlap
+
+
+def random_ranges(rng):
+
+    # Ranges on a coarse grid, so that touching, equal and nested ranges are
+    # frequent
+    n = rng.randint(1, 30)
+    grid = rng.choice([1.0, 0.5, 0.25])
+    ranges = list()
+
+    for _ in range(n):
+
+        start = rng.randint(0, 40)*grid
+        kind = rng.random()
+
+        if kind < 0.15 and ranges:
+            # Touches an earlier range
+            start = rng.choice(ranges)[1]
+        elif kind < 0.3 and ranges:
+            # Nested in an earlier range
+            outer = rng.choice(ranges)
+            start = outer[0] + (outer[1] - outer[0])*rng.random()/2
+
+        ranges.append([start, start + rng.randint(0, 10)*grid])
+
+    return ranges
+
+
+def copy(ranges):
+
+    # The notebook implementation changes the ranges it is given
+    return [list(r) for r in ranges]
+
+
+def test_empty():
+
+    assert collapse_ranges([]) == []
+    assert get_Toverlap([]) == 0.0
+    assert len(range_union(pd.DataFrame(columns=['trial', 'start', 'stop']))) == 0
+
+
+def test_touching_and_nested():
+
+    ranges = [[0.0, 1.0], [1.0, 2.0], [0.5, 0.75], [3.0, 3.0], [4.0, 6.0], [4.5, 5.0]]
+
+    assert collapse_ranges(copy(ranges)) == notebook_collapse_ranges(copy(ranges)) == \
+        [[0.0, 2.0], [3.0, 3.0], [4.0, 6.0]]
+    assert get_Toverlap(copy(ranges)) == notebook_get_Toverlap(copy(ranges)) == 4.0
+
+
+def test_random():
+
+    rng = random.Random(12)
+
+    for _ in range(CASES):
+        ranges = random_ranges(rng)
+        assert collapse_ranges(copy(ranges)) == notebook_collapse_ranges(copy(ranges)), ranges
+        assert np.isclose(get_Toverlap(copy(ranges)), notebook_get_Toverlap(copy(ranges))), ranges
+
+
+def test_range_union():
+
+    rng = random.Random(13)
+    rows = list()
+    expected = dict()
+
+    for trial in range(200):
+        ranges = random_ranges(rng)
+        expected[trial] = notebook_get_Toverlap(copy(ranges))
+        rows.extend([(trial, start, stop) for start, stop in ranges])
+
+    frame = pd.DataFrame(rows, columns=['trial', 'start', 'stop']).sample(frac=1, random_state=1)
+    union = range_union(frame)
+
+    assert sorted(union.index) == sorted(expected)
+    for trial, total in expected.items():
+        assert np.isclose(union[trial], total), trial
+
+
+def test_running_union():
+
+    rng = random.Random(14)
+
+    for _ in range(CASES//3):
+
+        # Ranges arrive one at a time, some are later widened or narrowed
+        # like the first times of a live profile
+        union = RangeUnion()
+        ranges = list()
+
+        for start, stop in random_ranges(rng):
+
+            if ranges and rng.random() < 0.3:
+                ind = rng.randrange(len(ranges))
+                old = tuple(ranges[ind])
+                ranges[ind] = [min(old[0], start), min(old[1], stop) if rng.random() < 0.3 else max(old[1], stop)]
+                union.replace(old, tuple(ranges[ind]))
+            else:
+                ranges.append([start, stop])
+                union.replace(None, (start, stop))
+
+            if union.stale:
+                union.rebuild(ranges)
+
+            assert np.isclose(union.total, notebook_get_Toverlap(copy(ranges))), ranges
+            assert [list(block) for block in zip(union.starts, union.stops)] == collapse_ranges(copy(ranges))
+            assert union.span() == max([r[1] for r in ranges]) - min([r[0] for r in ranges])
+
+
+if __name__ == '__main__':
+
+    for test in [test_empty, test_touching_and_nested, test_random, test_range_union, test_running_union]:
+        test()
+        print('%s ok'%test.__name__)
@@ -0,0 +1,444 @@
+import time
+import uuid
+import heapq
+import collections
+import os
+import traceback
+import pika
+from sampler import MemorySampler, record_cost
+from tracefile import TraceWriter
+from serializers import get_codec
+from latency import LatencyHistogram, publish_headers, publish_time, write_histograms
+
+# ------------------------------------------------------------------------------
+# Event driven engine for the push/pop benchmark.
+#
+# Instead of one process (and one BlockingConnection) per pusher and popper,
+# all logical pushers and poppers live in a single process and are multiplexed
+# as channels over a small number of connections that share one ioloop. Python
+# 2 has no asyncio, so the engine is written against pika's callback based
+# SelectConnection. LocalConnection below offers the same callback API on top
+# of an in-process broker, which lets the engine run without RabbitMQ.
+
+# Number of messages a pusher publishes before yielding to the ioloop
+PUSH_SLICE = 100
+
+
+class LocalIOLoop(object):
+
+    # Stand-in for pika's IOLoop: runs callbacks in deadline order until
+    # stopped or until there is nothing left to do
+
+    def __init__(self):
+
+        self._timeouts = list()
+        self._seq = 0
+        self._running = False
+
+    def add_timeout(self, delay, callback):
+
+        heapq.heappush(self._timeouts, (time.time() + delay, self._seq, callback))
+        self._seq += 1
+
+    def start(self):
+
+        self._running = True
+
+        while self._running and self._timeouts:
+
+            deadline, _, callback = heapq.heappop(self._timeouts)
+
+            delay = deadline - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            callback()
+
+    def stop(self):
+
+        self._running = False
+
+
+class LocalMethod(object):
+
+    def __init__(self, delivery_tag):
+
+        self.delivery_tag = delivery_tag
+
+
+class LocalBroker(object):
+
+    # In-process broker: named FIFO queues and the consumers attached to them.
+    # Deliveries honour each channel's prefetch count, like RabbitMQ does.
+
+    def __init__(self, ioloop):
+
+        self.ioloop = ioloop
+        self.queues = dict()
+        self.consumers = dict()
+        self._scheduled = set()
+
+    def declare(self, name):
+
+        self.queues.setdefault(name, collections.deque())
+        self.consumers.setdefault(name, list())
+
+    def delete(self, name):
+
+        self.queues.pop(name, None)
+        self.consumers.pop(name, None)
+
+    def publish(self, name, props, body):
+
+        self.queues[name].append((props, body))
+        self.schedule(name)
+
+    def requeue(self, name, messages):
+
+        self.queues[name].extendleft(reversed(messages))
+        self.schedule(name)
+
+    def schedule(self, name):
+
+        # Coalesce dispatch requests, one pending dispatch per queue is enough
+        if name not in self._scheduled:
+            self._scheduled.add(name)
+            self.ioloop.add_timeout(0, lambda: self.dispatch(name))
+
+    def dispatch(self, name):
+
+        self._scheduled.discard(name)
+
+        queue = self.queues.get(name)
+        consumers = self.consumers.get(name)
+
+        while queue and consumers:
+
+            ready = [ch for ch in consumers if ch.has_capacity()]
+            if not ready:
+                break
+
+            for ch in ready:
+                if not queue:
+                    break
+                props, body = queue.popleft()
+                ch.deliver(props, body)
+
+
+class LocalChannel(object):
+
+    # Subset of pika.channel.Channel used by the engine
+
+    def __init__(self, broker):
+
+        self.broker = broker
+        self.prefetch = 0
+        self.unacked = collections.OrderedDict()
+        self.next_tag = 1
+        self.queue = None
+        self.consumer_callback = None
+
+    def queue_delete(self, callback=None, queue=''):
+
+        self.broker.delete(queue)
+        if callback:
+            callback(None)
+
+    def queue_declare(self, callback=None, queue=''):
+
+        self.broker.declare(queue)
+        if callback:
+            callback(None)
+
+    def basic_qos(self, callback=None, prefetch_size=0, prefetch_count=0, all_channels=False):
+
+        self.prefetch = prefetch_count
+        if callback:
+            callback(None)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False, immediate=False):
+
+        self.broker.publish(routing_key, properties, body)
+
+    def basic_consume(self, consumer_callback, queue='', no_ack=False, exclusive=False, consumer_tag=None, arguments=None):
+
+        self.queue = queue
+        self.consumer_callback = consumer_callback
+        self.broker.consumers[queue].append(self)
+        self.broker.schedule(queue)
+
+        return consumer_tag or 'ctag.%s'%id(self)
+
+    def basic_cancel(self, callback=None, consumer_tag='', nowait=False):
+
+        if self.queue in self.broker.consumers:
+            self.broker.consumers[self.queue].remove(self)
+            self.broker.requeue(self.queue, self.unacked.values())
+
+        self.unacked.clear()
+        if callback:
+            callback(None)
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+
+        if multiple:
+            while self.unacked and next(iter(self.unacked)) <= delivery_tag:
+                self.unacked.popitem(last=False)
+        else:
+            self.unacked.pop(delivery_tag, None)
+
+        if self.queue:
+            self.broker.schedule(self.queue)
+
+    def has_capacity(self):
+
+        return not self.prefetch or len(self.unacked) < self.prefetch
+
+    def deliver(self, props, body):
+
+        tag = self.next_tag
+        self.next_tag += 1
+        self.unacked[tag] = (props, body)
+
+        self.consumer_callback(self, LocalMethod(tag), props, body)
+
+    def close(self):
+
+        pass
+
+
+class LocalConnection(object):
+
+    # Subset of pika.SelectConnection used by the engine
+
+    def __init__(self, broker, on_open_callback):
+
+        self.broker = broker
+        self.ioloop = broker.ioloop
+        self.ioloop.add_timeout(0, lambda: on_open_callback(self))
+
+    def channel(self, on_open_callback):
+
+        ch = LocalChannel(self.broker)
+        self.ioloop.add_timeout(0, lambda: on_open_callback(ch))
+
+        return ch
+
+    def add_timeout(self, delay, callback):
+
+        self.ioloop.add_timeout(delay, callback)
+
+    def close(self):
+
+        pass
+
+
+class AsyncEngine(object):
+
+    def __init__(self, data, t_dict, num_push, num_pop, num_queues, max_tasks,
+                 num_conns=2, prefetch=100, ack_every=10,
+                 broker='rabbitmq', host='localhost', port=32769, codec=None):
+
+        self.data = data
+        self.t_dict = t_dict
+        self.num_push = num_push
+        self.num_pop = num_pop
+        self.num_queues = num_queues
+        self.num_conns = num_conns
+        self.prefetch = prefetch
+        self.ack_every = min(ack_every, prefetch)
+        self.codec = codec or get_codec('json')
+
+        self.push_quota = max_tasks/num_push
+
+        # Poppers read the queue they are bound to until all pushed tasks
+        # are popped, however the queues are shared between them
+        self.pop_total = self.push_quota*num_push
+
+        # Per logical worker trace streamed to disk, memory is sampled in the
+        # background
+        self.sampler = MemorySampler()
+        self.push_records = dict((ind, TraceWriter(data + '/push_%s.trc'%ind, self.sampler))
+                                 for ind in range(num_push))
+        self.pop_records = dict((ind, TraceWriter(data + '/pop_%s.trc'%ind, self.sampler))
+                                for ind in range(num_pop))
+
+        # Queue residence time seen by every popper
+        self.pop_latency = dict((ind, LatencyHistogram()) for ind in range(num_pop))
+
+        self._opened = 0
+        self._declared = 0
+        self._popped = 0
+        self._poppers = dict()
+        self._finished = False
+
+        if broker == 'local':
+            self.ioloop = LocalIOLoop()
+            local_broker = LocalBroker(self.ioloop)
+            self._connect = lambda cb: LocalConnection(local_broker, cb)
+
+        else:
+            from pika.adapters.select_connection import IOLoop
+            self.ioloop = IOLoop()
+            params = pika.ConnectionParameters(host=host, port=port)
+            self._connect = lambda cb: pika.SelectConnection(params,
+                                                             on_open_callback=cb,
+                                                             stop_ioloop_on_close=False,
+                                                             custom_ioloop=self.ioloop)
+
+    def run(self):
+
+        try:
+
+            self.sampler.start()
+            self.connections = [self._connect(self.on_connection_open) for _ in range(self.num_conns)]
+            self.ioloop.start()
+
+            # The local ioloop also returns once it runs out of work
+            self.finish()
+
+        except KeyboardInterrupt:
+
+            print 'Async engine killed'
+            self.finish()
+
+        except Exception as ex:
+
+            print 'Unexpected error: %s'%ex
+            print traceback.format_exc()
+            self.finish()
+
+    def on_connection_open(self, connection):
+
+        self._opened += 1
+
+        if self._opened == self.num_conns:
+            self.connections[0].channel(on_open_callback=self.declare_queues)
+
+    def declare_queues(self, channel):
+
+        for q in range(self.num_queues):
+            channel.queue_declare(self.on_queue_declared, queue='queue_%s'%q)
+
+    def on_queue_declared(self, frame):
+
+        self._declared += 1
+
+        if self._declared < self.num_queues:
+            return
+
+        # Spread the logical workers round-robin over the connections, each
+        # worker gets its own channel
+        for ind in range(self.num_pop):
+            conn = self.connections[ind % self.num_conns]
+            conn.channel(on_open_callback=lambda ch, ind=ind: self.start_popper(ind, ch))
+
+        for ind in range(self.num_push):
+            conn = self.connections[ind % self.num_conns]
+            conn.channel(on_open_callback=lambda ch, ind=ind: self.push_slice(ind, ch, 0))
+
+        print 'Async workers created: %s push, %s pop over %s connections'%(self.num_push,
+                                                                            self.num_pop,
+                                                                            self.num_conns)
+
+    def push_slice(self, ind, channel, tasks_pushed):
+
+        # Publish a slice of messages and hand control back to the ioloop so
+        # the other workers sharing it get to run
+        name = 'queue_%s'%(ind%self.num_queues)
+        push_times = self.push_records[ind]
+
+        stop = min(tasks_pushed + PUSH_SLICE, self.push_quota)
+
+        while tasks_pushed < stop:
+
+            corr_id = str(uuid.uuid4())
+            obj = { 'task': self.t_dict, 'id': corr_id}
+
+            channel.basic_publish(  exchange='',
+                                    routing_key=name,
+                                    properties=pika.BasicProperties(correlation_id = corr_id,
+                                                                    headers = publish_headers(time.time())),
+                                    body=self.codec.encode(obj)
+                                )
+
+            tasks_pushed += 1
+            push_times.append(time.time())
+
+        if tasks_pushed < self.push_quota:
+            self.ioloop.add_timeout(0, lambda: self.push_slice(ind, channel, tasks_pushed))
+        else:
+            print 'Push %s: %s'%(ind, tasks_pushed)
+
+    def start_popper(self, ind, channel):
+
+        name = 'queue_%s'%(ind%self.num_queues)
+        pop_times = self.pop_records[ind]
+        hist = self.pop_latency[ind]
+        state = {'popped': 0, 'unacked': 0}
+        self._poppers[ind] = state
+
+        def on_message(ch, method_frame, props, body):
+
+            if self._finished:
+                return
+
+            recv_time = time.time()
+            obj = self.codec.decode(body)
+
+            state['unacked'] += 1
+            if state['unacked'] >= self.ack_every:
+                ch.basic_ack(delivery_tag = method_frame.delivery_tag, multiple=True)
+                state['unacked'] = 0
+
+            if obj['id'] == props.correlation_id:
+
+                state['popped'] += 1
+                self._popped += 1
+                pop_times.append(time.time())
+
+                ts = publish_time(props)
+                if ts is not None:
+                    hist.record(recv_time - ts)
+
+            if self._popped >= self.pop_total:
+
+                if state['unacked']:
+                    ch.basic_ack(delivery_tag = method_frame.delivery_tag, multiple=True)
+
+                self.finish()
+
+        channel.basic_qos(prefetch_count=self.prefetch)
+        channel.basic_consume(consumer_callback=on_message, queue=name)
+
+    def finish(self):
+
+        if self._finished:
+            return
+
+        self._finished = True
+
+        for ind, state in sorted(self._poppers.items()):
+            print 'Popper %s: %s'%(ind, state['popped'])
+
+        self.sampler.stop()
+
+        traces = self.push_records.values() + self.pop_records.values()
+        for trace in traces:
+            trace.close()
+
+        self.sampler.write_report(self.data + '/instr.txt', sum([len(t) for t in traces]),
+                                  record_cost(TraceWriter(os.devnull).append))
+
+        for ind, hist in self.pop_latency.items():
+            if hist.total:
+                write_histograms(self.data + '/pop_latency_%s'%ind,
+                                 {'queue_%s'%(ind%self.num_queues): hist})
+
+        for conn in getattr(self, 'connections', []):
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+        self.ioloop.stop()
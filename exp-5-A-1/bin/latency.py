@@ -0,0 +1,197 @@
+import os
+import glob
+from array import array
+
+# ------------------------------------------------------------------------------
+# Queue residence time of the push/pop benchmark.
+#
+# Pushers stamp every message with its publish time (header 'ts', in integer
+# usecs as AMQP tables in pika 0.x have no float type), poppers record receive
+# time minus publish time per task into a histogram per queue.
+# The histogram follows the HdrHistogram layout: values (usecs) below
+# 2**SUB_BITS get a bucket each, above that every power of two is split into
+# 2**(SUB_BITS-1) linear buckets, so any recorded value is known to within
+# 1/2**(SUB_BITS-1) of itself (< 1% with the default) at a fixed memory cost,
+# however long the run. Histograms of the same queue from different poppers
+# are merged by adding the counts.
+
+SUB_BITS = 8
+
+# Name of the AMQP header that carries the publish time
+TS_HEADER = 'ts'
+
+
+def bucket_index(value, sub_bits=SUB_BITS):
+
+    sub_count = 1 << sub_bits
+
+    if value < sub_count:
+        return value
+
+    half = sub_count >> 1
+    shift = value.bit_length() - sub_bits
+
+    return sub_count + (shift - 1)*half + ((value >> shift) - half)
+
+
+def bucket_value(index, sub_bits=SUB_BITS):
+
+    # Highest value that maps to bucket 'index'
+    sub_count = 1 << sub_bits
+
+    if index < sub_count:
+        return index
+
+    half = sub_count >> 1
+    shift = (index - sub_count)//half + 1
+    sub = (index - sub_count) % half + half
+
+    return ((sub + 1) << shift) - 1
+
+
+class LatencyHistogram(object):
+
+    def __init__(self, sub_bits=SUB_BITS):
+
+        self.sub_bits = sub_bits
+        self.counts = array('l')
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, seconds, count=1):
+
+        # Clock skew between hosts can make a residence time negative
+        value = max(int(seconds*1e6), 0)
+        ind = bucket_index(value, self.sub_bits)
+
+        if ind >= len(self.counts):
+            self.counts.extend([0]*(ind + 1 - len(self.counts)))
+
+        self.counts[ind] += count
+        self.total += count
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def add(self, other):
+
+        if other.sub_bits != self.sub_bits:
+            raise ValueError('can not merge histograms of different precision')
+
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0]*(len(other.counts) - len(self.counts)))
+
+        for ind, count in enumerate(other.counts):
+            self.counts[ind] += count
+
+        self.total += other.total
+
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+
+        # Secs, upper end of the bucket holding the pct'th value
+        if not self.total:
+            return 0.0
+
+        rank = max(int(round(pct/100.0*self.total)), 1)
+        seen = 0
+
+        for ind, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_value(ind, self.sub_bits), self.max)/1e6
+
+        return self.max/1e6
+
+    def mean(self):
+
+        if not self.total:
+            return 0.0
+
+        return sum([bucket_value(ind, self.sub_bits)*count
+                    for ind, count in enumerate(self.counts) if count])/1e6/self.total
+
+    def write(self, path):
+
+        # 'key value' header lines as in the other stats files, then one
+        # '<bucket> <count>' line per non-empty bucket
+        f = open(path,'w')
+        f.write('sub_bits %s\n'%self.sub_bits)
+        f.write('total %s\n'%self.total)
+        f.write('min %s\n'%(self.min or 0))
+        f.write('max %s\n'%self.max)
+        for ind, count in enumerate(self.counts):
+            if count:
+                f.write('%s %s\n'%(ind, count))
+        f.close()
+
+    @classmethod
+    def read(cls, path):
+
+        f = open(path,'r')
+        lines = [line.split() for line in f.readlines()]
+        f.close()
+
+        header = dict((key, int(val)) for key, val in lines[:4])
+        hist = cls(header['sub_bits'])
+        hist.min = header['min']
+        hist.max = header['max']
+
+        for ind, count in lines[4:]:
+            ind, count = int(ind), int(count)
+            if ind >= len(hist.counts):
+                hist.counts.extend([0]*(ind + 1 - len(hist.counts)))
+            hist.counts[ind] = count
+            hist.total += count
+
+        return hist
+
+
+def publish_headers(ts):
+
+    return {TS_HEADER: int(ts*1e6)}
+
+
+def publish_time(props):
+
+    headers = getattr(props, 'headers', None)
+    if not headers:
+        return None
+
+    ts = headers.get(TS_HEADER)
+    if ts is None:
+        return None
+
+    return ts/1e6
+
+
+def write_histograms(prefix, hists):
+
+    # One file per queue: <prefix>_<queue>.hist
+    for name, hist in hists.items():
+        hist.write('%s_%s.hist'%(prefix, name))
+
+
+def merge_histograms(data):
+
+    # Histograms of all poppers of one trial, by queue
+    merged = dict()
+
+    for path in glob.glob('%s/pop_latency_*.hist'%data):
+
+        # pop_latency_<ind>_<queue>.hist
+        name = os.path.basename(path)[:-len('.hist')].split('_', 3)[-1]
+        hist = LatencyHistogram.read(path)
+
+        if name in merged:
+            merged[name].add(hist)
+        else:
+            merged[name] = hist
+
+    return merged
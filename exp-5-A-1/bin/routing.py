@@ -0,0 +1,150 @@
+import zlib
+import itertools
+import multiprocessing as mp
+
+# ------------------------------------------------------------------------------
+# Mapping of pushers and poppers onto queues for the push/pop benchmark.
+#
+# Push side, per message:
+#   static       : the worker's own queue(s), the original ind % num_queues
+#   round-robin  : cycle through all queues
+#   hash         : crc32 of the correlation id
+#   least-loaded : the queue with the smallest depth, depths are refreshed from
+#                  the broker every LOAD_REFRESH messages and extrapolated with
+#                  what the pusher sent in between
+#
+# Pop side:
+#   static       : only the worker's own queue(s)
+#   steal        : the worker's own queue(s) first, the other queues when those
+#                  are empty
+#
+# Any number of queues works with any number of workers: when there are more
+# queues than workers, each worker owns every num_workers'th queue.
+
+PUSH_ROUTERS = ['static', 'round-robin', 'hash', 'least-loaded']
+POP_STRATEGIES = ['static', 'steal']
+
+LOAD_REFRESH = 100
+
+
+def queue_name(q):
+
+    return 'queue_%s'%q
+
+
+def home_queues(ind, num_workers, num_queues):
+
+    if num_queues > num_workers:
+        return [q for q in range(num_queues) if q % num_workers == ind]
+
+    return [ind % num_queues]
+
+
+class StaticRouter(object):
+
+    def __init__(self, ind, num_workers, num_queues, channel=None):
+
+        self.names = [queue_name(q) for q in home_queues(ind, num_workers, num_queues)]
+        self._cycle = itertools.cycle(self.names)
+
+    def route(self, corr_id):
+
+        return next(self._cycle)
+
+
+class RoundRobinRouter(object):
+
+    def __init__(self, ind, num_workers, num_queues, channel=None):
+
+        # Start at different queues so the pushers don't move in lockstep
+        order = range(ind % num_queues, num_queues) + range(ind % num_queues)
+        self._cycle = itertools.cycle([queue_name(q) for q in order])
+
+    def route(self, corr_id):
+
+        return next(self._cycle)
+
+
+class HashRouter(object):
+
+    def __init__(self, ind, num_workers, num_queues, channel=None):
+
+        self.names = [queue_name(q) for q in range(num_queues)]
+
+    def route(self, corr_id):
+
+        return self.names[(zlib.crc32(corr_id) & 0xffffffff) % len(self.names)]
+
+
+class LeastLoadedRouter(object):
+
+    def __init__(self, ind, num_workers, num_queues, channel=None):
+
+        self.channel = channel
+        self.names = [queue_name(q) for q in range(num_queues)]
+        self.depths = [0]*num_queues
+        self.sent = LOAD_REFRESH
+
+    def route(self, corr_id):
+
+        if self.sent >= LOAD_REFRESH:
+            self.depths = [self.channel.queue_depth(name) for name in self.names]
+            self.sent = 0
+
+        q = self.depths.index(min(self.depths))
+        self.depths[q] += 1
+        self.sent += 1
+
+        return self.names[q]
+
+
+ROUTERS = {
+    'static': StaticRouter,
+    'round-robin': RoundRobinRouter,
+    'hash': HashRouter,
+    'least-loaded': LeastLoadedRouter,
+}
+
+
+def get_router(name, ind, num_workers, num_queues, channel=None):
+
+    return ROUTERS[name](ind, num_workers, num_queues, channel)
+
+
+def pop_queues(ind, num_pop, num_queues, strategy='static'):
+
+    # (own queues, queues to steal from when the own ones are empty)
+    home = home_queues(ind, num_pop, num_queues)
+
+    if strategy != 'steal':
+        return [queue_name(q) for q in home], []
+
+    others = [q for q in range(num_queues) if q not in home]
+
+    # Every popper starts stealing at a different queue to avoid herding
+    if others:
+        k = ind % len(others)
+        others = others[k:] + others[:k]
+
+    return [queue_name(q) for q in home], [queue_name(q) for q in others]
+
+
+class PopQuota(object):
+
+    # Tasks popped by all poppers together. With routing strategies the load
+    # per queue is not known up front, so poppers stop once everything that
+    # was pushed has been popped instead of after a fixed share each.
+
+    def __init__(self, total):
+
+        self.total = total
+        self.count = mp.Value('l', 0)
+
+    def add(self, num):
+
+        with self.count.get_lock():
+            self.count.value += num
+
+    def done(self):
+
+        return self.count.value >= self.total
@@ -10,8 +10,15 @@ from pympler import asizeof
 import pika
 import traceback
 import uuid
-import json
-import psutil
+import glob
+import argparse
+from async_engine import AsyncEngine
+from sampler import MemorySampler, record_cost
+from tracefile import TraceWriter, read_trace
+from serializers import CODECS, get_codec, CodecStats
+from transport import BROKERS, get_channel
+from routing import PUSH_ROUTERS, POP_STRATEGIES, get_router, pop_queues, PopQuota
+from latency import LatencyHistogram, publish_headers, publish_time, write_histograms, merge_histograms
 
 kill_pusher = mp.Event()
 kill_popper = mp.Event()
@@ -20,45 +27,270 @@ MAX_TASKS=1048576
 
 #MAX_TASKS=1024
 
-def push_function(ind, num_push, num_queues):
+
+def percentile(vals, pct):
+
+    # Nearest-rank percentile of an already sorted list
+    if not vals:
+        return 0.0
+
+    rank = int(round(pct/100.0*(len(vals)-1)))
+    return vals[rank]
+
+
+def write_push_stats(ind, batch_size, tasks_pushed, pub_lat, start_time, stop_time):
+
+    # Per-process throughput and per-message publish latency for one batch size
+    pub_lat = sorted(pub_lat)
+    duration = stop_time - start_time
+
+    f = open(DATA + '/push_stats_%s.txt'%ind,'w')
+    f.write('batch_size %s\n'%batch_size)
+    f.write('tasks %s\n'%tasks_pushed)
+    f.write('messages %s\n'%len(pub_lat))
+    f.write('duration %s\n'%duration)
+    f.write('throughput %s\n'%(tasks_pushed/duration if duration > 0 else 0.0))
+    f.write('latency_mean %s\n'%(sum(pub_lat)/len(pub_lat) if pub_lat else 0.0))
+    f.write('latency_p50 %s\n'%percentile(pub_lat, 50))
+    f.write('latency_p99 %s\n'%percentile(pub_lat, 99))
+    f.close()
+
+
+def read_stats(path):
+
+    stats = dict()
+    f = open(path,'r')
+    for line in f.readlines():
+        key, val = line.strip().split(' ')
+        try:
+            stats[key] = float(val)
+        except ValueError:
+            stats[key] = val
+    f.close()
+
+    return stats
+
+
+def write_batch_summary(data_dirs):
+
+    # Aggregate the push stats of all procs into one line per batch size
+    f = open(os.path.join(OUT, 'batch_summary.txt'),'a')
+
+    for batch_size, data in data_dirs:
+
+        stats = [read_stats(path) for path in glob.glob('%s/push_stats_*.txt'%data)]
+
+        if not stats:
+            continue
+
+        tasks = sum([s['tasks'] for s in stats])
+        duration = max([s['duration'] for s in stats])
+
+        line = '%s %s %s %s %s %s'%(data,
+                                    batch_size,
+                                    tasks,
+                                    tasks/duration if duration > 0 else 0.0,
+                                    max([s['latency_p50'] for s in stats]),
+                                    max([s['latency_p99'] for s in stats]))
+        print 'Batch summary: %s'%line
+        f.write('%s\n'%line)
+
+    f.close()
+
+
+def write_codec_summary(data):
+
+    # Mean encode/decode cost and wire size per task over all workers
+    push = [read_stats(path) for path in glob.glob('%s/push_codec_*.txt'%data)]
+    pop = [read_stats(path) for path in glob.glob('%s/pop_codec_*.txt'%data)]
+
+    if not push or not pop:
+        return
+
+    line = '%s %s %s %s %s'%(data,
+                             push[0]['codec'],
+                             sum([s['ns_per_task'] for s in push])/len(push),
+                             sum([s['ns_per_task'] for s in pop])/len(pop),
+                             sum([s['bytes_per_task'] for s in push])/len(push))
+    print 'Codec summary: %s'%line
+
+    f = open(os.path.join(OUT, 'codec_summary.txt'),'a')
+    f.write('%s\n'%line)
+    f.close()
+
+
+def write_latency_summary(data):
+
+    # Queue residence time percentiles per queue and over all queues next to
+    # the end-to-end throughput of the trial
+    merged = merge_histograms(data)
+
+    if not merged:
+        return
+
+    total = LatencyHistogram()
+    for hist in merged.values():
+        total.add(hist)
+
+    pcts = [50, 90, 99, 99.9]
+
+    f = open(data + '/latency.txt','w')
+    f.write('# queue tasks mean p50 p90 p99 p99.9 max (secs)\n')
+    for name in sorted(merged) + ['all']:
+        hist = merged.get(name, total)
+        f.write('%s %s %s %s %s\n'%(name, hist.total, hist.mean(),
+                                    ' '.join([str(hist.percentile(p)) for p in pcts]),
+                                    hist.max/1e6))
+    f.close()
+
+    push = [read_trace(path)['time'] for path in glob.glob('%s/push_*.trc'%data)]
+    pop = [read_trace(path)['time'] for path in glob.glob('%s/pop_*.trc'%data)]
+
+    push = [t for t in push if len(t)]
+    pop = [t for t in pop if len(t)]
+
+    throughput = 0.0
+    if push and pop:
+        duration = max([t[-1] for t in pop]) - min([t[0] for t in push])
+        throughput = sum([len(t) for t in pop])/duration if duration > 0 else 0.0
+
+    line = '%s %s %s %s'%(data, total.total, throughput,
+                          ' '.join([str(total.percentile(p)) for p in pcts]))
+    print 'Latency summary: %s'%line
+
+    f = open(os.path.join(OUT, 'latency_summary.txt'),'a')
+    f.write('%s\n'%line)
+    f.close()
+
+
+def monitor_depths(mq_channel, num_queues, procs, interval):
+
+    # Per-queue depth over time while the workers run, one line per sample:
+    # '<time> <depth queue_0> <depth queue_1> ...'
+    f = open(DATA + '/depth.txt','w')
+
+    while [p for p in procs if p.is_alive()]:
+
+        depths = [mq_channel.queue_depth('queue_%s'%q) for q in range(num_queues)]
+        f.write('%s %s\n'%(time.time(), ' '.join([str(d) for d in depths])))
+        f.flush()
+
+        time.sleep(interval)
+
+    f.close()
+
+
+def close_records(prefix, ind, trace, sampler, codec_stats, hists=None):
+
+    # Take a last memory sample, flush the rest of the trace and report what
+    # the instrumentation and the codec cost
+    sampler.stop()
+    trace.close()
+    codec_stats.write(DATA + '/%s_codec_%s.txt'%(prefix, ind))
+
+    if hists:
+        write_histograms(DATA + '/%s_latency_%s'%(prefix, ind), hists)
+
+    sampler.write_report(DATA + '/%s_instr_%s.txt'%(prefix, ind), len(trace),
+                         record_cost(TraceWriter(os.devnull).append))
+
+
+def push_batches(mq_channel, router, t_dict, proc_tasks, batch_size, push_times, pub_lat, codec, codec_stats):
+
+    # The codec serializes the static task body once, every message only adds
+    # the ids of the tasks it carries. Ids are a per-process prefix plus a
+    # counter, which keeps them unique without a uuid4 call per task.
+    prefix = str(uuid.uuid4())
+
+    tasks_pushed = 0
+
+    while (tasks_pushed < proc_tasks)and(not kill_pusher.is_set()):
+
+        num_items = min(batch_size, proc_tasks - tasks_pushed)
+        ids = ['%s.%s'%(prefix, tasks_pushed + i) for i in range(num_items)]
+
+        start = time.time()
+        body = codec.encode_batch(t_dict, ids)
+        codec_stats.add(time.time() - start, len(body), num_items)
+
+        start = time.time()
+        mq_channel.basic_publish(   exchange='',
+                                    routing_key=router.route(ids[0]),
+                                    properties=pika.BasicProperties(correlation_id = ids[0],
+                                                                    headers = publish_headers(start)),
+                                    body=body
+                                )
+        cur_time = time.time()
+
+        pub_lat.append(cur_time - start)
+        tasks_pushed += num_items
+
+        push_times.extend([cur_time]*num_items)
+
+    return tasks_pushed
+
+
+def get_task_dict(payload=0):
+
+    t = Task()
+    t.arguments = ["--template=PLCpep7_template.mdp",
+                    "--newname=PLCpep7_run.mdp",
+                    "--wldelta=100",
+                    "--equilibrated=False",
+                    "--lambda_state=0",
+                    "--seed=1"]
+
+    t.cores = 20
+    t.copy_input_data = ['$STAGE_2_TASK_1/PLCpep7.tpr']
+    t.download_output_data = ['PLCpep7.xtc > PLCpep7_run1_gen0.xtc',
+                                'PLCpep7.log > PLCpep7_run1_gen0.log',
+                                'PLCpep7_dhdl.xvg > PLCpep7_run1_gen0_dhdl.xvg',
+                                'PLCpep7_pullf.xvg > PLCpep7_run1_gen0_pullf.xvg',
+                                'PLCpep7_pullx.xvg > PLCpep7_run1_gen0_pullx.xvg',
+                                'PLCpep7.gro > PLCpep7_run1_gen0.gro'
+                            ]
+
+    # Pad the task with an extra argument of 'payload' bytes
+    if payload:
+        t.arguments = t.arguments + ['--payload=%s'%('x'*payload)]
+
+    return t.to_dict()
+
+
+def push_function(ind, num_push, num_queues, batch_size=None, codec_name='json', schema=None, mq=None,
+                  router_name='static', payload=0):
 
     try:
 
-        mq_connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost', port=32769))
-        mq_channel = mq_connection.channel()
-       
         tasks_pushed = 0
         global MAX_TASKS
 
         proc_tasks = MAX_TASKS/num_push
 
-        push_times = []
-        proc_mem = []
-        t = Task()
-        t.arguments = ["--template=PLCpep7_template.mdp",
-                        "--newname=PLCpep7_run.mdp",
-                        "--wldelta=100",
-                        "--equilibrated=False",
-                        "--lambda_state=0",
-                        "--seed=1"]
-
-        t.cores = 20
-        t.copy_input_data = ['$STAGE_2_TASK_1/PLCpep7.tpr']
-        t.download_output_data = ['PLCpep7.xtc > PLCpep7_run1_gen0.xtc',
-                                    'PLCpep7.log > PLCpep7_run1_gen0.log',
-                                    'PLCpep7_dhdl.xvg > PLCpep7_run1_gen0_dhdl.xvg',
-                                    'PLCpep7_pullf.xvg > PLCpep7_run1_gen0_pullf.xvg',
-                                    'PLCpep7_pullx.xvg > PLCpep7_run1_gen0_pullx.xvg',
-                                    'PLCpep7.gro > PLCpep7_run1_gen0.gro'
-                                ]
-
-
-        t_dict = t.to_dict()
+        pub_lat = []
+        t_dict = get_task_dict(payload)
+
+        codec = get_codec(codec_name, schema)
+        codec_stats = CodecStats(codec)
+
+        sampler = MemorySampler()
+        sampler.start()
+
+        # Records are streamed to disk while the run is going
+        push_times = TraceWriter(DATA + '/push_%s.trc'%ind, sampler)
+
+        mq_channel = get_channel(**(mq or {}))
 
         print 'Size of task: ', asizeof.asizeof(t_dict)
 
 
-        name = 'queue_%s'%(ind%num_queues)
+        router = get_router(router_name, ind, num_push, num_queues, mq_channel)
+
+        start_time = time.time()
+
+        if batch_size:
+            tasks_pushed = push_batches(mq_channel, router, t_dict, proc_tasks, batch_size,
+                                        push_times, pub_lat, codec, codec_stats)
 
         while (tasks_pushed < proc_tasks)and(not kill_pusher.is_set()):            
 
@@ -66,29 +298,29 @@ def push_function(ind, num_push, num_queues):
 
             obj = { 'task': t_dict, 'id': corr_id}
 
+            start = time.time()
+            body = codec.encode(obj)
+            codec_stats.add(time.time() - start, len(body), 1)
+
             mq_channel.basic_publish(   exchange='',
-                                        routing_key=name,
-                                        properties=pika.BasicProperties(correlation_id = corr_id),
-                                        body=json.dumps(obj)
+                                        routing_key=router.route(corr_id),
+                                        properties=pika.BasicProperties(correlation_id = corr_id,
+                                                                        headers = publish_headers(time.time())),
+                                        body=body
                                     )
 
             tasks_pushed +=1
-            cur_time = time.time()
-
-            push_times.append(cur_time)
-            mem = psutil.virtual_memory().available/(2**20) # MBytes
-            proc_mem.append(mem)
+            push_times.append(time.time())
 
             #    print '%s: Push average throughput: %s tasks/sec'%(name, 
             #        float(tasks_pushed/(cur_time - start_time)))       
     
         print 'Push: ',tasks_pushed
 
-        f = open(DATA + '/push_%s.txt'%ind,'w')
-        for i in range(len(push_times)):
-            f.write('%s %s\n'%(push_times[i],proc_mem[i]))
-            #f.write('%s\n'%(push_times[ind]))
-        f.close()
+        if batch_size:
+            write_push_stats(ind, batch_size, tasks_pushed, pub_lat, start_time, time.time())
+
+        close_records('push', ind, push_times, sampler, codec_stats)
 
         print 'Push proc killed'
 
@@ -98,10 +330,7 @@ def push_function(ind, num_push, num_queues):
 
         print len(push_times)
 
-        f = open(DATA + '/push_%s.txt'%ind,'w')
-        for i in range(min(len(push_times),len(proc_mem))):
-            f.write('%s %s\n'%(push_times[i], proc_mem[i]))
-        f.close()
+        close_records('push', ind, push_times, sampler, codec_stats)
 
         print 'Push proc killed'
 
@@ -110,61 +339,160 @@ def push_function(ind, num_push, num_queues):
         print 'Unexpected error: %s'%ex
         print traceback.format_exc()
 
-        f = open(DATA + '/push_%s.txt'%ind,'w')
-        for i in range(min(len(push_times), len(proc_mem))):
-            f.write('%s %s\n'%(push_times[i], proc_mem[i]))
-        f.close()
+        close_records('push', ind, push_times, sampler, codec_stats)
 
         
 
 
 
-def pop_function(ind, num_pop, num_queues):
+def tasks_in_message(obj, props):
+
+    # Number of tasks carried by a decoded message, 0 if it is not ours
+    if 'ids' in obj:
+        return len(obj['ids'])
+
+    if obj['id'] == props.correlation_id:
+        return 1
+
+    return 0
+
+
+def record_latency(hists, name, props, recv_time, num_items):
+
+    # Queue residence time of every task in the message
+    ts = publish_time(props)
+
+    if ts is not None:
+        if name not in hists:
+            hists[name] = LatencyHistogram()
+        hists[name].record(recv_time - ts, num_items)
+
+
+def consume_tasks(mq_channel, name, quota, prefetch, ack_every, pop_times, codec, codec_stats, hists):
+
+    # Push model: the broker streams up to 'prefetch' unacked messages to us
+    # and we acknowledge them cumulatively every 'ack_every' deliveries. The
+    # inactivity timeout lets us notice kill_popper on an idle queue without
+    # spinning.
+    mq_channel.basic_qos(prefetch_count=prefetch)
+
+    # The broker stops delivering once 'prefetch' messages are unacked
+    ack_every = min(ack_every, prefetch)
+
+    tasks_popped = 0
+    unacked = 0
+    last_tag = None
+
+    for method_frame, props, body in mq_channel.consume(queue=name, inactivity_timeout=1):
+
+        if kill_popper.is_set() or quota.done():
+            break
+
+        if method_frame is None:
+            continue
+
+        recv_time = start = time.time()
+        obj = codec.decode(body)
+        seconds = time.time() - start
+
+        num_items = tasks_in_message(obj, props)
+        codec_stats.add(seconds, len(body), num_items)
+
+        last_tag = method_frame.delivery_tag
+        unacked += 1
+
+        if unacked >= ack_every:
+            mq_channel.basic_ack(delivery_tag = last_tag, multiple=True)
+            unacked = 0
+
+        if num_items:
+
+            record_latency(hists, name, props, recv_time, num_items)
+
+            tasks_popped += num_items
+            pop_times.extend([time.time()]*num_items)
+            quota.add(num_items)
+
+    if unacked:
+        mq_channel.basic_ack(delivery_tag = last_tag, multiple=True)
+
+    # Prefetched but unprocessed messages go back to the queue
+    mq_channel.cancel()
+
+    return tasks_popped
+
+
+def pop_function(ind, num_pop, num_queues, pop_mode='poll', prefetch=100, ack_every=10,
+                 codec_name='json', schema=None, mq=None, pop_strategy='static', quota=None):
 
     try:
 
         start_time = time.time()
 
         tasks_popped=0
-        global MAX_TASKS
 
-        proc_tasks = MAX_TASKS/num_pop
+        codec = get_codec(codec_name, schema)
+        codec_stats = CodecStats(codec)
+
+        sampler = MemorySampler()
+        sampler.start()
+
+        # Records are streamed to disk while the run is going
+        pop_times = TraceWriter(DATA + '/pop_%s.trc'%ind, sampler)
+
+        # Queue residence time, by queue
+        hists = dict()
+
+        mq_channel = get_channel(**(mq or {}))
 
-        pop_times = []
-        proc_mem = []
+        # Own queues, and the ones to steal from when those are empty
+        home, victims = pop_queues(ind, num_pop, num_queues, pop_strategy)
 
-        mq_connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost', port=32769))
-        mq_channel = mq_connection.channel()
+        if pop_mode == 'consume':
+            tasks_popped = consume_tasks(mq_channel, home[0], quota, prefetch, ack_every,
+                                         pop_times, codec, codec_stats, hists)
 
-        name = 'queue_%s'%(ind%num_queues)
+        while (not quota.done())and(not kill_popper.is_set()):
 
-        while (tasks_popped < proc_tasks)and(not kill_popper.is_set()):
+            got = 0
 
-            method_frame, props, body = mq_channel.basic_get(queue=name)       
+            for name in home + victims:
 
-            if body:
+                if got and name not in home:
+                    break
 
-                obj = json.loads(body)
+                method_frame, props, body = mq_channel.basic_get(queue=name)       
 
-                if obj['id'] == props.correlation_id:
+                if not body:
+                    continue
+
+                recv_time = start = time.time()
+                obj = codec.decode(body)
+                seconds = time.time() - start
+
+                num_items = tasks_in_message(obj, props)
+
+                if num_items:
+
+                    codec_stats.add(seconds, len(body), num_items)
+                    record_latency(hists, name, props, recv_time, num_items)
 
                     mq_channel.basic_ack(delivery_tag = method_frame.delivery_tag)
 
-                    tasks_popped +=1
-                    cur_time = time.time()
+                    tasks_popped += num_items
+                    pop_times.extend([time.time()]*num_items)
+                    quota.add(num_items)
 
-                    pop_times.append(cur_time)                
-                    mem = psutil.virtual_memory().available/(2**20) # MBytes
-                    proc_mem.append(mem)
+                    got += num_items
+
+                    # A stolen message is enough, go back to the own queues
+                    if name not in home:
+                        break
             
 
         print 'Popper: ', tasks_popped
 
-        f = open(DATA + '/pop_%s.txt'%ind,'w')
-
-        for i in range(len(pop_times)):
-            f.write('%s %s\n'%(pop_times[i], proc_mem[i]))
-        f.close()
+        close_records('pop', ind, pop_times, sampler, codec_stats, hists)
 
         print 'Pop proc killed'
 
@@ -173,10 +501,7 @@ def pop_function(ind, num_pop, num_queues):
 
         print len(pop_times)
 
-        f = open(DATA + '/pop_%s.txt'%name,'w')
-        for i in range(min(len(pop_times), len(proc_mem))):
-            f.write('%s %s\n'%(pop_times[i], proc_mem[i]))
-        f.close()
+        close_records('pop', ind, pop_times, sampler, codec_stats, hists)
 
         print 'Pop proc killed'
 
@@ -185,40 +510,128 @@ def pop_function(ind, num_pop, num_queues):
         print 'Unexpected error: %s'%ex
         print traceback.format_exc()
 
-        f = open(DATA + '/pop_%s.txt'%name,'w')
-        for i in range(min(len(pop_times), len(proc_mem))):
-            f.write('%s %s\n'%(pop_times[i], proc_mem[i]))
-        f.close()
+        close_records('pop', ind, pop_times, sampler, codec_stats, hists)
 
         print 'Unexpected error: %s'%ex
 
 
 if __name__ == '__main__':
 
-    
-    if len(sys.argv) != 4:
-        print 'Usage: python runme.py <push procs> <pull procs> <num_queues>'
+    parser = argparse.ArgumentParser(usage='python runme.py <push procs> <pull procs> <num_queues> [options]')
+    parser.add_argument('num_push_procs', type=int)
+    parser.add_argument('num_pop_procs', type=int)
+    parser.add_argument('num_queues', type=int)
+    parser.add_argument('--batch-size', default=None,
+                        help='comma separated list of tasks per AMQP message, e.g. 1,16,256. '
+                             'Without it every task is published as its own message.')
+    parser.add_argument('--pop-mode', choices=['poll', 'consume'], default='poll',
+                        help='poll: basic_get + per-message ack (default), '
+                             'consume: basic_consume with prefetch and multi-ack')
+    parser.add_argument('--prefetch', type=int, default=100,
+                        help='prefetch_count of the consumer in consume mode')
+    parser.add_argument('--ack-every', type=int, default=10,
+                        help='acknowledge cumulatively every K deliveries in consume mode')
+    parser.add_argument('--engine', choices=['process', 'async'], default='process',
+                        help='process: one process and connection per pusher/popper (default), '
+                             'async: all pushers/poppers multiplexed in this process')
+    parser.add_argument('--connections', type=int, default=2,
+                        help='number of AMQP connections shared by the async engine')
+    parser.add_argument('--broker', choices=BROKERS, default='rabbitmq',
+                        help='local: run without RabbitMQ, on multiprocessing queues (process engine) '
+                             'or an in-process broker (async engine)')
+    parser.add_argument('--host', default='localhost', help='RabbitMQ host')
+    parser.add_argument('--port', type=int, default=32769, help='RabbitMQ port')
+    parser.add_argument('--codec', choices=sorted(CODECS), default='json',
+                        help='wire format of the task messages')
+    parser.add_argument('--push-router', choices=PUSH_ROUTERS, default='static',
+                        help='how pushers pick a queue for every message')
+    parser.add_argument('--pop-strategy', choices=POP_STRATEGIES, default='static',
+                        help='steal: poppers take from other queues when their own are empty')
+    parser.add_argument('--depth-interval', type=float, default=0.5,
+                        help='secs between samples of the per-queue depth (depth.txt)')
+    parser.add_argument('--tasks', type=int, default=None,
+                        help='total number of tasks pushed (default %s)'%MAX_TASKS)
+    parser.add_argument('--payload', type=int, default=0,
+                        help='extra bytes added to every task description')
+    parser.add_argument('--trials', type=int, default=3, help='last trial to run')
+    parser.add_argument('--first-trial', type=int, default=2, help='first trial to run')
+    parser.add_argument('--out', default='.', help='directory the trial directories are created in')
+    args = parser.parse_args()
+
+    # Task keys shared by both sides of the schema codec. Building the codec
+    # here also fails early if e.g. msgpack is not installed.
+    schema = sorted(get_task_dict().keys())
+    get_codec(args.codec, schema)
+
+    if args.engine == 'async' and (args.batch_size or args.pop_mode != 'poll' or
+                                   args.push_router != 'static' or args.pop_strategy != 'static'):
+        print '--batch-size, --pop-mode, --push-router and --pop-strategy apply to the process engine only'
         sys.exit(1)
 
-    num_push_procs = int(sys.argv[1])
-    num_pop_procs = int(sys.argv[2])
-    num_queues = int(sys.argv[3])
+    # An async popper only reads queue_<ind % num_queues>, every queue that is
+    # pushed to needs one
+    unread = (set(range(min(args.num_push_procs, args.num_queues))) -
+              set(range(min(args.num_pop_procs, args.num_queues))))
+    if args.engine == 'async' and unread:
+        print 'Async engine: no popper reads %s, use at least as many poppers as queues'%(
+            ', '.join(['queue_%s'%q for q in sorted(unread)]))
+        sys.exit(1)
 
-    if num_queues > num_push_procs or num_queues > num_pop_procs:
-        print 'Too many queues'
+    if args.pop_mode == 'consume' and (args.num_queues > args.num_pop_procs or args.pop_strategy == 'steal'):
+        print 'A consume mode popper reads exactly one queue: no stealing, at most one queue per popper'
         sys.exit(1)
 
+    num_push_procs = args.num_push_procs
+    num_pop_procs = args.num_pop_procs
+    num_queues = args.num_queues
 
-    trials=3
+    if args.batch_size:
+        batch_sizes = [int(b) for b in args.batch_size.split(',')]
+    else:
+        batch_sizes = [None]
 
-    mq_connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost', port=32769))
-    mq_channel = mq_connection.channel()
+
+    trials = args.trials
+    if args.tasks:
+        MAX_TASKS = args.tasks
+    OUT = args.out
+
+    mq = {'broker': args.broker, 'host': args.host, 'port': args.port}
+
+    # The async engine brings its own in-process broker
+    mq_channel = None
+    if not (args.engine == 'async' and args.broker == 'local'):
+        mq_channel = get_channel(**mq)
 
     try:
 
-        for i in range(2, trials+1):
+        data_dirs = list()
+
+        for i, batch_size in [(i, b) for b in batch_sizes for i in range(args.first_trial, trials+1)]:
+
+            DATA = os.path.join(OUT, 'push_%s_pop_%s_q_%s_trial_%s'%(num_push_procs, num_pop_procs, num_queues,i))
+
+            if args.tasks or args.payload:
+                DATA += '_tasks_%s_payload_%s'%(MAX_TASKS, args.payload)
+
+            if args.pop_mode == 'consume':
+                DATA += '_consume_pf_%s_ack_%s'%(args.prefetch, args.ack_every)
+
+            if args.engine == 'async':
+                DATA += '_async_conn_%s'%args.connections
 
-            DATA = './push_%s_pop_%s_q_%s_trial_%s'%(num_push_procs, num_pop_procs, num_queues,i)
+            if args.broker != 'rabbitmq':
+                DATA += '_%s'%args.broker
+
+            if args.codec != 'json':
+                DATA += '_codec_%s'%args.codec
+
+            if args.push_router != 'static' or args.pop_strategy != 'static':
+                DATA += '_route_%s_%s'%(args.push_router, args.pop_strategy)
+
+            if batch_size:
+                DATA += '_batch_%s'%batch_size
+                data_dirs.append((batch_size, DATA))
 
             try:
                 shutil.rmtree(DATA)
@@ -237,15 +650,36 @@ if __name__ == '__main__':
                 cur_q = t   # index of queue to be used
                 name = 'queue_%s'%(t)
 
-                mq_channel.queue_delete(queue=name)
-                mq_channel.queue_declare(queue=name)
-
+                if mq_channel:
+                    mq_channel.queue_delete(queue=name)
+                    mq_channel.queue_declare(queue=name)
+
+            if args.engine == 'async':
+
+                engine = AsyncEngine(DATA, get_task_dict(args.payload),
+                                     num_push_procs, num_pop_procs, num_queues, MAX_TASKS,
+                                     num_conns=args.connections,
+                                     prefetch=args.prefetch,
+                                     ack_every=args.ack_every,
+                                     broker=args.broker,
+                                     host=args.host,
+                                     port=args.port,
+                                     codec=get_codec(args.codec, schema))
+                engine.run()
+                write_latency_summary(DATA)
+                continue
                 
+            # Poppers stop once everything pushed has been popped
+            quota = PopQuota((MAX_TASKS/num_push_procs)*num_push_procs)
+
             for t in range(num_pop_procs):
 
                 name = 'pop_%s'%t
                 #t1 = procing.Thread(target=pop_function, args=(q_list[cur_q],name), name=name)
-                t1 = Process(target=pop_function, args=(t,num_pop_procs, num_queues), name=name)
+                t1 = Process(target=pop_function, args=(t,num_pop_procs, num_queues,
+                                                        args.pop_mode, args.prefetch, args.ack_every,
+                                                        args.codec, schema, mq,
+                                                        args.pop_strategy, quota), name=name)
                 t1.start()
                 pop_procs.append(t1)
 
@@ -254,19 +688,28 @@ if __name__ == '__main__':
             for t in range(num_push_procs):
 
                 name = 'push_%s'%t
-                t2 = Process(target=push_function, args=(t, num_push_procs, num_queues), name=name)
+                t2 = Process(target=push_function, args=(t, num_push_procs, num_queues, batch_size,
+                                                         args.codec, schema, mq,
+                                                         args.push_router, args.payload), name=name)
                 t2.start()
                 push_procs.append(t2)
 
         
             print 'Push procs created'
 
+            monitor_depths(mq_channel, num_queues, push_procs + pop_procs, args.depth_interval)
+
             for t in push_procs:
                 t.join()
 
             for t in pop_procs:
                 t.join()
 
+            write_codec_summary(DATA)
+            write_latency_summary(DATA)
+
+        write_batch_summary(data_dirs)
+
     except KeyboardInterrupt:
         print 'Main process killed'
         kill_pusher.set()
@@ -0,0 +1,137 @@
+import time
+import threading
+import psutil
+from array import array
+
+# ------------------------------------------------------------------------------
+# Off the hot path memory instrumentation for the push/pop benchmark.
+#
+# Calling psutil.virtual_memory() after every message costs a syscall and a
+# /proc/meminfo parse per message. Instead a background thread samples the
+# available memory at a fixed interval into a preallocated ring buffer, the hot
+# loops only append a timestamp to an array('d'), and both are merged when the
+# records are written.
+
+# Default sampling interval (secs) and ring capacity (samples)
+SAMPLE_INTERVAL = 0.01
+SAMPLE_CAPACITY = 2**16
+
+
+def available_memory():
+
+    return psutil.virtual_memory().available/(2**20) # MBytes
+
+
+class MemorySampler(threading.Thread):
+
+    def __init__(self, interval=SAMPLE_INTERVAL, capacity=SAMPLE_CAPACITY):
+
+        threading.Thread.__init__(self, name='memory-sampler')
+        self.daemon = True
+
+        self.interval = interval
+        self.capacity = capacity
+
+        self.times = array('d', [0.0])*capacity
+        self.values = array('d', [0.0])*capacity
+        self.count = 0
+
+        # Time spent taking samples, i.e. what the sampler costs in total
+        self.busy = 0.0
+
+        self._halt = threading.Event()
+
+    def run(self):
+
+        while not self._halt.is_set():
+            self.sample()
+            self._halt.wait(self.interval)
+
+    def sample(self):
+
+        start = time.time()
+        mem = available_memory()
+
+        ind = self.count % self.capacity
+        self.times[ind] = start
+        self.values[ind] = mem
+        self.count += 1
+
+        self.busy += time.time() - start
+
+    def stop(self):
+
+        if self.is_alive():
+            self._halt.set()
+            self.join()
+
+        # Close the series so that the last records have a sample to map to
+        self.sample()
+
+    def samples(self):
+
+        # Chronological content of the ring buffer
+        if self.count <= self.capacity:
+            return self.times[:self.count], self.values[:self.count]
+
+        head = self.count % self.capacity
+        return (self.times[head:] + self.times[:head],
+                self.values[head:] + self.values[:head])
+
+    def values_at(self, timestamps):
+
+        # For every timestamp the latest sample taken at or before it. Records
+        # older than the oldest sample left in the ring map to that sample.
+        times, values = self.samples()
+        out = array('d')
+
+        if not len(times):
+            out.extend([0.0]*len(timestamps))
+            return out
+
+        cur = 0
+        last = len(times) - 1
+
+        for ts in timestamps:
+
+            if cur and times[cur] > ts:
+                cur = 0
+
+            while cur < last and times[cur+1] <= ts:
+                cur += 1
+
+            out.append(values[cur])
+
+        return out
+
+    def dropped(self):
+
+        return max(0, self.count - self.capacity)
+
+    def write_report(self, path, events, record_cost):
+
+        # What the instrumentation itself cost during the run
+        f = open(path,'w')
+        f.write('events %s\n'%events)
+        f.write('record_cost_per_event %s\n'%record_cost)
+        f.write('record_cost_total %s\n'%(record_cost*events))
+        f.write('samples %s\n'%self.count)
+        f.write('samples_dropped %s\n'%self.dropped())
+        f.write('sampler_busy %s\n'%self.busy)
+        f.write('sample_cost %s\n'%(self.busy/self.count if self.count else 0.0))
+        f.close()
+
+
+def record_cost(sink=None, n=100000):
+
+    # Per event cost of the hot loop instrumentation: one time.time() call
+    # plus handing it to 'sink' (an array append by default)
+    if sink is None:
+        sink = array('d').append
+
+    start = time.time()
+
+    for _ in xrange(n):
+        sink(time.time())
+
+    return (time.time() - start)/n
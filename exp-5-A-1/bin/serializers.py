@@ -0,0 +1,180 @@
+import json
+import cPickle as pickle
+
+# ------------------------------------------------------------------------------
+# Wire formats for the task messages of the push/pop benchmark.
+#
+# A message is a dict holding the task description under 'task' and either a
+# single correlation id under 'id' or a batch of them under 'ids'. Every codec
+# turns such a dict into a string and back, so the choice of codec is the only
+# thing that changes between runs.
+
+
+class JsonCodec(object):
+
+    name = 'json'
+
+    def __init__(self, schema=None):
+
+        self._task_body = dict()
+
+    def encode(self, obj):
+
+        return json.dumps(obj)
+
+    def decode(self, body):
+
+        return json.loads(body)
+
+    def encode_batch(self, t_dict, ids):
+
+        # The static task body is serialized once, a batch only adds its ids
+        key = id(t_dict)
+        if key not in self._task_body:
+            self._task_body[key] = json.dumps(t_dict)
+
+        return '{"task": %s, "ids": %s}'%(self._task_body[key], json.dumps(ids))
+
+
+class PickleCodec(object):
+
+    # Python 2 tops out at pickle protocol 2, protocol 5 (out-of-band buffers)
+    # needs Python 3.8
+
+    name = 'pickle'
+
+    def __init__(self, schema=None):
+
+        pass
+
+    def encode(self, obj):
+
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, body):
+
+        return pickle.loads(body)
+
+    def encode_batch(self, t_dict, ids):
+
+        return self.encode({'task': t_dict, 'ids': ids})
+
+
+class MsgpackCodec(object):
+
+    name = 'msgpack'
+
+    def __init__(self, schema=None):
+
+        try:
+            import msgpack
+        except ImportError:
+            raise RuntimeError('msgpack codec requires the msgpack package')
+
+        self._packb = msgpack.packb
+        self._unpackb = msgpack.unpackb
+
+    def encode(self, obj):
+
+        return self._packb(obj, use_bin_type=True)
+
+    def decode(self, body):
+
+        return self._unpackb(body, raw=False)
+
+    def encode_batch(self, t_dict, ids):
+
+        return self.encode({'task': t_dict, 'ids': ids})
+
+
+class SchemaCodec(object):
+
+    # Both sides agree on the task keys up front, so a message only carries
+    # the values in schema order: [[value, ...], id or [ids]]
+
+    name = 'schema'
+
+    def __init__(self, schema=None):
+
+        if not schema:
+            raise RuntimeError('schema codec requires the list of task keys')
+
+        self.keys = list(schema)
+        self._task_values = dict()
+
+    def encode(self, obj):
+
+        task = obj['task']
+        values = [task[k] for k in self.keys]
+
+        return json.dumps([values, obj['ids'] if 'ids' in obj else obj['id']],
+                          separators=(',', ':'))
+
+    def decode(self, body):
+
+        values, ids = json.loads(body)
+        obj = {'task': dict(zip(self.keys, values))}
+
+        if isinstance(ids, list):
+            obj['ids'] = ids
+        else:
+            obj['id'] = ids
+
+        return obj
+
+    def encode_batch(self, t_dict, ids):
+
+        key = id(t_dict)
+        if key not in self._task_values:
+            self._task_values[key] = json.dumps([t_dict[k] for k in self.keys],
+                                                separators=(',', ':'))
+
+        return '[%s,%s]'%(self._task_values[key], json.dumps(ids, separators=(',', ':')))
+
+
+CODECS = {
+    JsonCodec.name: JsonCodec,
+    PickleCodec.name: PickleCodec,
+    MsgpackCodec.name: MsgpackCodec,
+    SchemaCodec.name: SchemaCodec,
+}
+
+
+def get_codec(name, schema=None):
+
+    if name not in CODECS:
+        raise ValueError('unknown codec %s, choose from %s'%(name, ', '.join(sorted(CODECS))))
+
+    return CODECS[name](schema)
+
+
+class CodecStats(object):
+
+    # Accumulates (de)serialization time and wire bytes of one worker
+
+    def __init__(self, codec):
+
+        self.codec = codec
+        self.seconds = 0.0
+        self.nbytes = 0
+        self.messages = 0
+        self.tasks = 0
+
+    def add(self, seconds, nbytes, tasks):
+
+        self.seconds += seconds
+        self.nbytes += nbytes
+        self.messages += 1
+        self.tasks += tasks
+
+    def write(self, path):
+
+        tasks = max(self.tasks, 1)
+
+        f = open(path,'w')
+        f.write('codec %s\n'%self.codec.name)
+        f.write('messages %s\n'%self.messages)
+        f.write('tasks %s\n'%self.tasks)
+        f.write('ns_per_task %s\n'%(1e9*self.seconds/tasks))
+        f.write('bytes_per_task %s\n'%(float(self.nbytes)/tasks))
+        f.close()
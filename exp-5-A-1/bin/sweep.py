@@ -0,0 +1,245 @@
+import os
+import re
+import sys
+import csv
+import glob
+import zlib
+import argparse
+import itertools
+import subprocess
+import numpy as np
+from tracefile import read_trace
+from latency import LatencyHistogram, merge_histograms
+
+# ------------------------------------------------------------------------------
+# Parameter sweep over runme.py.
+#
+# Every (push, pop, queues, tasks, payload) point is run for the requested
+# number of trials, one runme.py invocation per trial, and every trial is
+# reduced to one row of a tidy results table (results.csv in the output
+# directory). Rows that already exist are not run again, so an interrupted
+# sweep resumes where it stopped. Options runme.py knows but this script does
+# not (e.g. --broker local --codec schema) are passed through and recorded in
+# the 'config' column, a run with --batch-size 64,256 gives one row per batch
+# size ('batch', empty without batching). mem_avail_swing_mb is how much the
+# available memory of the node (what the traces sample) moved during the
+# trial, not the memory of the workers.
+#
+#   python sweep.py --push 1:8 --pop 1:8 --queues 1,2 --tasks 65536 --trials 3
+
+COLUMNS = ['push', 'pop', 'queues', 'tasks', 'payload', 'trial', 'batch', 'config', 'data_dir',
+           'tasks_pushed', 'tasks_popped', 'push_throughput', 'pop_throughput', 'throughput',
+           'latency_p50', 'latency_p99', 'mem_avail_swing_mb']
+
+KEY = ['push', 'pop', 'queues', 'tasks', 'payload', 'trial', 'config']
+
+RUNME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runme.py')
+
+# Columns of results.csv files written before, by their current name
+RENAMED = {'mem_peak_mb': 'mem_avail_swing_mb'}
+
+BATCH_DIR = re.compile(r'_batch_(\d+)$')
+
+
+def parse_range(spec):
+
+    # '1,2,4' -> [1, 2, 4], '1:16' -> [1, 2, 4, 8, 16], '0:1024:256' -> [0, 256, ..., 1024]
+    if ':' not in spec:
+        return [int(v) for v in spec.split(',')]
+
+    parts = [int(v) for v in spec.split(':')]
+
+    if len(parts) == 3:
+        return range(parts[0], parts[1]+1, parts[2])
+
+    vals = list()
+    cur = max(parts[0], 1)
+    while cur <= parts[1]:
+        vals.append(cur)
+        cur *= 2
+
+    return vals
+
+
+def load_results(path):
+
+    if not os.path.exists(path):
+        return set()
+
+    f = open(path, 'r')
+    done = set(tuple(row[k] for k in KEY) for row in csv.DictReader(f))
+    f.close()
+
+    return done
+
+
+def batch_size(data):
+
+    # Batch size of a runme.py data directory, '' without batching
+    match = BATCH_DIR.search(data.rstrip('/'))
+
+    return match.group(1) if match else ''
+
+
+def upgrade_results(path):
+
+    # Rewrite a results.csv of older columns with the current ones
+    f = open(path, 'r')
+    reader = csv.DictReader(f)
+    fields = reader.fieldnames
+    rows = list(reader)
+    f.close()
+
+    if fields == COLUMNS:
+        return
+
+    for row in rows:
+        for old, new in RENAMED.items():
+            if old in row:
+                row[new] = row.pop(old)
+        if 'batch' not in row:
+            row['batch'] = batch_size(row.get('data_dir', ''))
+
+    f = open(path, 'w')
+    writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+    f.close()
+
+
+def append_rows(path, rows):
+
+    new = not os.path.exists(path)
+
+    f = open(path, 'a')
+    writer = csv.DictWriter(f, fieldnames=COLUMNS)
+    if new:
+        writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+    f.close()
+
+
+def summarize(data):
+
+    # Reduce the traces of one trial to throughput, latency and memory
+    push = [read_trace(path) for path in glob.glob('%s/push_*.trc'%data)]
+    pop = [read_trace(path) for path in glob.glob('%s/pop_*.trc'%data)]
+
+    push_t = np.sort(np.concatenate([t['time'] for t in push] or [np.zeros(0)]))
+    pop_t = np.sort(np.concatenate([t['time'] for t in pop] or [np.zeros(0)]))
+    mem = np.concatenate([t['mem'] for t in push + pop] or [np.zeros(0)])
+
+    row = {'tasks_pushed': len(push_t), 'tasks_popped': len(pop_t)}
+
+    def rate(n, start, stop):
+        return n/(stop - start) if stop > start else 0.0
+
+    if len(push_t) and len(pop_t):
+
+        row['push_throughput'] = rate(len(push_t), push_t[0], push_t[-1])
+        row['pop_throughput'] = rate(len(pop_t), pop_t[0], pop_t[-1])
+        row['throughput'] = rate(len(pop_t), push_t[0], pop_t[-1])
+
+        # Queue residence time as measured by the poppers, over all queues
+        hists = merge_histograms(data)
+
+        if hists:
+            total = LatencyHistogram()
+            for hist in hists.values():
+                total.add(hist)
+            row['latency_p50'] = total.percentile(50)
+            row['latency_p99'] = total.percentile(99)
+
+        else:
+            # Trials without publish timestamps: queues are FIFO, so the
+            # k-th pop is matched with the k-th push
+            n = min(len(push_t), len(pop_t))
+            lat = pop_t[:n] - push_t[:n]
+            row['latency_p50'], row['latency_p99'] = np.percentile(lat, [50, 99])
+
+    if len(mem):
+        row['mem_avail_swing_mb'] = mem.max() - mem.min()
+
+    return row
+
+
+def run_point(point, trial, extra, out):
+
+    push, pop, queues, tasks, payload = point
+
+    config = ' '.join(extra)
+    run_dir = os.path.join(out, 'runs', 'push_%s_pop_%s_q_%s_tasks_%s_payload_%s_%08x'%(
+                            push, pop, queues, tasks, payload, zlib.crc32(config) & 0xffffffff),
+                           'trial_%s'%trial)
+
+    cmd = [sys.executable, RUNME, str(push), str(pop), str(queues),
+           '--tasks', str(tasks), '--payload', str(payload),
+           '--first-trial', str(trial), '--trials', str(trial),
+           '--out', run_dir] + extra
+
+    print 'Running: %s'%' '.join(cmd)
+
+    if subprocess.call(cmd) != 0:
+        print 'Failed: %s'%' '.join(cmd)
+        return []
+
+    rows = list()
+
+    for data in sorted(glob.glob('%s/push_*_trial_%s*'%(run_dir, trial))):
+
+        if not os.path.isdir(data):
+            continue
+
+        row = dict(zip(KEY, [push, pop, queues, tasks, payload, trial, config]))
+        row['data_dir'] = data
+        row['batch'] = batch_size(data)
+        row.update(summarize(data))
+        rows.append(row)
+
+    return rows
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(usage='python sweep.py [ranges] [runme.py options]')
+    parser.add_argument('--push', default='1', help='pusher counts, e.g. 1,2,4 or 1:8')
+    parser.add_argument('--pop', default='1', help='popper counts')
+    parser.add_argument('--queues', default='1', help='queue counts')
+    parser.add_argument('--tasks', default='1048576', help='total tasks per run')
+    parser.add_argument('--payload', default='0', help='extra bytes per task')
+    parser.add_argument('--trials', type=int, default=3, help='trials per point')
+    parser.add_argument('--out', default='./sweep', help='output directory')
+    args, extra = parser.parse_known_args()
+
+    results = os.path.join(args.out, 'results.csv')
+
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+
+    if os.path.exists(results):
+        upgrade_results(results)
+
+    done = load_results(results)
+
+    points = list(itertools.product(parse_range(args.push),
+                                    parse_range(args.pop),
+                                    parse_range(args.queues),
+                                    parse_range(args.tasks),
+                                    parse_range(args.payload)))
+
+    for point in points:
+
+        for trial in range(1, args.trials+1):
+
+            key = tuple(str(v) for v in point + (trial, ' '.join(extra)))
+
+            if key in done:
+                print 'Skipping %s, results exist'%(key,)
+                continue
+
+            rows = run_point(point, trial, extra, args.out)
+            append_rows(results, rows)
+
+    print 'Results: %s'%results
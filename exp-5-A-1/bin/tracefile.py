@@ -0,0 +1,177 @@
+import os
+import sys
+import glob
+import time
+import struct
+from array import array
+
+# ------------------------------------------------------------------------------
+# Binary, streamed push/pop traces.
+#
+# Instead of keeping every timestamp in memory until the end of a run and then
+# writing text, the workers stream their records to disk in chunks while the
+# run is going. A killed trial loses at most the last unflushed chunk.
+#
+# File layout (little endian):
+#
+#   header : MAGIC | uint32 len | comma separated field names
+#   chunk  : uint32 n | n float64 values of field 0 | ... | of field k-1
+#
+# Chunks are columnar so that the reader can memory map them and hand out
+# zero-copy views per field.
+
+MAGIC = 'ENTKTRC1'
+FIELDS = ('time', 'mem')
+
+# Flush when this many records are buffered or the oldest one is this old (secs)
+CHUNK_RECORDS = 2**16
+CHUNK_INTERVAL = 5.0
+
+
+class TraceWriter(object):
+
+    # Buffers timestamps in an array('d') and writes them out chunk by chunk.
+    # The memory column is filled from the background sampler at flush time.
+
+    def __init__(self, path, sampler=None, chunk=CHUNK_RECORDS, interval=CHUNK_INTERVAL):
+
+        self.path = path
+        self.sampler = sampler
+        self.chunk = chunk
+        self.interval = interval
+
+        self.times = array('d')
+        self.count = 0
+        self.flushed = time.time()
+
+        names = ','.join(FIELDS)
+        self.f = open(path, 'wb')
+        self.f.write(MAGIC + struct.pack('<I', len(names)) + names)
+        self.f.flush()
+
+    def __len__(self):
+
+        return self.count + len(self.times)
+
+    def append(self, ts):
+
+        self.times.append(ts)
+
+        if len(self.times) >= self.chunk or ts - self.flushed > self.interval:
+            self.flush()
+
+    def extend(self, stamps):
+
+        self.times.extend(stamps)
+
+        if len(self.times) >= self.chunk or stamps[-1] - self.flushed > self.interval:
+            self.flush()
+
+    def flush(self):
+
+        n = len(self.times)
+        self.flushed = time.time()
+
+        if not n:
+            return
+
+        if self.sampler:
+            mem = self.sampler.values_at(self.times)
+        else:
+            mem = array('d', [0.0])*n
+
+        for col in (self.times, mem):
+            if sys.byteorder == 'big':
+                col.byteswap()
+
+        self.f.write(struct.pack('<I', n))
+        self.times.tofile(self.f)
+        mem.tofile(self.f)
+        self.f.flush()
+
+        self.count += n
+        self.times = array('d')
+
+    def close(self):
+
+        if self.f.closed:
+            return
+
+        self.flush()
+        self.f.close()
+
+
+def read_header(raw):
+
+    if raw[:len(MAGIC)].tostring() != MAGIC:
+        raise ValueError('not a trace file')
+
+    offset = len(MAGIC)
+    size = struct.unpack('<I', raw[offset:offset+4].tostring())[0]
+    names = raw[offset+4:offset+4+size].tostring().split(',')
+
+    return names, offset + 4 + size
+
+
+def iter_chunks(path):
+
+    # Yield one {field: view} dict per complete chunk. The views point into a
+    # read-only memory map of the file, nothing is copied. A trailing chunk
+    # that was cut short by a killed run is skipped.
+    import numpy as np
+
+    raw = np.memmap(path, dtype=np.uint8, mode='r')
+    names, offset = read_header(raw)
+
+    while offset + 4 <= len(raw):
+
+        n = struct.unpack('<I', raw[offset:offset+4].tostring())[0]
+        end = offset + 4 + 8*n*len(names)
+
+        if end > len(raw):
+            break
+
+        cols = np.frombuffer(raw, dtype='<f8', count=n*len(names), offset=offset+4)
+        yield dict((name, cols[i*n:(i+1)*n]) for i, name in enumerate(names))
+
+        offset = end
+
+
+def read_trace(path):
+
+    # All complete chunks of a trace as one {field: numpy array} dict
+    import numpy as np
+
+    chunks = list(iter_chunks(path))
+    names = FIELDS if not chunks else chunks[0].keys()
+
+    return dict((name, np.concatenate([c[name] for c in chunks]) if chunks else np.zeros(0))
+                for name in names)
+
+
+def to_text(path):
+
+    # Convert a trace into the '<time> <mem>' text layout the notebooks read
+    trace = read_trace(path)
+
+    f = open(path[:-len('.trc')] + '.txt', 'w')
+    for ts, mem in zip(trace['time'], trace['mem']):
+        f.write('%s %s\n'%(ts, mem))
+    f.close()
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 2:
+        print 'Usage: python tracefile.py <data dir | trace file>'
+        print 'Converts push_*.trc / pop_*.trc into the push_*.txt / pop_*.txt text layout'
+        sys.exit(1)
+
+    if os.path.isdir(sys.argv[1]):
+        paths = glob.glob('%s/*.trc'%sys.argv[1])
+    else:
+        paths = [sys.argv[1]]
+
+    for path in paths:
+        to_text(path)
+        print 'Converted %s'%path
@@ -0,0 +1,182 @@
+import time
+import itertools
+import multiprocessing as mp
+from Queue import Empty
+
+# ------------------------------------------------------------------------------
+# Pluggable transport for the process engine of the push/pop benchmark.
+#
+# 'rabbitmq' hands out a pika BlockingConnection channel, 'local' a channel onto
+# multiprocessing queues that are created by the main process before the
+# workers are forked. Both offer the subset of the pika channel API the
+# benchmark uses (queue_delete/queue_declare, basic_publish, basic_get,
+# basic_ack, basic_qos, consume/cancel), so the same worker code measures
+# client side overhead alone (local) or client plus broker (rabbitmq).
+
+BROKERS = ['rabbitmq', 'local']
+
+# Queues of the local transport, by name. Filled by queue_declare in the main
+# process and inherited by the forked workers.
+_local_queues = dict()
+
+
+class LocalMethod(object):
+
+    def __init__(self, delivery_tag):
+
+        self.delivery_tag = delivery_tag
+
+
+class LocalProperties(object):
+
+    # Just what the benchmark reads back from pika.BasicProperties
+
+    def __init__(self, correlation_id=None, headers=None):
+
+        self.correlation_id = correlation_id
+        self.headers = headers
+
+
+class LocalChannel(object):
+
+    # Broker semantics on top of multiprocessing queues: a message that was
+    # handed out stays unacked until basic_ack, and unacked messages go back
+    # to their queue on cancel/close like they do on a real broker.
+
+    def __init__(self):
+
+        self.prefetch = 0
+        self.unacked = dict()
+        self.tags = itertools.count(1)
+        self._consuming = None
+
+    def queue_delete(self, queue=''):
+
+        _local_queues.pop(queue, None)
+
+    def queue_declare(self, queue='', passive=False):
+
+        if queue not in _local_queues:
+            if passive:
+                raise KeyError('queue %s does not exist'%queue)
+            _local_queues[queue] = mp.Queue()
+
+    def queue_depth(self, queue):
+
+        return _local_queues[queue].qsize()
+
+    def basic_qos(self, prefetch_count=0):
+
+        self.prefetch = prefetch_count
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+
+        props = None
+        if properties is not None:
+            props = (properties.correlation_id, getattr(properties, 'headers', None))
+
+        _local_queues[routing_key].put((props, body))
+
+    def _deliver(self, queue, props, body):
+
+        tag = next(self.tags)
+        self.unacked[tag] = (queue, props, body)
+
+        if props is not None:
+            props = LocalProperties(*props)
+
+        return LocalMethod(tag), props, body
+
+    def basic_get(self, queue=''):
+
+        try:
+            props, body = _local_queues[queue].get_nowait()
+        except Empty:
+            return None, None, None
+
+        return self._deliver(queue, props, body)
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+
+        if multiple:
+            for tag in [t for t in self.unacked if t <= delivery_tag]:
+                del self.unacked[tag]
+        else:
+            self.unacked.pop(delivery_tag, None)
+
+    def consume(self, queue='', inactivity_timeout=None):
+
+        # Blocking generator like pika's BlockingChannel.consume, yields
+        # (None, None, None) after 'inactivity_timeout' secs without a message
+        self._consuming = queue
+
+        while self._consuming:
+
+            if self.prefetch and len(self.unacked) >= self.prefetch:
+                # Nothing is delivered past the prefetch window until the
+                # consumer acks
+                time.sleep(0.001)
+                yield None, None, None
+                continue
+
+            try:
+                props, body = _local_queues[queue].get(timeout=inactivity_timeout)
+            except Empty:
+                yield None, None, None
+                continue
+
+            yield self._deliver(queue, props, body)
+
+    def cancel(self):
+
+        self._consuming = None
+
+        # Unacked messages go back to their queue
+        for tag in sorted(self.unacked):
+            queue, props, body = self.unacked[tag]
+            _local_queues[queue].put((props, body))
+
+        requeued = len(self.unacked)
+        self.unacked.clear()
+
+        return requeued
+
+    def close(self):
+
+        self.cancel()
+
+
+class RabbitChannel(object):
+
+    # Thin wrapper around a pika BlockingConnection channel that adds
+    # queue_depth and closes the connection along with the channel
+
+    def __init__(self, host, port):
+
+        import pika
+
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host=host, port=port))
+        self.channel = self.connection.channel()
+
+    def __getattr__(self, name):
+
+        return getattr(self.channel, name)
+
+    def queue_depth(self, queue):
+
+        return self.channel.queue_declare(queue=queue, passive=True).method.message_count
+
+    def close(self):
+
+        self.connection.close()
+
+
+def get_channel(broker='rabbitmq', host='localhost', port=32769):
+
+    if broker == 'rabbitmq':
+        return RabbitChannel(host, port)
+
+    if broker == 'local':
+        return LocalChannel()
+
+    raise ValueError('unknown broker %s, choose from %s'%(broker, ', '.join(BROKERS)))
@@ -1,6 +1,11 @@
-from radical.entk import Pipeline, Stage, Task, AppManager, ResourceManager
+from radical.entk import Pipeline, Stage, AppManager, ResourceManager
 import os
 import sys
+
+# The shared workflow code lives at the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from workflow import TaskTemplate
+
 # ------------------------------------------------------------------------------
 # Set default verbosity
 
@@ -42,16 +47,13 @@ def get_pipeline(tasks):
     # Create a Stage 1
     s1 = Stage()
 
-    for cnt in range(tasks):
-
-        # Create a Task object according to the app_name
-        t1 = Task()
-        t1.executable = [app_coll[app_name]['executable']]
-        t1.arguments = [app_coll[app_name]['arguments'] * sleep_time]
-        t1.cores = app_coll[app_name]['cores']
+    # All tasks are built from one template of the app_name
+    template = TaskTemplate(executable=[app_coll[app_name]['executable']],
+                            arguments=[app_coll[app_name]['arguments'] * sleep_time],
+                            cores=app_coll[app_name]['cores'])
 
-        # Add the Task to the Stage
-        s1.add_tasks(t1)
+    # Add the Tasks to the Stage
+    s1.add_tasks(template.build(tasks))
 
     # Add Stage to the Pipeline
     p.add_stages(s1)
@@ -1,62 +1,12 @@
-from radical.entk import Pipeline, Stage, Task, AppManager, ResourceManager
 import os
 import sys
-# ------------------------------------------------------------------------------
-# Set default verbosity
+import traceback
 
+# The shared workflow code lives at the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from workflow.spec import Compiler, load_spec, parse_set, run
 
-app_coll = {
-    
-    "sleep": {
-                'executable': '/bin/sleep',
-                'arguments': 1,
-                'cores': 1
-            }
-}
-
-
-res_coll = {
-
-    "xsede.supermic": {
-                'walltime': 60,
-                'schema': 'gsissh',
-                'project': 'TG-MCB090174'
-                },
-
-    "local.localhost": {
-                'walltime': 60,
-                'schema': None,
-                'project': None
-            }
-}
-
-if os.environ.get('RADICAL_ENTK_VERBOSE') == None:
-    os.environ['RADICAL_ENTK_VERBOSE'] = 'INFO'
-
-
-def get_pipeline(tasks):
-
-    # Create a Pipeline object
-    p = Pipeline()
-
-    # Create a Stage 1
-    s1 = Stage()
-
-    for cnt in range(tasks):
-
-        # Create a Task object according to the app_name
-        t1 = Task()
-        t1.executable = [app_coll[app_name]['executable']]
-        t1.arguments = [app_coll[app_name]['arguments']]*100
-        t1.cores = app_coll[app_name]['cores']
-
-        # Add the Task to the Stage
-        s1.add_tasks(t1)
-
-    # Add Stage to the Pipeline
-    p.add_stages(s1)
-
-    return p
+# The shape of the workflow and the resource are described in shapes.yaml
 
 if __name__ == '__main__':
 
@@ -68,33 +18,24 @@ if __name__ == '__main__':
     app_name = sys.argv[2]
     res_name = sys.argv[3]
 
-    pipes_set = set()
-
-    pipes_set.add(get_pipeline(num_tasks))
+    if app_name != 'sleep':
+        print 'Unknown application %s, shapes.yaml only has sleep'%app_name
+        sys.exit(1)
 
-    # Create a dictionary describe four mandatory keys:
-    # resource, walltime, cores and project
-    # resource is 'local.localhost' to execute locally
-    res_dict = {
+    params = {'tasks': num_tasks, 'cores': num_tasks, 'resource': res_name}
 
-            'resource': res_name,
-            'walltime': res_coll[res_name]['walltime'],
-            'cores': num_tasks,
-            'project': res_coll[res_name]['project'],
-            'access_schema': res_coll[res_name]['schema']
-    }
+    # Without project and access schema on the local machine
+    if res_name == 'local.localhost':
+        params.update({'project': None, 'schema': None})
 
-    # Create Resource Manager object with the above resource description
-    rman = ResourceManager(res_dict)
+    spec = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shapes.yaml'))
 
-    # Create Application Manager
-    appman = AppManager()
+    try:
 
-    # Assign resource manager to the Application Manager
-    appman.resource_manager = rman
+        # Build one pipeline of one stage of num_tasks tasks and run it
+        run(Compiler(spec, params))
 
-    # Assign the workflow as a set of Pipelines to the Application Manager
-    appman.assign_workflow(pipes_set)
+    except Exception, ex:
 
-    # Run the Application Manager
-    appman.run()
+        print 'Execution failed, error: %s'%ex
+        print traceback.format_exc()
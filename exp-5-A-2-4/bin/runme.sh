@@ -7,7 +7,7 @@ export RP_ENABLE_OLD_DEFINES=True
 
 for t in `seq 2 1 5`; do
     mkdir pipe-16-trial-$t
-    python pipeline_16_stage_1_task_1.py
+    PYTHONPATH=../.. python -m workflow.spec run shapes.yaml --set pipelines=16
     radicalpilot-fetch-json rp.session.*
     mv *.prof rp.session.* pipe-16-trial-$t
 done
@@ -2,6 +2,12 @@ from radical.entk import Pipeline, Stage, Task, AppManager, ResourceManager
 import os
 import sys
 import math
+
+# The shared workflow code lives at the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from workflow import TaskTemplate
+from workflow.planner import plan
+
 # ------------------------------------------------------------------------------
 # Set default verbosity
 
@@ -65,19 +71,15 @@ def get_pipeline(tasks):
     # Create a Stage 2
     s2 = Stage()
 
-    for cnt in range(tasks):
+    # All tasks are built from one template of mdrun
+    template = TaskTemplate(pre_exec=['module load gromacs/5.0/INTEL-140-MVAPICH2-2.0','export OMP_NUM_THREADS=%s'%num_cores],
+                            executable=app_coll['mdrun']['executable'],
+                            arguments=app_coll['mdrun']['arguments'],
+                            cores=num_cores,
+                            copy_input_data=['$Pipeline_%s_Stage_%s_Task_%s/topol.tpr'%(p.uid, s1.uid,t1.uid)])
 
-        # Create a Task object according to the app_name
-        t2 = Task()
-        t2.pre_exec = ['module load gromacs/5.0/INTEL-140-MVAPICH2-2.0','export OMP_NUM_THREADS=%s'%num_cores]
-        t2.executable = app_coll['mdrun']['executable']
-        t2.arguments = app_coll['mdrun']['arguments']
-        #t2.cores = app_coll['mdrun']['cores']
-        t2.cores = num_cores
-        t2.copy_input_data = ['$Pipeline_%s_Stage_%s_Task_%s/topol.tpr'%(p.uid, s1.uid,t1.uid)]
-
-        # Add the Task to the Stage
-        s2.add_tasks(t2)
+    # Add the Tasks to the Stage
+    s2.add_tasks(template.build(tasks))
 
     # Add Stage to the Pipeline
     p.add_stages(s2)
@@ -98,9 +100,13 @@ if __name__ == '__main__':
 
     pipes_set.add(get_pipeline(num_tasks))
 
-    #pilot_cores = int((math.ceil(float(num_tasks*app_coll['mdrun']['cores'])/res_coll[res_name]['cores_per_node'])*res_coll[res_name]['cores_per_node'])+res_coll[res_name]['cores_per_node'])
     pilot_cores = int((math.ceil(float(16*num_cores)/res_coll[res_name]['cores_per_node'])*res_coll[res_name]['cores_per_node'])+res_coll[res_name]['cores_per_node'])
 
+    # The runs in raw_data used the pilot above, the planner's is only shown
+    recommended = plan(pipes_set, res_coll[res_name])['cores']
+    if recommended != pilot_cores:
+        print 'Planner recommends a pilot of %s cores'%recommended
+
 
     print pilot_cores
 
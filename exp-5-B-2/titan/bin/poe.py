@@ -2,6 +2,13 @@ from radical.entk import Pipeline, Stage, Task, AppManager, ResourceManager
 import os
 import sys
 import math
+
+# The shared workflow code lives at the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from workflow import TaskTemplate
+from workflow.planner import plan
+from workflow.stream import from_template, stream_stages
+
 # ------------------------------------------------------------------------------
 # Set default verbosity
 
@@ -35,7 +42,7 @@ if os.environ.get('RADICAL_ENTK_VERBOSE') == None:
     os.environ['RADICAL_ENTK_VERBOSE'] = 'INFO'
 
 
-def get_pipeline(tasks):
+def get_pipeline(tasks, window=None):
 
     # Create a Pipeline object
     p = Pipeline()
@@ -62,21 +69,23 @@ def get_pipeline(tasks):
     p.add_stages(s1)
 
 
-    # Create a Stage 2
-    s2 = Stage()
+    # All tasks are built from one template of mdrun
+    template = TaskTemplate(pre_exec=['module load gromacs/5.0/INTEL-140-MVAPICH2-2.0','export OMP_NUM_THREADS=1'],
+                            executable=app_coll['mdrun']['executable'],
+                            arguments=app_coll['mdrun']['arguments'],
+                            cores=app_coll['mdrun']['cores'],
+                            copy_input_data=['$Pipeline_%s_Stage_%s_Task_%s/topol.tpr'%(p.uid, s1.uid,t1.uid)])
 
-    for cnt in range(tasks):
+    if window:
+        # Stages of 'window' tasks, each built once the one before is done
+        stream_stages(p, from_template(template, tasks), window)
+        return p
 
-        # Create a Task object according to the app_name
-        t2 = Task()
-        t2.pre_exec = ['module load gromacs/5.0/INTEL-140-MVAPICH2-2.0','export OMP_NUM_THREADS=1']
-        t2.executable = app_coll['mdrun']['executable']
-        t2.arguments = app_coll['mdrun']['arguments']
-        t2.cores = app_coll['mdrun']['cores']
-        t2.copy_input_data = ['$Pipeline_%s_Stage_%s_Task_%s/topol.tpr'%(p.uid, s1.uid,t1.uid)]
+    # Create a Stage 2
+    s2 = Stage()
 
-        # Add the Task to the Stage
-        s2.add_tasks(t2)
+    # Add the Tasks to the Stage
+    s2.add_tasks(template.build(tasks))
 
     # Add Stage to the Pipeline
     p.add_stages(s2)
@@ -85,19 +94,27 @@ def get_pipeline(tasks):
 
 if __name__ == '__main__':
 
-    if len(sys.argv) != 3:
-        print 'Missing arguments. Execution cmd: python poe.py <num_tasks> <resource_name>'
+    if len(sys.argv) not in [3, 4]:
+        print 'Missing arguments. Execution cmd: python poe.py <num_tasks> <resource_name> [<window>]'
         sys.exit(1)
 
     num_tasks = int(sys.argv[1])
     res_name = sys.argv[2]
 
+    # Optionally stream the mdrun tasks in stages of this many tasks
+    window = int(sys.argv[3]) if len(sys.argv) == 4 else None
+
     pipes_set = set()
 
-    pipes_set.add(get_pipeline(num_tasks))
+    pipes_set.add(get_pipeline(num_tasks, window))
 
     pilot_cores = int((math.ceil(float(num_tasks*app_coll['mdrun']['cores'])/res_coll[res_name]['cores_per_node'])*res_coll[res_name]['cores_per_node'])+res_coll[res_name]['cores_per_node'])
 
+    # The runs in raw_data used the pilot above, the planner's is only shown
+    recommended = plan(pipes_set, res_coll[res_name])['cores']
+    if recommended != pilot_cores:
+        print 'Planner recommends a pilot of %s cores'%recommended
+
     print pilot_cores
 
     # Create a dictionary describe four mandatory keys:
@@ -116,8 +133,10 @@ if __name__ == '__main__':
     rman = ResourceManager(res_dict)
     rman.shared_data = ['./ip_data/input.gro','./ip_data/grompp.mdp','./ip_data/topol.top']
 
-    # Create Application Manager
-    appman = AppManager(port=32769)
+    # Create Application Manager, the RabbitMQ endpoint can be overridden
+    # with RMQ_HOSTNAME/RMQ_PORT instead of editing this script
+    appman = AppManager(hostname=os.environ.get('RMQ_HOSTNAME', 'localhost'),
+                        port=int(os.environ.get('RMQ_PORT', 32769)))
 
     # Assign resource manager to the Application Manager
     appman.resource_manager = rman
@@ -1,5 +1,11 @@
 from radical.entk import Pipeline, Stage, Task, AppManager, ResourceManager
 import traceback, sys
+import os
+
+# The shared workflow code lives at the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from workflow import intern_workflow
+from workflow.planner import plan
 
 if __name__ == '__main__':
 
@@ -106,12 +112,20 @@ if __name__ == '__main__':
 
     p.add_stages(specfem_stage)
 
+    # The module loads of all events are the same strings
+    intern_workflow(p)
+
+    # The gpu branch of EnTK counts Titan in nodes, one cpu and one gpu each.
+    # The pilot runs one event at a time, of about 8 minutes.
+    pilot = plan([p], {'cores_per_node': 1, 'gpus_per_node': 1, 'agent_nodes': 1},
+                 duration=8*60, max_nodes=385)
+
 
     res_dict = {
                 'resource': 'ornl.titan_aprun',
-                'walltime': 8*num_events,
-                'cpus': 385,
-                'gpus':  385,
+                'walltime': pilot['walltime'],
+                'cpus': pilot['cores'],
+                'gpus': pilot['gpus'],
                 'project': 'BIP149',
                 'schema': 'local'
             }
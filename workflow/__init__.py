@@ -0,0 +1,11 @@
+# ------------------------------------------------------------------------------
+# Shared workflow construction code for the poe.py generators.
+#
+#   import sys; sys.path.insert(0, '<repo root>')
+#   from workflow import TaskTemplate
+
+from workflow.bulk import SharedList, SharedDict, TaskTemplate, bulk_tasks, own
+from workflow.intern import Interner, intern_workflow, pack_tasks, unpack_tasks, dumps_tasks, loads_tasks
+from workflow.spec import Compiler, load_spec, sweep_points
+from workflow.stream import TaskSource, from_template, stream_stages, stream_pipelines
+from workflow.planner import plan, simulate, workload
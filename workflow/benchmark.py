@@ -0,0 +1,172 @@
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import subprocess
+from workflow.bulk import TaskTemplate
+from workflow.intern import intern_workflow, dumps_tasks
+
+# ------------------------------------------------------------------------------
+# Build time and memory of the poe.py task loop against TaskTemplate and
+# against the loop followed by intern_workflow().
+#
+# Every (method, number of tasks) runs in a fresh interpreter, which builds one
+# stage of tasks like exp-5-A-2-6 (sleep) or exp-5-B-1 (mdrun, with pre_exec
+# and input data) and reports the wall time and the growth of its resident
+# set size. With --wire it also reports the JSON size of the tasks' to_dict()
+# against dumps_tasks().
+#
+#   python -m workflow.benchmark --tasks 1000,10000,100000,1000000 --app mdrun
+
+APPS = {'sleep': {'executable': ['/bin/sleep'],
+                  'arguments': ['1'],
+                  'cores': 1},
+        'mdrun': {'pre_exec': ['module load gromacs/5.0/INTEL-140-MVAPICH2-2.0',
+                               'export OMP_NUM_THREADS=1'],
+                  'executable': ['gmx mdrun'],
+                  'arguments': ['-s', 'topol.tpr', '-c', 'md.out'],
+                  'cores': 1,
+                  'copy_input_data': ['$Pipeline_p_Stage_s_Task_t/topol.tpr']}}
+
+METHODS = ['loop', 'template', 'interned']
+
+
+def rss_mb():
+
+    try:
+        f = open('/proc/self/statm')
+        pages = int(f.read().split()[1])
+        f.close()
+        return pages*os.sysconf('SC_PAGE_SIZE')/float(2**20)
+
+    except (IOError, OSError):
+        import resource
+        # Peak rather than current, KB on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+
+def build_loop(n, fields, stage):
+
+    # As in poe.py: a new Task and new lists for every task, one add_tasks
+    # call per task
+    from radical.entk import Task
+
+    tasks = list()
+    for _ in range(n):
+        t = Task()
+        for attr, value in fields.items():
+            setattr(t, attr, list(value) if isinstance(value, list) else value)
+        if stage is not None:
+            stage.add_tasks(t)
+        tasks.append(t)
+
+    return tasks
+
+
+def build_template(n, fields, stage):
+
+    tasks = TaskTemplate(**fields).build(n)
+    if stage is not None:
+        stage.add_tasks(tasks)
+
+    return tasks
+
+
+def build_interned(n, fields, stage):
+
+    tasks = build_loop(n, fields, stage)
+    intern_workflow(tasks)
+
+    return tasks
+
+
+def wire_sizes(tasks):
+
+    dicts = [t.to_dict() for t in tasks]
+
+    return len(json.dumps(dicts)), len(dumps_tasks(dicts))
+
+
+def child(method, n, app, with_stage, wire=False):
+
+    stage = None
+    if with_stage:
+        from radical.entk import Stage
+        stage = Stage()
+
+    build = {'loop': build_loop, 'template': build_template, 'interned': build_interned}[method]
+
+    gc.collect()
+    rss = rss_mb()
+    start = time.time()
+
+    tasks = build(n, APPS[app], stage)
+
+    secs = time.time() - start
+    gc.collect()
+
+    res = {'method': method, 'tasks': len(tasks), 'secs': secs, 'rss_mb': rss_mb() - rss}
+
+    if wire:
+        res['json_kb'], res['packed_kb'] = [size/1024.0 for size in wire_sizes(tasks)]
+
+    return res
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python -m workflow.benchmark')
+    parser.add_argument('--tasks', default='1000,10000,100000,1000000')
+    parser.add_argument('--app', default='mdrun', choices=sorted(APPS))
+    parser.add_argument('--methods', default=','.join(METHODS))
+    parser.add_argument('--no-stage', action='store_true', help='only build the tasks, do not add them to a Stage')
+    parser.add_argument('--wire', action='store_true', help='also measure the serialized size of the tasks')
+    parser.add_argument('--child', nargs=2, metavar=('METHOD', 'TASKS'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.child[0], int(args.child[1]), args.app, not args.no_stage, args.wire)))
+        return 0
+
+    # The children import workflow from this checkout
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    header = '%10s %10s %10s %10s %12s'%('tasks', 'method', 'secs', 'rss MB', 'tasks/sec')
+    if args.wire:
+        header += ' %12s %12s'%('json KB', 'packed KB')
+    print(header)
+
+    for n in [int(x) for x in args.tasks.split(',')]:
+        for method in args.methods.split(','):
+
+            cmd = [sys.executable, '-m', 'workflow.benchmark', '--app', args.app, '--child', method, str(n)]
+            if args.no_stage:
+                cmd.append('--no-stage')
+            if args.wire:
+                cmd.append('--wire')
+
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, env=env)
+            out = proc.communicate()[0]
+
+            if proc.returncode:
+                print('%10s %10s failed'%(n, method))
+                continue
+
+            res = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+            line = '%10s %10s %10.3f %10.1f %12.0f'%(n, method, res['secs'], res['rss_mb'],
+                                                     n/res['secs'] if res['secs'] else 0)
+            if args.wire:
+                line += ' %12.1f %12.1f'%(res['json_kb'], res['packed_kb'])
+            print(line)
+            sys.stdout.flush()
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# ------------------------------------------------------------------------------
+# Building many EnTK tasks from one prototype.
+#
+# The poe.py generators create every task in a Python loop, assigning the
+# same executable, arguments and pre_exec through the validating Task setters
+# and allocating new lists for every task. A TaskTemplate instead runs the
+# setters once, on the first task of a batch, and hands every further task the
+# very same values that passed the setters (a field whose setter stores a
+# copy or conversion of its value goes through the setter on every task). Shared
+# list (and dict) values are SharedLists (SharedDicts): they can not be changed
+# in place, a task that needs a different value gets its own by assignment
+# (copy on write), e.g. own(task, 'arguments').append().
+# Per task values are given as sequences (lists, numpy arrays, ...) of one
+# entry per task and go through the setters.
+#
+#   template = TaskTemplate(executable=['/bin/sleep'], arguments=['1'], cores=1)
+#   stage.add_tasks(template.build(8192))
+#   stage.add_tasks(template.build(4, arguments=[['1'], ['2'], ['3'], ['4']]))
+#
+# No extra Task objects are created, so the uids of the tasks are numbered
+# exactly as with the loop.
+
+
+class SharedList(list):
+
+    # A list value shared by the tasks of a template
+
+    def _shared(self, *args, **kwargs):
+
+        raise TypeError('list is shared by the tasks of a template, '
+                        'assign a new list to change it for one task')
+
+    append = extend = insert = remove = pop = reverse = sort = _shared
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _shared
+    __iadd__ = __imul__ = _shared
+
+    def __reduce_ex__(self, protocol):
+
+        return SharedList, (list(self),)
+
+    def __reduce__(self):
+
+        return SharedList, (list(self),)
+
+
+class SharedDict(dict):
+
+    # A dict value (cpu_reqs, ...) shared by the tasks of a template
+
+    def _shared(self, *args, **kwargs):
+
+        raise TypeError('dict is shared by the tasks of a template, '
+                        'assign a new dict to change it for one task')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _shared
+
+    def __reduce_ex__(self, protocol):
+
+        return SharedDict, (dict(self),)
+
+    def __reduce__(self):
+
+        return SharedDict, (dict(self),)
+
+
+def freeze(value):
+
+    if isinstance(value, list) and not isinstance(value, SharedList):
+        return SharedList(freeze(item) for item in value)
+
+    if isinstance(value, dict) and not isinstance(value, SharedDict):
+        return SharedDict((key, freeze(item)) for key, item in value.items())
+
+    return value
+
+
+def own(task, attr):
+
+    # Give 'task' its own, mutable copy of a shared list or dict attribute
+    value = getattr(task, attr)
+    value = dict(value) if isinstance(value, dict) else list(value)
+    setattr(task, attr, value)
+
+    return getattr(task, attr)
+
+
+def _default_task_class():
+
+    from radical.entk import Task
+
+    return Task
+
+
+def _per_task(values, n, attr):
+
+    if hasattr(values, 'tolist'):
+        # numpy arrays: the setters want python ints, floats and lists
+        values = values.tolist()
+
+    if len(values) != n:
+        raise ValueError('%s: %s values for %s tasks'%(attr, len(values), n))
+
+    return values
+
+
+class TaskTemplate(object):
+
+    def __init__(self, task_class=None, **fields):
+
+        self.task_class = task_class or _default_task_class()
+        self.fields = dict((attr, freeze(value)) for attr, value in fields.items())
+
+    def derive(self, **fields):
+
+        # A template with some of the fields replaced
+        merged = dict(self.fields)
+        merged.update(fields)
+
+        return TaskTemplate(self.task_class, **merged)
+
+    def build(self, n, **overrides):
+
+        # n tasks with the fields of the template; every override is a
+        # sequence of n values of one attribute
+        overrides = dict((attr, _per_task(values, n, attr)) for attr, values in overrides.items())
+
+        tasks = list()
+        if not n:
+            return tasks
+
+        first = self.task_class()
+        shared, unshared = self._apply(first)
+        tasks.append(first)
+
+        if shared is None:
+            # No instance dict (slots), set every field on every task
+            for _ in range(n - 1):
+                task = self.task_class()
+                for attr, value in self.fields.items():
+                    setattr(task, attr, value)
+                tasks.append(task)
+        else:
+            # Item by item: dict.update() would size every task's dict for
+            # the keys as if they were all new
+            shared = list(shared.items())
+            for _ in range(n - 1):
+                task = self.task_class()
+                state = task.__dict__
+                for key, value in shared:
+                    state[key] = value
+                for attr in unshared:
+                    setattr(task, attr, self.fields[attr])
+                tasks.append(task)
+
+        for attr, values in overrides.items():
+            for task, value in zip(tasks, values):
+                setattr(task, attr, value)
+
+        return tasks
+
+    def _apply(self, task):
+
+        # Set the fields on 'task' through its setters, which validate them.
+        # Returns what the setters stored, to be shared, and the fields whose
+        # setters stored something else than the (frozen) value they were
+        # given or an immutable value, which go through the setters on every
+        # task instead.
+        if getattr(task, '__dict__', None) is None:
+            for attr, value in self.fields.items():
+                setattr(task, attr, value)
+            return None, None
+
+        shared = dict()
+        unshared = list()
+
+        for attr, value in self.fields.items():
+
+            before = dict(task.__dict__)
+            setattr(task, attr, value)
+
+            stored = dict((key, item) for key, item in task.__dict__.items()
+                          if key not in before or before[key] is not item)
+
+            if all([item is value or not isinstance(item, (list, dict, set)) for item in stored.values()]):
+                shared.update(stored)
+            else:
+                unshared.append(attr)
+
+        return shared, unshared
+
+
+def bulk_tasks(n, task_class=None, overrides=None, **fields):
+
+    # TaskTemplate(**fields).build(n, **overrides) in one call
+    return TaskTemplate(task_class, **fields).build(n, **(overrides or {}))
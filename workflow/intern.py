@@ -0,0 +1,189 @@
+import json
+from workflow.bulk import SharedList, SharedDict, freeze
+
+# ------------------------------------------------------------------------------
+# One copy of every distinct task value, in memory and on the wire.
+#
+# The generators give thousands of tasks equal but separate pre_exec lists
+# (module loads), arguments, copy_input_data strings and cpu_reqs dicts.
+#
+#   intern_workflow() : replaces every such value of every task by one
+#                       canonical, shared instance (SharedList/SharedDict,
+#                       see bulk.py), so memory grows with the number of
+#                       distinct values rather than the number of tasks
+#   pack_tasks()      : serializes task dicts (Task.to_dict()) column by
+#                       column with every distinct value of a field sent
+#                       once, tasks only carry indices into those values
+#   unpack_tasks()    : the inverse, equal values decode to one shared
+#                       SharedList/SharedDict, so a task dict changes its
+#                       value by assignment, never in place
+#
+#   intern_workflow(set([p]))
+#   body = dumps_tasks([t.to_dict() for t in stage.tasks])
+
+# Task attributes worth interning, the ones that hold lists and dicts
+TASK_ATTRS = ['pre_exec', 'executable', 'arguments', 'post_exec',
+              'upload_input_data', 'copy_input_data', 'link_input_data',
+              'copy_output_data', 'download_output_data',
+              'cpu_reqs', 'gpu_reqs']
+
+
+class Interner(object):
+
+    def __init__(self):
+
+        self.table = dict()
+        self.canonical = set()
+
+    def __len__(self):
+
+        return len(self.table)
+
+    def intern(self, value):
+
+        # The canonical instance of 'value'. Containers are keyed by the
+        # identity of their (canonical) items, so equal values map to one
+        # instance however deeply nested.
+        if id(value) in self.canonical:
+            return value
+
+        if isinstance(value, list):
+            items = [self.intern(item) for item in value]
+            key = ('list', tuple([id(item) for item in items]))
+            make = lambda: SharedList(items)
+
+        elif isinstance(value, dict):
+            items = sorted([(self.intern(k), self.intern(v)) for k, v in value.items()],
+                           key=lambda item: id(item[0]))
+            key = ('dict', tuple([(id(k), id(v)) for k, v in items]))
+            make = lambda: SharedDict(items)
+
+        else:
+            # The type too, 1, 1.0 and True are equal but serialize apart
+            key = (type(value), value)
+            try:
+                canonical = self.table.get(key)
+            except TypeError:
+                return value
+            if canonical is None:
+                canonical = self.table[key] = value
+            return canonical
+
+        canonical = self.table.get(key)
+        if canonical is None:
+            canonical = self.table[key] = make()
+            self.canonical.add(id(canonical))
+
+        return canonical
+
+
+def iter_tasks(workflow):
+
+    # Tasks of a task, stage, pipeline, or any iterable of those
+    if hasattr(workflow, 'stages'):
+        for stage in workflow.stages:
+            for task in iter_tasks(stage):
+                yield task
+
+    elif hasattr(workflow, 'tasks'):
+        for task in workflow.tasks:
+            yield task
+
+    elif hasattr(workflow, '__iter__'):
+        for item in workflow:
+            for task in iter_tasks(item):
+                yield task
+
+    else:
+        yield workflow
+
+
+def intern_workflow(workflow, interner=None, attrs=TASK_ATTRS):
+
+    # Share the equal 'attrs' values of all tasks of 'workflow'. Returns
+    # (interner, values seen, distinct values).
+    interner = interner or Interner()
+    seen = 0
+    distinct = set()
+
+    for task in iter_tasks(workflow):
+        for attr in attrs:
+
+            value = getattr(task, attr, None)
+            if value is None:
+                continue
+
+            canonical = interner.intern(value)
+            seen += 1
+            distinct.add(id(canonical))
+
+            if canonical is not value:
+                setattr(task, attr, canonical)
+
+    return interner, seen, len(distinct)
+
+
+def pack_tasks(task_dicts):
+
+    # {'fields': [...], 'values': [[distinct values of the field], ...],
+    #  'rows': [[index into the values of every field, -1 if unset], ...]}
+    fields = sorted(set([key for t_dict in task_dicts for key in t_dict]))
+
+    values = [list() for _ in fields]
+    by_text = [dict() for _ in fields]
+    by_id = [dict() for _ in fields]
+
+    # Keep the values keyed by id alive, so no id is reused meanwhile
+    alive = list()
+    rows = list()
+
+    for t_dict in task_dicts:
+
+        row = list()
+
+        for col, field in enumerate(fields):
+
+            if field not in t_dict:
+                row.append(-1)
+                continue
+
+            value = t_dict[field]
+
+            # Interned values are recognized by identity, without encoding
+            ind = by_id[col].get(id(value))
+
+            if ind is None:
+                text = json.dumps(value, sort_keys=True)
+                ind = by_text[col].get(text)
+                if ind is None:
+                    ind = by_text[col][text] = len(values[col])
+                    values[col].append(value)
+                by_id[col][id(value)] = ind
+                alive.append(value)
+
+            row.append(ind)
+
+        rows.append(row)
+
+    return {'fields': fields, 'values': values, 'rows': rows}
+
+
+def unpack_tasks(packed):
+
+    # Lists and dicts are shared by all tasks with that value, frozen so that
+    # changing one in place can not change the others
+    fields = packed['fields']
+    values = [[freeze(value) for value in column] for column in packed['values']]
+
+    return [dict((fields[col], values[col][ind]) for col, ind in enumerate(row) if ind >= 0)
+            for row in packed['rows']]
+
+
+def dumps_tasks(task_dicts):
+
+    return json.dumps(pack_tasks(task_dicts), separators=(',', ':'))
+
+
+def loads_tasks(body):
+
+    return unpack_tasks(json.loads(body))
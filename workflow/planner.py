@@ -0,0 +1,343 @@
+import sys
+import math
+import heapq
+import argparse
+import collections
+
+# ------------------------------------------------------------------------------
+# Pilot size and walltime from the workflow itself.
+#
+# The poe.py scripts compute the pilot by hand, e.g.
+# ceil(16*num_cores/cores_per_node)*cores_per_node + cores_per_node. plan()
+# reads the cores (cpu_reqs, gpu_reqs) of every task of the built pipelines,
+# estimates the makespan on a pilot of N nodes by simulating the execution,
+# and returns the smallest pilot that finishes within the target makespan:
+#
+#   - pipelines run side by side, the stages of a pipeline one after the other
+#   - a task that fits in a node runs within one node, larger (MPI) tasks take
+#     cores and gpus of as many nodes as needed
+#   - the pilot is whole nodes, plus the nodes of the agent
+#
+# Without a target the plan is the smallest pilot that runs the workflow as
+# fast as it can go, i.e. within its critical path. Task durations are seconds,
+# one for all tasks, a dict by executable (or task name), or a function of the
+# task. Only the stages built already are seen, not those that a lazy or
+# streamed pipeline adds while it runs.
+#
+#   pilot = plan(pipes_set, res_coll['xsede.supermic'], duration=600)
+#   res_dict['cores'], res_dict['walltime'] = pilot['cores'], pilot['walltime']
+
+# Resource defaults, the entries of the scripts' res_coll give cores_per_node
+RESOURCE = {'cores_per_node': 1, 'gpus_per_node': 0, 'agent_nodes': 1}
+
+
+def _slots(reqs):
+
+    # Cores (gpus) of cpu_reqs (gpu_reqs), EnTK releases name the process
+    # count 'processes' or 'process'
+    processes = reqs.get('processes', reqs.get('process')) or 0
+
+    return processes*(reqs.get('threads_per_process') or 1)
+
+
+def requirements(task):
+
+    # (cores, gpus) of a task
+    cpu_reqs = getattr(task, 'cpu_reqs', None)
+    gpu_reqs = getattr(task, 'gpu_reqs', None)
+
+    if cpu_reqs:
+        cores = _slots(cpu_reqs)
+    else:
+        cores = getattr(task, 'cores', 1)
+
+    gpus = _slots(gpu_reqs) if gpu_reqs else 0
+
+    return int(cores), int(gpus)
+
+
+def _duration(duration):
+
+    # A function of the task from a number, dict or function
+    if callable(duration):
+        return duration
+
+    if isinstance(duration, dict):
+
+        def lookup(task):
+            name = getattr(task, 'name', None)
+            if name in duration:
+                return duration[name]
+            executable = getattr(task, 'executable', None)
+            if isinstance(executable, list):
+                executable = executable[0] if executable else None
+            if executable not in duration:
+                raise KeyError('no duration for task %s (%s)'%(task.uid, executable))
+            return duration[executable]
+
+        return lookup
+
+    return lambda task: duration
+
+
+def workload(workflow, duration=1.0):
+
+    # [pipeline: [stage: {(cores, gpus, secs): number of tasks}]]
+    duration = _duration(duration)
+
+    pipelines = list()
+
+    for p in workflow:
+        stages = list()
+        for s in p.stages:
+            counts = collections.Counter()
+            for t in s.tasks:
+                counts[requirements(t) + (float(duration(t)),)] += 1
+            if counts:
+                stages.append(dict(counts))
+        pipelines.append(stages)
+
+    return pipelines
+
+
+def critical_path(pipelines):
+
+    # Makespan with unlimited resources
+    return max([sum([max([secs for _, _, secs in stage]) for stage in stages])
+                for stages in pipelines] or [0.0])
+
+
+class Nodes(object):
+
+    # Free cores and gpus of every node of a pilot
+
+    def __init__(self, nodes, cores_per_node, gpus_per_node):
+
+        self.cores_per_node = cores_per_node
+        self.gpus_per_node = gpus_per_node
+        self.cores = [cores_per_node]*nodes
+        self.gpus = [gpus_per_node]*nodes
+        self.free_cores = nodes*cores_per_node
+        self.free_gpus = nodes*gpus_per_node
+
+        # No node before this one has anything free
+        self.first = 0
+
+    def fits(self, cores, gpus):
+
+        # Whether a task can ever run on this pilot
+        if cores <= self.cores_per_node and gpus <= self.gpus_per_node:
+            return len(self.cores) > 0
+        return cores <= len(self.cores)*self.cores_per_node and gpus <= len(self.gpus)*self.gpus_per_node
+
+    def take(self, cores, gpus):
+
+        # [(node, cores, gpus), ...] taken for a task, None if it does not fit now
+        if cores > self.free_cores or gpus > self.free_gpus:
+            return None
+
+        single = cores <= self.cores_per_node and gpus <= self.gpus_per_node
+        taken = list()
+
+        for node in range(self.first, len(self.cores)):
+
+            if single:
+                if self.cores[node] >= cores and self.gpus[node] >= gpus:
+                    taken.append((node, cores, gpus))
+                    break
+                continue
+
+            use_cores = min(cores, self.cores[node])
+            use_gpus = min(gpus, self.gpus[node])
+            if use_cores or use_gpus:
+                taken.append((node, use_cores, use_gpus))
+                cores -= use_cores
+                gpus -= use_gpus
+            if not cores and not gpus:
+                break
+
+        if not taken or (not single and (cores or gpus)):
+            return None
+
+        for node, use_cores, use_gpus in taken:
+            self.cores[node] -= use_cores
+            self.gpus[node] -= use_gpus
+            self.free_cores -= use_cores
+            self.free_gpus -= use_gpus
+
+        while self.first < len(self.cores) and not self.cores[self.first] and not self.gpus[self.first]:
+            self.first += 1
+
+        return taken
+
+    def release(self, taken):
+
+        for node, cores, gpus in taken:
+            self.cores[node] += cores
+            self.gpus[node] += gpus
+            self.free_cores += cores
+            self.free_gpus += gpus
+            self.first = min(self.first, node)
+
+
+def simulate(pipelines, nodes, cores_per_node=1, gpus_per_node=0):
+
+    # Makespan of the workload on 'nodes' nodes, and the most cores and gpus
+    # in use at a time
+    pilot = Nodes(nodes, cores_per_node, gpus_per_node)
+
+    for stages in pipelines:
+        for stage in stages:
+            for cores, gpus, _ in stage:
+                if not pilot.fits(cores, gpus):
+                    raise ValueError('a task of %s cores and %s gpus does not fit on %s nodes'
+                                     %(cores, gpus, nodes))
+
+    # Ready tasks by (cores, gpus, secs): [pipeline, ...] in order
+    ready = collections.OrderedDict()
+    left = [0]*len(pipelines)
+    stage_of = [-1]*len(pipelines)
+
+    def next_stage(pipe):
+        stage_of[pipe] += 1
+        if stage_of[pipe] < len(pipelines[pipe]):
+            for key, count in pipelines[pipe][stage_of[pipe]].items():
+                ready.setdefault(key, collections.deque()).extend([pipe]*count)
+                left[pipe] += count
+
+    for pipe in range(len(pipelines)):
+        next_stage(pipe)
+
+    running = list()
+    now = 0.0
+    seq = 0
+    peak_cores = peak_gpus = 0
+
+    while ready or running:
+
+        for key in list(ready):
+            cores, gpus, secs = key
+            queue = ready[key]
+            while queue:
+                taken = pilot.take(cores, gpus)
+                if taken is None:
+                    break
+                heapq.heappush(running, (now + secs, seq, queue.popleft(), taken))
+                seq += 1
+            if not queue:
+                del ready[key]
+
+        peak_cores = max(peak_cores, nodes*cores_per_node - pilot.free_cores)
+        peak_gpus = max(peak_gpus, nodes*gpus_per_node - pilot.free_gpus)
+
+        if not running:
+            break
+
+        # Finish everything that ends at the next point in time
+        now = running[0][0]
+        while running and running[0][0] <= now:
+            _, _, pipe, taken = heapq.heappop(running)
+            pilot.release(taken)
+            left[pipe] -= 1
+            if not left[pipe]:
+                next_stage(pipe)
+
+    return now, peak_cores, peak_gpus
+
+
+def plan(workflow, resource, duration=1.0, makespan=None, max_nodes=None, margin=0.0, overhead=0.0):
+
+    # {'nodes', 'cores', 'gpus', 'walltime' (minutes), 'makespan' (seconds),
+    #  'critical_path', 'task_cores', 'task_gpus'} of the smallest pilot that
+    # runs 'workflow' (pipelines) within 'makespan' seconds. 'resource' gives
+    # cores_per_node, gpus_per_node and agent_nodes (see RESOURCE), max_nodes
+    # bounds the pilot (agent nodes included). The walltime is the makespan
+    # plus 'margin' of it plus 'overhead' minutes.
+    res = dict(RESOURCE)
+    res.update(dict((k, resource[k]) for k in RESOURCE if resource.get(k) is not None))
+    cpn, gpn, agent = res['cores_per_node'], res['gpus_per_node'], res['agent_nodes']
+
+    pipelines = workload(workflow, duration)
+    fastest = critical_path(pipelines)
+
+    if makespan is not None and makespan < fastest:
+        raise ValueError('target makespan %ss is shorter than the critical path, %ss'%(makespan, fastest))
+
+    # Enough nodes for every pipeline to run its widest stage at once
+    def nodes_of(cores, gpus):
+        return max(int(math.ceil(float(cores)/cpn)) if cpn else 0,
+                   int(math.ceil(float(gpus)/gpn)) if gpn else 0, 1)
+
+    lo = max([nodes_of(c, g) for stages in pipelines for stage in stages for c, g, _ in stage] or [1])
+    hi = sum([max([sum([nodes_of(c, g)*n for (c, g, _), n in stage.items()]) for stage in stages] or [0])
+              for stages in pipelines])
+    hi = max(lo, hi)
+
+    if max_nodes is not None:
+        hi = min(hi, max_nodes - agent)
+        if hi < lo:
+            raise ValueError('the largest task needs %s nodes besides %s for the agent, at most %s allowed'
+                             %(lo, agent, max_nodes))
+
+    target = fastest if makespan is None else makespan
+    best = simulate(pipelines, hi, cpn, gpn)
+
+    if makespan is not None and best[0] > makespan*(1 + 1e-9):
+        raise ValueError('%s nodes take %ss, longer than the target makespan %ss'%(hi + agent, best[0], makespan))
+
+    # Fewer nodes than hi still within the target (or as fast as hi)
+    target = max(target, best[0])
+    nodes = hi
+    while lo < hi:
+        mid = (lo + hi)//2
+        res_mid = simulate(pipelines, mid, cpn, gpn)
+        if res_mid[0] <= target*(1 + 1e-9):
+            nodes, best, hi = mid, res_mid, mid
+        else:
+            lo = mid + 1
+
+    total = nodes + agent
+
+    return {'nodes': total,
+            'cores': total*cpn,
+            'gpus': total*gpn,
+            'walltime': int(math.ceil(best[0]*(1 + margin)/60.0 + overhead)),
+            'makespan': best[0],
+            'critical_path': fastest,
+            'task_cores': best[1],
+            'task_gpus': best[2]}
+
+
+def main(argv=None):
+
+    from workflow.spec import Compiler, load_spec, parse_set
+
+    parser = argparse.ArgumentParser(prog='python -m workflow.planner')
+    parser.add_argument('spec', help='JSON or YAML workflow spec')
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE', help='override a parameter')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds per task')
+    parser.add_argument('--makespan', type=float, default=None, help='target makespan in seconds')
+    parser.add_argument('--cores-per-node', type=int, default=None)
+    parser.add_argument('--gpus-per-node', type=int, default=None)
+    parser.add_argument('--agent-nodes', type=int, default=None)
+    parser.add_argument('--max-nodes', type=int, default=None)
+    parser.add_argument('--margin', type=float, default=0.0, help='walltime beyond the makespan, a fraction of it')
+    parser.add_argument('--overhead', type=float, default=0.0, help='walltime beyond the makespan, in minutes')
+    args = parser.parse_args(argv)
+
+    compiler = Compiler(load_spec(args.spec), parse_set(args.set))
+    resource = compiler.resource()
+    resource.update(dict((k, getattr(args, k)) for k in RESOURCE if getattr(args, k) is not None))
+
+    pilot = plan(compiler.pipelines(), resource, args.duration, args.makespan,
+                 args.max_nodes, args.margin, args.overhead)
+
+    for key in ['nodes', 'cores', 'gpus', 'walltime', 'makespan', 'critical_path', 'task_cores', 'task_gpus']:
+        print('%-14s %s'%(key, pilot[key]))
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,438 @@
+import sys
+import json
+import argparse
+import itertools
+from workflow.bulk import TaskTemplate
+from workflow.intern import Interner
+from workflow.stream import TaskSource, stream_stages
+
+# ------------------------------------------------------------------------------
+# Declarative workflows.
+#
+# A JSON or YAML spec describes the pipelines, stages and tasks, with
+# parameters and sweeps instead of copies of the same building block:
+#
+#   params:   {tasks: 16, sleep: 1}             # defaults, --set key=value
+#   apps:     {sleep: {executable: ['/bin/sleep'], arguments: ['{sleep}'], cores: 1}}
+#   resource: {resource: xsede.supermic, walltime: 60, cores: '{tasks}', ...}
+#   pipelines:
+#     - count: 1                                 # copies of the pipeline
+#       sweep: {...}                             # one pipeline per sweep point
+#       stages:
+#         - count: 1
+#           tasks:
+#             - app: sleep                       # fields of apps.sleep, then
+#               count: '{tasks}'                 # the fields given here
+#               sweep: [{event: A}, {event: B}]
+#
+# A 'sweep' is a list of parameter dicts, a dict of lists (every combination)
+# or {zip: {key: [...], ...}} (the lists side by side). Strings are
+# str.format()ed with the parameters in scope ('{{' for a literal brace); a
+# string that is exactly '{name}' takes the parameter's value as it is (a
+# number, a list). Besides the spec's own parameters there are
+# pipeline_index, stage_index, task_index (running per stage), pipeline_uid,
+# and stage_uids / task_uids of the stages built before in the pipeline, e.g.
+# '$Pipeline_{pipeline_uid}_Stage_{stage_uids[0]}_Task_{task_uids[0][0]}'.
+#
+# Tasks are built from one TaskTemplate per task entry and sweep point, in
+# batches of 'batch' tasks, with the values of all templates interned. With
+# lazy=True a pipeline starts out with its first stage only and every stage
+# adds the next one once it is done (EnTK stage post_exec), so a stage's tasks
+# exist only from the time the stage can run. A stage with 'window: N' then is
+# streamed as stages of N tasks (see stream.py), the entries of such a stage in
+# stage_uids and task_uids are those of its first window.
+#
+#   python -m workflow.spec show exp-5-A-2-4/bin/shapes.yaml --set pipelines=16
+#   python -m workflow.spec run exp-5-A-2-4/bin/shapes.yaml --set pipelines=16
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+# Keys of a pipeline, stage or task entry that are not Task/Stage fields
+META = ('app', 'count', 'sweep', 'params', 'stages', 'tasks', 'batch', 'window')
+
+# Tasks built and added to a stage at a time
+BATCH = 4096
+
+
+def _native(value):
+
+    # json in Python 2 gives unicode strings, the EnTK setters check for str
+    if isinstance(value, dict):
+        return dict((_native(k), _native(v)) for k, v in value.items())
+
+    if isinstance(value, list):
+        return [_native(v) for v in value]
+
+    if string_types is not str and isinstance(value, string_types):
+        try:
+            return str(value)
+        except UnicodeEncodeError:
+            return value
+
+    return value
+
+
+def load_spec(path):
+
+    f = open(path)
+    text = f.read()
+    f.close()
+
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError('YAML specs require the PyYAML package, or write the spec as JSON')
+        spec = yaml.safe_load(text)
+    else:
+        spec = json.loads(text)
+
+    return _native(spec)
+
+
+def substitute(value, params):
+
+    if isinstance(value, string_types):
+        name = value[1:-1]
+        if value[:1] == '{' and value[-1:] == '}' and name in params:
+            return params[name]
+        return value.format(**params)
+
+    if isinstance(value, list):
+        return [substitute(v, params) for v in value]
+
+    if isinstance(value, dict):
+        return dict((k, substitute(v, params)) for k, v in value.items())
+
+    return value
+
+
+def references(value, name):
+
+    # Whether any string in 'value' mentions the parameter 'name'
+    if isinstance(value, string_types):
+        return '{%s'%name in value
+
+    if isinstance(value, list):
+        return any([references(v, name) for v in value])
+
+    if isinstance(value, dict):
+        return any([references(v, name) for v in value.values()])
+
+    return False
+
+
+def sweep_points(sweep, params):
+
+    # The parameter dicts of a sweep
+    sweep = substitute(sweep, params)
+
+    if not sweep:
+        return [dict()]
+
+    if isinstance(sweep, list):
+        return [dict(point) for point in sweep]
+
+    if list(sweep) == ['zip']:
+        keys = sorted(sweep['zip'])
+        lengths = set([len(sweep['zip'][k]) for k in keys])
+        if len(lengths) > 1:
+            raise ValueError('zip sweep over lists of different lengths: %s'%keys)
+        return [dict(zip(keys, values)) for values in zip(*[sweep['zip'][k] for k in keys])]
+
+    keys = sorted(sweep)
+    axes = [sweep[k] if isinstance(sweep[k], list) else [sweep[k]] for k in keys]
+
+    return [dict(zip(keys, values)) for values in itertools.product(*axes)]
+
+
+def _scoped(params, entry, point, **builtins):
+
+    # The entry's params may refer to the sweep point
+    scoped = dict(params)
+    scoped.update(builtins)
+    scoped.update(point)
+    scoped.update(substitute(entry.get('params') or {}, scoped))
+
+    return scoped
+
+
+def _fields(entry):
+
+    return dict((k, v) for k, v in entry.items() if k not in META)
+
+
+def _entk():
+
+    from radical.entk import Pipeline, Stage, Task
+
+    return Pipeline, Stage, Task
+
+
+class Compiler(object):
+
+    def __init__(self, spec, params=None, batch=None, classes=None):
+
+        self.spec = spec
+        self.params = dict(spec.get('params') or {})
+        self.params.update(params or {})
+        self.batch = int(batch or spec.get('batch') or BATCH)
+        self.apps = spec.get('apps') or {}
+        self.interner = Interner()
+
+        self._classes = classes
+
+    @property
+    def classes(self):
+
+        # (Pipeline, Stage, Task), radical.entk unless given
+        if self._classes is None:
+            self._classes = _entk()
+
+        return self._classes
+
+    def pipeline_entries(self):
+
+        # A spec with 'stages' at the top is one pipeline
+        if 'pipelines' in self.spec:
+            return self.spec['pipelines']
+
+        return [{'stages': self.spec.get('stages', [])}]
+
+    def iter_pipeline_points(self):
+
+        # (entry, params) of every pipeline, in order
+        index = 0
+
+        for entry in self.pipeline_entries():
+            for point in sweep_points(entry.get('sweep'), self.params):
+                scoped = _scoped(self.params, entry, point)
+                for _ in range(int(substitute(entry.get('count', 1), scoped))):
+                    yield entry, _scoped(self.params, entry, point, pipeline_index=index)
+                    index += 1
+
+    def iter_stage_points(self, entry, params):
+
+        index = 0
+
+        for stage in entry.get('stages', []):
+            for point in sweep_points(stage.get('sweep'), params):
+                scoped = _scoped(params, stage, point)
+                for _ in range(int(substitute(stage.get('count', 1), scoped))):
+                    yield stage, _scoped(params, stage, point, stage_index=index)
+                    index += 1
+
+    def task_fields(self, entry):
+
+        fields = dict()
+
+        if 'app' in entry:
+            if entry['app'] not in self.apps:
+                raise KeyError('unknown app %s, the spec defines %s'
+                               %(entry['app'], ', '.join(sorted(self.apps)) or 'none'))
+            fields.update(self.apps[entry['app']])
+
+        fields.update(_fields(entry))
+
+        return fields
+
+    def iter_task_batches(self, stage, params):
+
+        # Lists of at most 'batch' tasks of one stage entry
+        Task = self.classes[2]
+        index = 0
+
+        for entry in stage.get('tasks', []):
+
+            fields = self.task_fields(entry)
+
+            # Fields that differ per task go in as per task overrides
+            varying = dict((k, v) for k, v in fields.items() if references(v, 'task_index'))
+            static = dict((k, v) for k, v in fields.items() if k not in varying)
+
+            for point in sweep_points(entry.get('sweep'), params):
+
+                scoped = _scoped(params, entry, point)
+                count = int(substitute(entry.get('count', 1), scoped))
+
+                template = TaskTemplate(Task, **self.interner.intern(substitute(static, scoped)))
+
+                for start in range(0, count, self.batch):
+
+                    size = min(self.batch, count - start)
+                    overrides = dict((k, list()) for k in varying)
+
+                    for i in range(size):
+                        scoped['task_index'] = index + start + i
+                        for k, v in varying.items():
+                            overrides[k].append(substitute(v, scoped))
+
+                    yield template.build(size, **overrides)
+
+                index += count
+
+    def build_stage(self, stage, params, context):
+
+        s = self.classes[1]()
+
+        for attr, value in substitute(_fields(stage), params).items():
+            setattr(s, attr, value)
+
+        uids = list()
+        for tasks in self.iter_task_batches(stage, params):
+            s.add_tasks(tasks)
+            uids.extend([t.uid for t in tasks])
+
+        context['stage_uids'].append(s.uid)
+        context['task_uids'].append(uids)
+
+        return s
+
+    def stream_stage(self, pipeline, stage, params, context, then):
+
+        # Add a stage entry to 'pipeline' window by window, 'then' once done
+        tasks = (t for batch in self.iter_task_batches(stage, params) for t in batch)
+        window = int(substitute(stage['window'], params))
+
+        if stream_stages(pipeline, TaskSource(tasks), window, then, self.classes[1]):
+            first = pipeline.stages[-1]
+            context['stage_uids'].append(first.uid)
+            context['task_uids'].append([t.uid for t in first.tasks])
+        else:
+            context['stage_uids'].append(None)
+            context['task_uids'].append(list())
+
+    def build_pipeline(self, entry, params, lazy=False):
+
+        p = self.classes[0]()
+
+        for attr, value in substitute(_fields(entry), params).items():
+            setattr(p, attr, value)
+
+        context = {'pipeline_uid': p.uid, 'stage_uids': list(), 'task_uids': list()}
+
+        def scoped(stage_params):
+            stage_params = dict(stage_params)
+            stage_params.update(context)
+            return stage_params
+
+        stages = self.iter_stage_points(entry, params)
+
+        if not lazy:
+            for stage, stage_params in stages:
+                p.add_stages(self.build_stage(stage, scoped(stage_params), context))
+            return p
+
+        def add_next():
+            # Build the next stage, and have it add the one after when done
+            for stage, stage_params in stages:
+                if stage.get('window'):
+                    self.stream_stage(p, stage, scoped(stage_params), context, add_next)
+                    break
+                s = self.build_stage(stage, scoped(stage_params), context)
+                s.post_exec = {'condition': lambda: True,
+                               'on_true': add_next,
+                               'on_false': lambda: None}
+                p.add_stages(s)
+                break
+
+        add_next()
+
+        return p
+
+    def pipelines(self, lazy=False):
+
+        return [self.build_pipeline(entry, params, lazy)
+                for entry, params in self.iter_pipeline_points()]
+
+    def resource(self):
+
+        return substitute(self.spec.get('resource') or {}, self.params)
+
+    def describe(self):
+
+        # [(pipeline index, [(stage index, tasks), ...]), ...], without
+        # building anything
+        shape = list()
+
+        for entry, params in self.iter_pipeline_points():
+            stages = list()
+            for stage, stage_params in self.iter_stage_points(entry, params):
+                tasks = 0
+                for task in stage.get('tasks', []):
+                    for point in sweep_points(task.get('sweep'), stage_params):
+                        tasks += int(substitute(task.get('count', 1),
+                                                _scoped(stage_params, task, point)))
+                stages.append((stage_params['stage_index'], tasks))
+            shape.append((params['pipeline_index'], stages))
+
+        return shape
+
+
+def run(compiler, lazy=False):
+
+    # Execute the workflow like the poe.py scripts do
+    from radical.entk import AppManager, ResourceManager
+
+    res_dict = compiler.resource()
+    shared_data = res_dict.pop('shared_data', None)
+
+    rman = ResourceManager(res_dict)
+    if shared_data:
+        rman.shared_data = shared_data
+
+    appman = AppManager()
+    appman.resource_manager = rman
+    appman.assign_workflow(set(compiler.pipelines(lazy)))
+    appman.run()
+
+
+def parse_set(items):
+
+    # ['key=value', ...] -> {key: value}, values as JSON where they parse
+    params = dict()
+
+    for item in items or []:
+        key, _, value = item.partition('=')
+        try:
+            params[key] = _native(json.loads(value))
+        except ValueError:
+            params[key] = value
+
+    return params
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python -m workflow.spec')
+    parser.add_argument('command', choices=['show', 'run'])
+    parser.add_argument('spec', help='JSON or YAML workflow spec')
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE', help='override a parameter')
+    parser.add_argument('--batch', type=int, default=None, help='tasks built at a time')
+    parser.add_argument('--lazy', action='store_true', help='build every stage only once the previous is done')
+    args = parser.parse_args(argv)
+
+    compiler = Compiler(load_spec(args.spec), parse_set(args.set), args.batch)
+
+    if args.command == 'show':
+        total = 0
+        for pipeline, stages in compiler.describe():
+            tasks = sum([count for _, count in stages])
+            total += tasks
+            print('pipeline %s: %s stages, %s tasks (%s)'
+                  %(pipeline, len(stages), tasks, ' '.join([str(count) for _, count in stages])))
+        print('resource: %s'%json.dumps(compiler.resource(), sort_keys=True))
+        print('total: %s tasks'%total)
+        return 0
+
+    run(compiler, args.lazy)
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import threading
+
+# ------------------------------------------------------------------------------
+# Streaming the tasks of a huge stage in bounded windows.
+#
+# Instead of building all tasks before appman.run(), the tasks come from a
+# TaskSource (an iterable or generator of tasks, or a callback returning up to
+# n new tasks) and are added window by window: a stage of the next 'window'
+# tasks is added to the pipeline, and from its post_exec, once it is done, the
+# stage of the window after (EnTK adapts the pipeline while it runs). Only the
+# tasks of the running windows exist, so the first tasks start as soon as the
+# first window is built, and memory for tasks not yet run is bounded by the
+# window, not the ensemble size.
+#
+#   stream_stages(p, from_template(template, 8192), window=512)
+#   pipes_set = set(stream_pipelines(from_template(template, 8192), window=64, lanes=16))
+#
+# Every window of a pipeline waits for the whole previous window, so windows
+# of about the pilot's task slots waste least. stream_pipelines() runs 'lanes'
+# pipelines that take their windows from one source, a lane that finishes its
+# window takes the next one while the others still run, i.e. tasks are created
+# as resources free up.
+
+
+def _entk():
+
+    from radical.entk import Pipeline, Stage
+
+    return Pipeline, Stage
+
+
+class TaskSource(object):
+
+    def __init__(self, tasks):
+
+        # 'tasks' is an iterable of tasks, or a callable that returns a list of
+        # at most n new tasks when called with n, an empty one when done
+        if callable(tasks):
+            self._next = tasks
+        else:
+            tasks = iter(tasks)
+            self._next = lambda n: [t for _, t in zip(range(n), tasks)]
+
+        self.taken = 0
+        self.done = False
+
+        # post_exec of several pipelines may run at the same time
+        self._lock = threading.Lock()
+
+    def take(self, n):
+
+        # The next at most n tasks, [] once the source is exhausted
+        with self._lock:
+
+            if self.done:
+                return list()
+
+            tasks = list(self._next(n))
+            if not tasks:
+                self.done = True
+
+            self.taken += len(tasks)
+
+            return tasks
+
+
+def from_template(template, n, **overrides):
+
+    # A TaskSource of n tasks of a TaskTemplate, built window by window; the
+    # overrides are sequences of n values as for TaskTemplate.build()
+    state = {'start': 0}
+
+    def build(size):
+        start = state['start']
+        size = min(size, n - start)
+        state['start'] = start + size
+        return template.build(size, **dict((attr, values[start:start + size])
+                                           for attr, values in overrides.items()))
+
+    return TaskSource(build)
+
+
+def stream_stages(pipeline, source, window, then=None, stage_class=None):
+
+    # Add the tasks of 'source' to 'pipeline' as stages of 'window' tasks,
+    # each added once the previous one is done. 'then' is called once the
+    # last one is done. Returns the number of tasks of the first window.
+    if not isinstance(source, TaskSource):
+        source = TaskSource(source)
+
+    if stage_class is None:
+        stage_class = _entk()[1]
+
+    def add_window():
+
+        tasks = source.take(window)
+
+        if not tasks:
+            if then is not None:
+                then()
+            return 0
+
+        s = stage_class()
+        s.add_tasks(tasks)
+        s.post_exec = {'condition': lambda: True,
+                       'on_true': add_window,
+                       'on_false': lambda: None}
+        pipeline.add_stages(s)
+
+        return len(tasks)
+
+    return add_window()
+
+
+def stream_pipelines(source, window, lanes, pipeline_class=None, stage_class=None):
+
+    # 'lanes' pipelines streaming the tasks of one source; lanes that get no
+    # first window are left out
+    if not isinstance(source, TaskSource):
+        source = TaskSource(source)
+
+    if pipeline_class is None or stage_class is None:
+        default_pipeline, default_stage = _entk()
+        pipeline_class = pipeline_class or default_pipeline
+        stage_class = stage_class or default_stage
+
+    pipelines = list()
+
+    for _ in range(lanes):
+        p = pipeline_class()
+        if not stream_stages(p, source, window, stage_class=stage_class):
+            break
+        pipelines.append(p)
+
+    return pipelines
@@ -0,0 +1,188 @@
+import os
+import math
+from workflow.planner import plan
+
+# ------------------------------------------------------------------------------
+# workflow.planner against the configurations of experiments.md and the pilot
+# formulas of the poe.py scripts.
+#
+#   python -m pytest workflow/test_planner.py
+#   python -m workflow.test_planner
+
+EXPERIMENTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'experiments.md')
+
+SUPERMIC = {'cores_per_node': 20}
+
+# Titan as the gpu branch of EnTK counts it, one cpu and one gpu per node
+TITAN = {'cores_per_node': 1, 'gpus_per_node': 1}
+
+# Seconds per mdrun task of exp-5-B-2 and per forward simulation (384 gpus)
+MDRUN = 5*60
+SPECFEM = 3*60
+
+# Seismic runs without a node for the agent
+NO_AGENT = [6144, 12288]
+
+
+class Task(object):
+
+    # What the planner reads of an EnTK task
+    def __init__(self, cores=1, cpu_reqs=None, gpu_reqs=None, executable='/bin/sleep'):
+
+        self.uid = 'task'
+        self.cores = cores
+        self.cpu_reqs = cpu_reqs
+        self.gpu_reqs = gpu_reqs
+        self.executable = [executable]
+
+
+class Stage(object):
+
+    def __init__(self, tasks):
+
+        self.tasks = set(tasks)
+
+
+class Pipeline(object):
+
+    def __init__(self, stages):
+
+        self.stages = stages
+
+
+def tables(path=EXPERIMENTS):
+
+    # {title: [[int cell, ...], ...]} of the markdown tables
+    found = dict()
+    title = None
+
+    for line in open(path):
+        line = line.strip()
+        if line.endswith(':') and not line.startswith('*'):
+            title = line[:-1]
+        elif line.startswith('|') and title is not None:
+            cells = [cell.strip() for cell in line.strip('|').split('|')]
+            if all([cell.isdigit() for cell in cells]):
+                found.setdefault(title, list()).append([int(cell) for cell in cells])
+
+    return found
+
+
+def specfem(tasks):
+
+    # fwd_sims.py: tasks of 384 gpus and no cpus
+    gpu_reqs = {'processes': 384, 'process_type': 'MPI', 'threads_per_process': 1, 'thread_type': 'OpenMP'}
+    cpu_reqs = {'processes': 0, 'process_type': 'MPI', 'threads_per_process': 0, 'thread_type': 'OpenMP'}
+
+    return Pipeline([Stage([Task(cpu_reqs=cpu_reqs, gpu_reqs=gpu_reqs, executable='./bin/xspecfem3D')
+                            for _ in range(tasks)])])
+
+
+def test_weak_scaling():
+
+    rows = tables()['Weak scaling']
+    assert rows
+
+    for tasks, cores, walltime, _ in rows:
+
+        # One-core mdrun tasks of about 5 minutes on SuperMIC (exp-5-B-2)
+        p = Pipeline([Stage([Task() for _ in range(tasks)])])
+        pilot = plan([p], SUPERMIC, duration=MDRUN)
+
+        # All tasks at once, within the 60 minutes the runs asked for
+        assert pilot['task_cores'] == cores
+        assert pilot['makespan'] == MDRUN
+        assert pilot['walltime'] == MDRUN//60 <= walltime
+
+        # ceil(tasks/cores_per_node)*cores_per_node + cores_per_node of exp-5-B-2
+        assert pilot['cores'] == int(math.ceil(tasks/20.0))*20 + 20
+
+        # Half the nodes run the tasks in two rounds
+        nodes = int(math.ceil(tasks/40.0))
+        half = plan([p], SUPERMIC, duration=MDRUN, max_nodes=nodes + 1)
+        assert (half['cores'], half['task_cores'], half['makespan']) == ((nodes + 1)*20, nodes*20, 2*MDRUN)
+
+
+def test_seismic_inversion():
+
+    rows = tables()['Seismic Inversion']
+    assert rows
+
+    for tasks, nodes, walltime, _ in rows:
+
+        resource = dict(TITAN, agent_nodes=0 if nodes in NO_AGENT else 1)
+        concurrent = (nodes - resource['agent_nodes'])//384
+
+        # Walltime for the pilot of the run
+        pilot = plan([specfem(tasks)], resource, duration=SPECFEM, max_nodes=nodes)
+        assert pilot['walltime'] == int(math.ceil(float(tasks)/concurrent))*SPECFEM//60 == walltime
+        assert pilot['nodes'] == resource['agent_nodes'] + 384*min(tasks, concurrent)
+
+        # Smallest pilot for the walltime of the run
+        pilot = plan([specfem(tasks)], resource, duration={'./bin/xspecfem3D': SPECFEM},
+                     makespan=walltime*60)
+        assert (pilot['nodes'], pilot['gpus'], pilot['walltime']) == (nodes, nodes, walltime)
+
+        # One node fewer takes another round
+        try:
+            plan([specfem(tasks)], resource, duration=SPECFEM, max_nodes=nodes - 1, makespan=walltime*60)
+        except ValueError:
+            pass
+        else:
+            assert False, '%s tasks on %s nodes within %s minutes'%(tasks, nodes - 1, walltime)
+
+
+def test_fwd_sims():
+
+    # One event of 8 minutes at a time on 385 nodes, formerly 8*num_events
+    for events in [1, 4, 16, 40]:
+        pilot = plan([specfem(events)], dict(TITAN, agent_nodes=1), duration=8*60, max_nodes=385)
+        assert (pilot['cores'], pilot['gpus'], pilot['walltime']) == (385, 385, 8*events)
+
+
+def test_exp_5_A_2_5():
+
+    # grompp, then 16 mdrun tasks of num_cores cores
+    for num_cores in [1, 2, 4, 5, 8, 10, 16, 20, 32, 64]:
+
+        p = Pipeline([Stage([Task()]), Stage([Task(cores=num_cores) for _ in range(16)])])
+        pilot = plan([p], SUPERMIC)['cores']
+
+        formula = int(math.ceil(16.0*num_cores/20))*20 + 20
+
+        if num_cores < 20 and 20 % num_cores:
+            # Tasks that do not fill a node run on nodes of their own
+            assert pilot == int(math.ceil(16.0/(20//num_cores)))*20 + 20
+        else:
+            assert pilot == formula
+
+    p = Pipeline([Stage([Task()]), Stage([Task(cores=16) for _ in range(16)])])
+    assert plan([p], SUPERMIC)['cores'] == 340
+
+
+def test_target_makespan():
+
+    # 6 then 3 tasks of 16 cores on 16 core nodes, 100 seconds each
+    p = Pipeline([Stage([Task(cpu_reqs={'process': 16}) for _ in range(6)]),
+                  Stage([Task(cpu_reqs={'process': 16}) for _ in range(3)])])
+
+    fastest = plan([p], {'cores_per_node': 16}, duration=100)
+    assert (fastest['nodes'], fastest['makespan']) == (7, 200)
+
+    slower = plan([p], {'cores_per_node': 16}, duration=100, makespan=300)
+    assert (slower['nodes'], slower['makespan']) == (4, 300)
+
+    try:
+        plan([p], {'cores_per_node': 16}, duration=100, makespan=150)
+    except ValueError:
+        pass
+    else:
+        assert False, 'a makespan below the critical path is accepted'
+
+
+if __name__ == '__main__':
+
+    for test in [test_weak_scaling, test_seismic_inversion, test_fwd_sims, test_exp_5_A_2_5,
+                 test_target_makespan]:
+        test()
+        print('%s ok'%test.__name__)